@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""番劇頁面解析的一致性檢查及效能測試腳本。
+
+對保存下來的 ``animeVideo.php`` 頁面，分別以完整解析（html.parser）及
+``parse_series_page`` 解析，比較標題、當前集數及劇集列表是否一致，並輸出每頁平均
+解析時間。
+
+用法（於專案根目錄執行）:
+    python -m scripts.benchmark_page_parser page1.html page2.html [-n 20]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from src.backend.page_parser import PARSER, parse_series_page
+
+
+def extract(soup: BeautifulSoup) -> dict:
+    """提取 Anime 解析時使用的欄位。"""
+    anime_name = soup.find("div", "anime_name")
+    playing = soup.find("li", "playing")
+    season = soup.find("section", "season")
+    return {
+        "title": anime_name.h1.string if anime_name and anime_name.h1 else None,
+        "playing": playing.a.string if playing and playing.a else None,
+        "episodes": (
+            [(a.get("href"), a.string) for a in season.find_all("a")]
+            if season
+            else []
+        ),
+        "labels": (
+            [p.contents[0] if p.contents else None for p in season.find_all("p")]
+            if season
+            else []
+        ),
+    }
+
+
+def measure(func, content: bytes, rounds: int) -> float:
+    """返回每次解析的平均毫秒數。"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(content)
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def main() -> int:
+    """執行檢查及效能測試。"""
+    parser = argparse.ArgumentParser(description="番劇頁面解析一致性及效能測試")
+    parser.add_argument("pages", nargs="+", type=Path, help="保存的頁面 HTML 檔案")
+    parser.add_argument("-n", "--rounds", type=int, default=20, help="每頁解析次數")
+    args = parser.parse_args()
+
+    print(f"解析器: {PARSER}")
+    mismatched = 0
+    for page in args.pages:
+        content = page.read_bytes()
+        expected = extract(BeautifulSoup(content, "html.parser"))
+        actual = extract(parse_series_page(content))
+        if expected == actual:
+            print(f"✓ {page.name}: 一致 ({len(expected['episodes'])} 集)")
+        else:
+            mismatched += 1
+            print(f"✗ {page.name}: 不一致")
+            for key in expected:
+                if expected[key] != actual[key]:
+                    print(f"    {key}: {expected[key]!r} != {actual[key]!r}")
+
+        full = measure(lambda c: BeautifulSoup(c, "html.parser"), content, args.rounds)
+        fast = measure(parse_series_page, content, args.rounds)
+        print(
+            f"    完整解析 {full:.2f} ms, 片段解析 {fast:.2f} ms, "
+            f"加速 {full / fast if fast else 0:.1f}x"
+        )
+
+    return 1 if mismatched else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
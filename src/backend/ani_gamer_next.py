@@ -11,13 +11,16 @@ import sys
 import threading
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
-import httpx
-
-from . import config
-from .anime import Anime, TryTooManyTimeError
+from . import config, events, metrics, progress
+from .anime import Anime, AnimeError, TryTooManyTimeError
 from .color_print import err_print
 from .danmu import Danmu
+from .database import AnimeDatabase
+from .pipeline import get_finalize_stage, get_upload_stage
+from .scheduler import Delay, TaskPriority, get_task_scheduler
+from .transport import create_client
 
 
 def port_is_available(port):
@@ -40,8 +43,11 @@ def gost_port():
     return random_port
 
 
-def build_anime(sn):
+def build_anime(sn, use_series_cache=False, update_check=False):
+    # use_series_cache: 同一番剧的其他剧集可直接由番剧信息快取建立, 不请求页面
+    # update_check: 仅用于检查更新, 可按设定以 APP API 获取剧集列表
     cfg = config.get_config()
+    mobile_metadata = update_check and cfg.update_check_use_mobile_api
     anime = {"anime": None, "failed": True}
     try:
         if settings.use_gost:  # use_gost 是運行時計算的
@@ -52,17 +58,28 @@ def build_anime(sn):
                 port: int = _gost_port_fn()
             else:
                 port = 34173  # 默認端口
-            anime["anime"] = Anime(sn, gost_port=port)
+            anime["anime"] = Anime(
+                sn,
+                gost_port=port,
+                page_cache=anime_db,
+                use_series_cache=use_series_cache,
+                mobile_metadata=mobile_metadata,
+            )
         else:
-            anime["anime"] = Anime(sn)
+            anime["anime"] = Anime(
+                sn,
+                page_cache=anime_db,
+                use_series_cache=use_series_cache,
+                mobile_metadata=mobile_metadata,
+            )
         anime["failed"] = False
 
         if danmu:
             anime["anime"].enable_danmu()
 
-    except TryTooManyTimeError:
+    except (TryTooManyTimeError, AnimeError):
         err_print(sn, "抓取失敗", "影片信息抓取失敗!", status=1)
-    except BaseException as e:
+    except Exception as e:
         err_print(sn, "抓取失敗", "抓取影片信息時發生未知錯誤: " + str(e), status=1)
         err_print(
             sn,
@@ -72,104 +89,38 @@ def build_anime(sn):
             display=False,
         )
 
-    # sn 解析冷却
-    if cfg.parse_sn_cd > 0:
-        err_print(
-            "更新資訊",
-            f"SN 解析冷卻 {cfg.parse_sn_cd} 秒",
-            no_sn=True,
-        )
-        time.sleep(cfg.parse_sn_cd)
-
     return anime
 
 
 def read_db_all():
-    db_locker.acquire()
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    cursor.execute("select * FROM anime")
-
-    try:
-        values = cursor.fetchall()
-    except IndexError as e:
-        cursor.close()
-        conn.close()
-        db_locker.release()
-        raise e
-
-    anime_db = [0] * len(values)
-    for i in range(len(values)):
-        anime_db[i] = {
-            "sn": values[i][0],
-            "title": values[i][1],
-            "anime_name": values[i][2],
-            "episode": values[i][3],
-            "status": values[i][4],
-            "remote_status": values[i][5],
-            "resolution": values[i][6],
-            "file_size": values[i][7],
-            "local_file_path": values[i][8],
-        }
-
-    cursor.close()
-    conn.close()
-    db_locker.release()
-    return anime_db
+    return anime_db.read_all()
 
 
 def read_db(sn):
-    db_locker.acquire()
-    # 传入sn(int)，读取该 sn 资料，返回 dict
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    # 传入sn(int)，读取该 sn 资料，返回 dict, 不存在时抛出 IndexError
+    return anime_db.read(sn)
 
-    cursor.execute("select * FROM anime WHERE sn=:sn", {"sn": sn})
 
-    try:
-        values = cursor.fetchall()[0]
-    except IndexError as e:
-        cursor.close()
-        conn.close()
-        db_locker.release()
-        raise e
-    anime_db = {
-        "sn": values[0],
-        "title": values[1],
-        "anime_name": values[2],
-        "episode": values[3],
-        "status": values[4],
-        "remote_status": values[5],
-        "resolution": values[6],
-        "file_size": values[7],
-        "local_file_path": values[8],
-    }
+def read_db_many(sn_list):
+    # 批量读取, 返回 {sn: dict}, 不存在的 sn 不在结果中
+    return anime_db.read_many(sn_list)
 
-    cursor.close()
-    conn.close()
-    db_locker.release()
-    return anime_db
 
-
-def insert_db(anime):
-    db_locker.acquire()
-    # 向数据库插入新资料
-    anime_dict = {
+def __anime_record(anime):
+    return {
         "sn": str(anime.get_sn()),
         "title": anime.get_title(),
         "anime_name": anime.get_bangumi_name(),
         "episode": anime.get_episode(),
     }
 
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+
+def insert_db(anime):
+    # 向数据库插入新资料
+    anime_dict = __anime_record(anime)
 
     try:
-        cursor.execute(
-            "INSERT INTO anime (sn, title, anime_name, episode) VALUES (:sn, :title, :anime_name, :episode)",
-            anime_dict,
-        )
+        anime_db.insert(anime_dict)
     except sqlite3.IntegrityError as e:
         err_print(
             anime_dict["sn"],
@@ -178,14 +129,22 @@ def insert_db(anime):
             status=1,
         )
 
-    cursor.close()
-    conn.commit()
-    conn.close()
-    db_locker.release()
+
+def insert_db_many(anime_list):
+    # 在同一事务中插入多条新资料
+    records = [__anime_record(anime) for anime in anime_list]
+    inserted = anime_db.insert_many(records)
+    if inserted < len(records):
+        err_print(
+            0,
+            "ＤＢ错误",
+            f"{len(records) - inserted} 条数据已存在, 已略过",
+            status=1,
+            no_sn=True,
+        )
 
 
 def update_db(anime):
-    db_locker.acquire()
     # 更新数据库 status, resolution, file_size 资料
     anime_dict = {}
     if anime.video_size > 5:
@@ -207,41 +166,46 @@ def update_db(anime):
     anime_dict["resolution"] = anime.video_resolution
     anime_dict["local_file_path"] = anime.local_video_path
 
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    anime_db.update(anime_dict)
 
+
+def update_db_stats(anime):
+    # 记录下载耗时, 文件字节数, 分段数, 并清除失败原因
     try:
-        cursor.execute(
-            "UPDATE anime SET status=:status,"
-            "remote_status=:remote_status,"
-            "resolution=:resolution,"
-            "file_size=:file_size,"
-            "local_file_path=:local_file_path WHERE sn=:sn",
-            anime_dict,
-        )
-    except IndexError as e:
-        cursor.close()
-        conn.commit()
-        conn.close()
-        db_locker.release()
-        raise e
+        download_bytes = os.path.getsize(anime.local_video_path)
+    except OSError:
+        download_bytes = 0
+    anime_db.update_stats(
+        anime.get_sn(), anime.download_duration, download_bytes, anime.chunk_count
+    )
 
-    cursor.close()
-    conn.commit()
-    conn.close()
-    db_locker.release()
 
+def __db_title_synthesized(anime_in_db):
+    # 记录标题是否可能由番剧信息快取按 "番剧名 [集数]" 拼成
+    return (
+        anime_in_db["title"]
+        == f"{anime_in_db['anime_name']} [{anime_in_db['episode']}]"
+    )
+
+
+def update_db_title(anime):
+    # 以页面上的实际标题更新记录, 由番剧信息快取建立的记录标题是按集数拼成的
+    anime_db.update_title(__anime_record(anime))
 
-def worker(sn, sn_info, realtime_show_file_size=False):
-    cfg = config.get_config()
-    bangumi_tag = sn_info["tag"]
-    rename = sn_info["rename"]
 
-    def upload_quit():
-        queue.pop(sn)
-        processing_queue.remove(sn)
-        upload_limiter.release()  # 并发上传限制器
-        sys.exit(0)
+def update_db_error(sn, error):
+    # 记录最近一次失败原因
+    anime_db.update_error(sn, error)
+
+
+def worker(task, realtime_show_file_size=False):
+    # 自动任务的下载阶段, 由调度器执行; 返回 False 表示失败, 调度器将按退避时间重试
+    # 下载冷却及广告等待期间返回 Delay, 交还工作线程
+    # 分段下载完成后交由合并阶段, 再由上传阶段上传及推送通知, 不占用下载并发数
+    cfg = config.get_config()
+    sn = task.sn
+    bangumi_tag = task.info["tag"]
+    rename = task.info["rename"]
 
     anime_in_db = read_db(sn)
     # 如果用户设定要上传且已经下载好了但还没有上传成功, 那么仅上传
@@ -250,81 +214,39 @@ def worker(sn, sn_info, realtime_show_file_size=False):
         and anime_in_db["status"] == 1
         and anime_in_db["remote_status"] == 0
     ):
-        upload_limiter.acquire()  # 并发上传限制器
-        anime = build_anime(sn)
-        if anime["failed"]:
-            err_print(sn, "任务失敗", "從任務列隊中移除, 等待下次更新重試.", status=1)
-            upload_quit()
-
-        # 视频信息抓取成功
-        anime = anime["anime"]
-        if not os.path.exists(anime_in_db["local_file_path"]):
-            # 如果数据库中记录的文件路径已失效
-            update_db(anime)
-            err_msg_detail = (
-                'title="'
-                + anime.get_title()
-                + '" 本地文件丢失, 從任務列隊中移除, 等待下次更新重試.'
-            )
-            err_print(sn, "上传失敗", err_msg_detail, status=1)
-            upload_quit()
-
-        anime.local_video_path = anime_in_db["local_file_path"]  # 告知文件位置
-        anime.video_size = anime_in_db["file_size"]  # 通過 update_db() 下载状态检查
-        anime.video_resolution = anime_in_db["resolution"]  # 避免更新时把分辨率变成0
-
-        try:
-            if not anime.upload(bangumi_tag):  # 如果上传失败
-                err_msg_detail = (
-                    'title="'
-                    + anime.get_title()
-                    + '" 從任務列隊中移除, 等待下次更新重試.'
-                )
-                err_print(sn, "上传失敗", err_msg_detail, status=1)
-            else:
-                update_db(anime)
-                err_print(sn, "任務完成", status=2)
-        except BaseException as e:
-            err_msg_detail = (
-                'title="'
-                + anime.get_title()
-                + '" 發生未知錯誤, 等待下次更新重試: '
-                + str(e)
-            )
-            err_print(
-                sn,
-                "上傳失敗",
-                "異常詳情:\n" + traceback.format_exc(),
-                status=1,
-                display=False,
-            )
-            err_print(sn, "上傳失敗", err_msg_detail, status=1)
-
-        upload_quit()
+        if not get_upload_stage().put(
+            sn, lambda: __upload_only(sn, anime_in_db, bangumi_tag), block=False
+        ):
+            err_print(sn, "上傳狀態", "上傳列隊已滿, 等待下次更新重試", status=1)
+        return True
 
     # =====下载模块 =====
-    thread_limiter.acquire()  # 并发下载限制器
-    anime = build_anime(sn)
-
-    if anime["failed"]:
-        queue.pop(sn)
-        processing_queue.remove(sn)
-        thread_limiter.release()
+    anime = __resume_anime(task)
+    if anime is None:
         err_print(sn, "任务失敗", "從任務列隊中移除, 等待下次更新重試.", status=1)
-        sys.exit(1)
-
-    anime = anime["anime"]
+        return False
+    if (
+        __db_title_synthesized(anime_in_db)
+        and anime_in_db["title"] != anime.get_title()
+    ):
+        update_db_title(anime)
 
     try:
+        delay = __defer_for_playback(task, anime)
+        if delay is not None:
+            return delay
         anime.download(
             cfg.download_resolution,
             bangumi_tag=bangumi_tag,
             rename=rename,
             realtime_show_file_size=realtime_show_file_size,
             classify=cfg.classify_bangumi,
+            defer_finalize=True,
         )
-    except BaseException as e:
+    except Exception as e:
         # 兜一下各种奇奇怪怪的错误
+        task.context.pop("anime", None)
+        events.emit("download_error", sn, error=e)
         err_print(sn, "下載異常", "發生未知錯誤: " + str(e), status=1)
         err_print(
             sn,
@@ -334,35 +256,72 @@ def worker(sn, sn_info, realtime_show_file_size=False):
             display=False,
         )
         anime.video_size = 0
+        anime.last_error = str(e)
 
-    if anime.video_size < 5:
+    if not anime.needs_finalize() and anime.video_size < 5:
         # 下载失败
-        queue.pop(sn)
-        processing_queue.remove(sn)
-        thread_limiter.release()
-        err_msg_detail = (
-            'title="' + anime.get_title() + '" 從任務列隊中移除, 等待下次更新重試.'
+        events.emit(
+            "download_failed",
+            sn,
+            error=anime.last_error or "下載失敗",
+            will_retry=task.will_retry,
         )
-        err_print(sn, "任务失敗", err_msg_detail, status=1)
-        if int(sn) in config.tasks_progress_rate.keys():
-            # 記錄失敗的任務
-            filename = config.tasks_progress_rate[int(sn)].get("filename", f"SN: {sn}")
-            config.record_completed_task(int(sn), filename, "failed")
-            del config.tasks_progress_rate[int(sn)]  # 任务失败, 不在监控此任务进度
-        sys.exit(1)
+        update_db_error(sn, anime.last_error or "下載失敗")
+        __report_failure(sn, anime.get_title(), task.will_retry)
+        return False
 
-    update_db(anime)  # 下载完成后, 更新数据库
-    download_cd = threading.Thread(target=download_cd_counter)
-    download_cd.start()
+    # 合并列队已满时在此等待, 避免未合并的分段占满磁盘
+    get_finalize_stage().put(sn, lambda: __finalize_stage(anime, bangumi_tag))
     # =====下载模块结束 =====
+    return True
+
+
+def __finalize_stage(anime, bangumi_tag):
+    # 合并阶段: 合并分段, 更新数据库, 之后交由上传阶段
+    sn = anime.get_sn()
+    try:
+        succeed = anime.finalize()
+    except Exception as e:
+        err_print(sn, "合并異常", "發生未知錯誤: " + str(e), status=1)
+        err_print(
+            sn,
+            "合并異常",
+            "異常詳情:\n" + traceback.format_exc(),
+            status=1,
+            display=False,
+        )
+        succeed = False
+        anime.last_error = str(e)
+
+    if not succeed or anime.video_size < 5:
+        events.emit("merge_failed", sn, error=anime.last_error or "合并失敗")
+        update_db_error(sn, anime.last_error or "合并失敗")
+        __report_failure(sn, anime.get_title(), False)
+        return
+
+    update_db(anime)  # 下载完成后, 更新数据库
+    update_db_stats(anime)
+
+    cfg = config.get_config()
+    if not get_upload_stage().put(
+        sn, lambda: __upload_stage(anime, bangumi_tag), block=not cfg.upload_to_server
+    ):
+        # 上传缓慢时不阻塞合并及下载, 数据库中 remote_status=0, 下次检查更新时仅上传
+        err_print(sn, "上傳狀態", "上傳列隊已滿, 等待下次更新重試", status=1)
+        anime.notify()
+
+
+def __upload_stage(anime, bangumi_tag):
+    # 上传阶段: 推送通知并上传至服务器
+    cfg = config.get_config()
+    sn = anime.get_sn()
+    anime.notify()
 
     # =====上传模块=====
     if cfg.upload_to_server:
-        upload_limiter.acquire()  # 并发上传限制器
-
         try:
             anime.upload(bangumi_tag)  # 上传至服务器
-        except BaseException as e:
+        except Exception as e:
             # 兜一下各种奇奇怪怪的错误
             err_print(
                 sn,
@@ -377,165 +336,293 @@ def worker(sn, sn_info, realtime_show_file_size=False):
                 status=1,
                 display=False,
             )
-            upload_quit()
-
-        update_db(anime)  # 上传完成后, 更新数据库
-        upload_limiter.release()  # 并发上传限制器
+        else:
+            update_db(anime)  # 上传完成后, 更新数据库
     # =====上传模块结束=====
 
-    download_cd.join()
-    queue.pop(sn)  # 从任务列队中移除
-    processing_queue.remove(sn)  # 从当前任务列队中移除
     err_print(sn, "任務完成", status=2)
 
 
-def download_cd_counter():
-    cfg = config.get_config()
-    seconds = cfg.download_cd
-    while seconds > 0:
+def __resume_anime(task):
+    # 取回暂停前的 Anime, 首次执行时建立并在面板显示为执行中; 解析失败返回 None
+    anime = task.context.get("anime")
+    if anime is not None:
+        return anime
+
+    anime = build_anime(task.sn)
+    if anime["failed"]:
+        return None
+    anime = anime["anime"]
+    progress.start_task(task.sn, f"《{anime.get_title()}》", "正在解析")
+    return anime
+
+
+def __defer_for_playback(task, anime):
+    # 推进下载冷却及广告等待, 需要等待时保存 anime 并返回 Delay, 等待期间不占用工作线程
+    wait = anime.prepare_playback()
+    if wait > 0:
+        task.context["anime"] = anime
+        return Delay(wait)
+    task.context.pop("anime", None)  # 重试时重新建立
+    return None
+
+
+def __upload_only(sn, anime_in_db, bangumi_tag):
+    # 仅上传所需信息均来自数据库, 无需请求页面
+    anime = Anime.from_db_row(anime_in_db, gost_port=gost_port)
+    if not os.path.exists(anime_in_db["local_file_path"]):
+        # 如果数据库中记录的文件路径已失效
+        update_db(anime)
+        err_msg_detail = (
+            'title="'
+            + anime.get_title()
+            + '" 本地文件丢失, 從任務列隊中移除, 等待下次更新重試.'
+        )
+        err_print(sn, "上传失敗", err_msg_detail, status=1)
+        return True  # 已标记为未下载, 由下次检查更新重新下载
+
+    anime.local_video_path = anime_in_db["local_file_path"]  # 告知文件位置
+    anime.video_size = anime_in_db["file_size"]  # 通過 update_db() 下载状态检查
+    anime.video_resolution = anime_in_db["resolution"]  # 避免更新时把分辨率变成0
+
+    try:
+        if not anime.upload(bangumi_tag):  # 如果上传失败
+            err_msg_detail = (
+                'title="' + anime.get_title() + '" 從任務列隊中移除, 等待下次更新重試.'
+            )
+            err_print(sn, "上传失敗", err_msg_detail, status=1)
+            return False
+        update_db(anime)
+        err_print(sn, "任務完成", status=2)
+        return True
+    except Exception as e:
+        err_msg_detail = (
+            'title="'
+            + anime.get_title()
+            + '" 發生未知錯誤, 等待下次更新重試: '
+            + str(e)
+        )
         err_print(
-            "",
-            "下載冷卻:",
-            "下載冷卻時間剩餘 " + str(seconds) + " 秒",
-            status=0,
-            no_sn=True,
+            sn,
+            "上傳失敗",
+            "異常詳情:\n" + traceback.format_exc(),
+            status=1,
+            display=False,
         )
-        wait_time = min(30, seconds)
-        time.sleep(wait_time)
-        seconds -= wait_time
-    thread_limiter.release()  # 并发下载限制器
+        err_print(sn, "上傳失敗", err_msg_detail, status=1)
+        return False
 
 
-def check_tasks():
+def __report_failure(sn, title, will_retry):
+    # 下载失败时更新面板: 还会重试则标记状态, 否则记录为失败任务
+    if will_retry:
+        err_print(
+            sn,
+            "任務失敗",
+            'title="' + title + '" 稍後自動重試',
+            status=1,
+        )
+        progress.update_task(sn, status="失敗! 等待重試")
+        return
+
+    err_print(
+        sn, "任务失敗", 'title="' + title + '" 從任務列隊中移除, 等待下次更新重試.', status=1
+    )
+    # 記錄失敗的任務, 不在监控此任务进度
+    progress.finish_task(sn, "failed")
+
+
+def submit_worker(sn, sn_info, realtime_show_file_size=False):
+    # 将自动任务加入调度器, 该 sn 已在列队中时返回 None
     cfg = config.get_config()
-    for sn in sn_dict.keys():
-        anime = build_anime(sn)
-        if anime["failed"]:
-            err_print(sn, "更新狀態", "檢查更新失敗, 跳過等待下次檢查", status=1)
-            # # sn 解析冷却
-            # if cfg.parse_sn_cd > 0:
-            #     err_print("更新資訊", "SN 解析冷卻 " + str(cfg.parse_sn_cd) + " 秒", no_sn=True)
-            #     time.sleep(cfg.parse_sn_cd)
-            continue
-        anime = anime["anime"]
-        err_print(sn, "更新資訊", "正在檢查《" + anime.get_bangumi_name() + "》")
-        episode_list = list(anime.get_episode_list().values())
-
-        if sn_dict[sn]["mode"] == "all":
-            # 如果用户选择全部下载 download_mode = 'all'
-            for ep in episode_list:  # 遍历剧集列表
-                try:
-                    db = read_db(ep)
-                    #           未下载的   或                设定要上传但是没上传的                         并且  还没在列队中
-                    if (
-                        db["status"] == 0
-                        or (db["remote_status"] == 0 and cfg.upload_to_server)
-                    ) and ep not in queue.keys():
-                        queue[ep] = sn_dict[sn]  # 添加至下载列队
-                except IndexError:
-                    # 如果数据库中尚不存在此条记录
-                    if anime.get_sn() == ep:
-                        new_anime = anime  # 如果是本身则不用重复创建实例
-                    else:
-                        new_anime = build_anime(ep)
-                        if new_anime["failed"]:
-                            err_print(
-                                ep,
-                                "更新狀態",
-                                "更新數據失敗, 跳過等待下次檢查",
-                                status=1,
-                            )
-                            continue
-                        new_anime = new_anime["anime"]
-                    insert_db(new_anime)
-                    queue[ep] = sn_dict[sn]  # 添加至列队
-        else:
-            if sn_dict[sn]["mode"] == "largest-sn":
-                # 如果用户选择仅下载最新上传, download_mode = 'largest_sn', 则对 sn 进行排序
-                episode_list.sort()
-                latest_sn = episode_list[-1]
-                # 否则用户选择仅下载最后剧集, download_mode = 'latest', 即下载网页上显示在最右的剧集
-            elif sn_dict[sn]["mode"] == "single":
-                latest_sn = sn  # 适配命令行 sn-list 模式
+    return scheduler.submit(
+        sn,
+        lambda task: worker(task, realtime_show_file_size),
+        priority=TaskPriority.AUTO,
+        info=sn_info,
+        max_retries=cfg.task_max_retry,
+    )
+
+
+def submit_manual(sn, func, mode="single", filename=""):
+    # 将手动任务加入调度器, 优先于自动任务执行
+    cfg = config.get_config()
+    if not filename:
+        try:
+            filename = __display_name(sn, read_db(sn))
+        except IndexError:
+            filename = __display_name(sn)
+    return scheduler.submit(
+        sn,
+        func,
+        priority=TaskPriority.MANUAL,
+        info={"mode": mode, "filename": filename},
+        max_retries=cfg.task_max_retry,
+    )
+
+
+def __display_name(sn, db_record=None):
+    # 面板等待列队中显示的名称, 在加入列队时确定, 避免面板逐个查询数据库
+    if db_record is not None and db_record["anime_name"]:
+        return f"《{db_record['anime_name']}》- {db_record['episode']}"
+    return f"SN: {sn}"
+
+
+def __check_series(sn):
+    # 检查单部番剧的更新, 返回需要加入列队的 sn 列表
+    cfg = config.get_config()
+    anime = build_anime(sn, update_check=True)
+    if anime["failed"]:
+        err_print(sn, "更新狀態", "檢查更新失敗, 跳過等待下次檢查", status=1)
+        return []
+    anime = anime["anime"]
+    err_print(sn, "更新資訊", "正在檢查《" + anime.get_bangumi_name() + "》")
+    episode_list = list(anime.get_episode_list().values())
+    pending = []
+
+    if sn_dict[sn]["mode"] == "all":
+        # 如果用户选择全部下载 download_mode = 'all'
+        db_records = read_db_many(episode_list)  # 一次查询整部番剧
+        new_animes = {}
+        for ep in episode_list:  # 遍历剧集列表
+            db = db_records.get(int(ep))
+            if db is not None:
+                #           未下载的   或                设定要上传但是没上传的
+                if db["status"] == 0 or (
+                    db["remote_status"] == 0 and cfg.upload_to_server
+                ):
+                    pending.append(ep)  # 添加至下载列队
             else:
-                latest_sn = episode_list[-1]
-            try:
-                db = read_db(latest_sn)
-                #           未下载的   或                设定要上传但是没上传的                         并且  还没在列队中
-                if (
-                    db["status"] == 0
-                    or (db["remote_status"] == 0 and cfg.upload_to_server)
-                ) and latest_sn not in queue.keys():
-                    queue[latest_sn] = sn_dict[sn]  # 添加至下载列队
-            except IndexError:
                 # 如果数据库中尚不存在此条记录
-                if anime.get_sn() == latest_sn:
+                if anime.get_sn() == ep:
                     new_anime = anime  # 如果是本身则不用重复创建实例
                 else:
-                    new_anime = build_anime(latest_sn)
+                    new_anime = build_anime(
+                        ep, use_series_cache=True, update_check=True
+                    )
                     if new_anime["failed"]:
                         err_print(
-                            latest_sn,
+                            ep,
                             "更新狀態",
                             "更新數據失敗, 跳過等待下次檢查",
                             status=1,
                         )
                         continue
                     new_anime = new_anime["anime"]
-                insert_db(new_anime)
-                queue[latest_sn] = sn_dict[sn]
+                new_animes[ep] = new_anime
+
+        # 新剧集在同一事务中写入, 写入后再加入列队
+        insert_db_many(list(new_animes.values()))
+        pending.extend(new_animes)
+    else:
+        if sn_dict[sn]["mode"] == "largest-sn":
+            # 如果用户选择仅下载最新上传, download_mode = 'largest_sn', 则对 sn 进行排序
+            episode_list.sort()
+            latest_sn = episode_list[-1]
+            # 否则用户选择仅下载最后剧集, download_mode = 'latest', 即下载网页上显示在最右的剧集
+        elif sn_dict[sn]["mode"] == "single":
+            latest_sn = sn  # 适配命令行 sn-list 模式
+        else:
+            latest_sn = episode_list[-1]
+        try:
+            db = read_db(latest_sn)
+            #           未下载的   或                设定要上传但是没上传的
+            if db["status"] == 0 or (db["remote_status"] == 0 and cfg.upload_to_server):
+                pending.append(latest_sn)  # 添加至下载列队
+        except IndexError:
+            # 如果数据库中尚不存在此条记录
+            if anime.get_sn() == latest_sn:
+                new_anime = anime  # 如果是本身则不用重复创建实例
+            else:
+                new_anime = build_anime(
+                    latest_sn, use_series_cache=True, update_check=True
+                )
+                if new_anime["failed"]:
+                    err_print(
+                        latest_sn,
+                        "更新狀態",
+                        "更新數據失敗, 跳過等待下次檢查",
+                        status=1,
+                    )
+                    return pending
+                new_anime = new_anime["anime"]
+            insert_db(new_anime)
+            pending.append(latest_sn)
+
+    return pending
+
+
+def check_tasks():
+    # 多部番剧并行检查, 请求频率由 build_anime 中的按主机限速控制
+    cfg = config.get_config()
+    sn_list = list(sn_dict.keys())
+    workers = max(1, min(cfg.update_check_workers, len(sn_list)))
 
-        # # sn 解析冷却
-        # if cfg.parse_sn_cd > 0:
-        #     err_print("更新資訊", "SN 解析冷卻 " + str(cfg.parse_sn_cd) + " 秒", no_sn=True)
-        #     time.sleep(cfg.parse_sn_cd)
+    def check(sn):
+        try:
+            return __check_series(sn)
+        except Exception as e:
+            err_print(sn, "更新狀態", "檢查更新時發生未知錯誤: " + str(e), status=1)
+            err_print(
+                sn,
+                "更新異常",
+                "異常詳情:\n" + traceback.format_exc(),
+                status=1,
+                display=False,
+            )
+            return []
+
+    # 返回 [(sn, sn_info)], 不含已在调度器中的任务; sn_info 附带面板显示的 filename
+    new_tasks = {}
+    with ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="update-check"
+    ) as executor:
+        # map 按 sn_dict 顺序返回结果, 保持列队顺序与串行检查时一致
+        for sn, pending in zip(sn_list, executor.map(check, sn_list)):
+            for ep in pending:
+                if ep not in new_tasks and not __in_progress(ep):  # 还没在列队中
+                    new_tasks[ep] = sn_dict[sn]
+
+    db_records = read_db_many(list(new_tasks))  # 一次查询所有新任务的显示名称
+    return [
+        (ep, dict(sn_info, filename=__display_name(ep, db_records.get(int(ep)))))
+        for ep, sn_info in new_tasks.items()
+    ]
+
+
+def __in_progress(sn):
+    # 该 sn 是否仍在下载、合并或上传中
+    return (
+        scheduler.contains(sn)
+        or get_finalize_stage().contains(sn)
+        or get_upload_stage().contains(sn)
+    )
 
 
 def __download_only(
-    sn, dl_resolution="", dl_save_dir="", realtime_show_file_size=False, classify=True
+    task, dl_resolution="", dl_save_dir="", realtime_show_file_size=False, classify=True
 ):
-    # 仅下载,不操作数据库
+    # 仅下载,不操作数据库; 由调度器执行, 失败返回 False 由调度器重试
     cfg = config.get_config()
-    
-    # 等待獲取線程資源（這期間任務顯示在"等待中"）
-    thread_limiter.acquire()
-    
-    # 標記手動任務已開始執行
-    config.start_manual_task(int(sn))
-    
-    err_counter = 0
+    sn = task.sn
 
-    anime = build_anime(sn)
-    if anime["failed"]:
-        # 任務失敗，從手動任務隊列中移除
-        config.remove_manual_task(int(sn))
-        thread_limiter.release()
-        sys.exit(1)
-    anime = anime["anime"]
-    
     # 獲取到線程資源後，創建進度條目（移到"執行中"）
-    config.tasks_progress_rate[int(sn)] = {
-        "rate": 0,
-        "filename": f"《{anime.get_title()}》",
-        "status": "正在解析"
-    }
+    anime = __resume_anime(task)
+    if anime is None:
+        return False
 
     try:
-        if dl_resolution:
-            anime.download(
-                dl_resolution,
-                dl_save_dir,
-                realtime_show_file_size=realtime_show_file_size,
-                classify=classify,
-            )
-        else:
-            anime.download(
-                cfg.download_resolution,
-                dl_save_dir,
-                realtime_show_file_size=realtime_show_file_size,
-                classify=classify,
-            )
-    except BaseException as e:
+        delay = __defer_for_playback(task, anime)
+        if delay is not None:
+            return delay
+        anime.download(
+            dl_resolution or cfg.download_resolution,
+            dl_save_dir,
+            realtime_show_file_size=realtime_show_file_size,
+            classify=classify,
+        )
+    except Exception as e:
+        task.context.pop("anime", None)
         err_print(sn, "下載異常", "發生未知異常: " + str(e), status=1)
         err_print(
             sn,
@@ -546,76 +633,40 @@ def __download_only(
         )
         anime.video_size = 0
 
-    while anime.video_size < 5:
-        if err_counter >= 3:
+    if anime.video_size < 5:
+        if task.will_retry:
             err_print(
                 sn,
-                "終止任務",
-                "title=" + anime.get_title() + " 任務失敗達三次! 終止任務!",
+                "任務失敗",
+                "title="
+                + anime.get_title()
+                + " 稍後自動重啓,最多重試"
+                + str(task.max_retries)
+                + "次",
                 status=1,
             )
-            thread_limiter.release()
-            if int(sn) in config.tasks_progress_rate.keys():
-                # 記錄失敗的任務（達到最大重試次數）
-                filename = config.tasks_progress_rate[int(sn)].get("filename", f"SN: {sn}")
-                config.record_completed_task(int(sn), filename, "failed")
-                del config.tasks_progress_rate[int(sn)]
-            # 從手動任務隊列中移除
-            config.remove_manual_task(int(sn))
-            return
+            progress.update_task(sn, status="失敗! 重啓中")
         else:
             err_print(
                 sn,
-                "任務失敗",
-                "title=" + anime.get_title() + " 10s后自動重啓,最多重試三次",
+                "終止任務",
+                "title=" + anime.get_title() + " 任務失敗達上限! 終止任務!",
                 status=1,
             )
-            err_counter = err_counter + 1
-            if int(sn) in config.tasks_progress_rate.keys():
-                config.tasks_progress_rate[int(sn)]["status"] = "失敗! 重啓中"
-            time.sleep(10)
-            anime.renew()
-
-            try:
-                if dl_resolution:
-                    anime.download(
-                        dl_resolution,
-                        dl_save_dir,
-                        realtime_show_file_size=realtime_show_file_size,
-                        classify=classify,
-                    )
-                else:
-                    anime.download(
-                        cfg.download_resolution,
-                        dl_save_dir,
-                        realtime_show_file_size=realtime_show_file_size,
-                        classify=classify,
-                    )
-            except BaseException as e:
-                err_print(sn, "下載異常", "發生未知異常: " + str(e), status=1)
-                err_print(
-                    sn,
-                    "下載異常",
-                    "異常詳情:\n" + traceback.format_exc(),
-                    status=1,
-                    display=False,
-                )
-                anime.video_size = 0
+            # 記錄失敗的任務（達到最大重試次數）
+            progress.finish_task(sn, "failed")
+        return False
 
-    download_cd = threading.Thread(target=download_cd_counter)
-    download_cd.start()
-    
-    # 從手動任務隊列中移除（任務已完成）
-    config.remove_manual_task(int(sn))
+    return True
 
 
-def __get_info_only(sn):
+def __get_info_only(task):
     cfg = config.get_config()
-    thread_limiter.acquire()
+    sn = task.sn
 
     anime = build_anime(sn)
     if anime["failed"]:
-        sys.exit(1)
+        return False
     anime = anime["anime"]
     anime.set_resolution(resolution)
     anime.get_info()
@@ -635,12 +686,10 @@ def __get_info_only(sn):
         else:
             err_print(sn, "彈幕下載異常", "番劇資料夾不存在: " + download_dir, status=1)
 
-    thread_limiter.release()
-
 
-def __get_danmu_only(sn, bangumi_name, video_path):
+def __get_danmu_only(task, bangumi_name, video_path):
     cfg = config.get_config()
-    thread_limiter.acquire()
+    sn = task.sn
 
     download_dir = cfg.bangumi_dir
     if classify:  # 控制是否建立番剧文件夹
@@ -658,8 +707,6 @@ def __get_danmu_only(sn, bangumi_name, video_path):
     else:
         err_print(sn, "彈幕下載異常", "番劇資料夾不存在: " + download_dir, status=1)
 
-    thread_limiter.release()
-
 
 def __cui(
     sn,
@@ -674,8 +721,7 @@ def __cui(
     realtime_show=True,
     cui_danmu=False,
 ):
-    # 使用全局的 thread_limiter，確保所有任務（手動+自動）共享同一個並發控制
-    # 這樣不會出現新任務插隊或舊任務永遠等待的問題
+    # 所有任務（手動+自動）由同一個調度器執行, 手動任務優先
     global danmu
     danmu = cui_danmu
 
@@ -691,22 +737,31 @@ def __cui(
     else:
         realtime_show_file_size = False
 
+    def submit(anime_sn):
+        # 加入调度器并记录, 结束前等待完成; 该 sn 已在列队中时返回 False
+        if get_info:
+            task = submit_manual(anime_sn, __get_info_only, cui_download_mode)
+        else:
+            task = submit_manual(
+                anime_sn,
+                lambda t: __download_only(
+                    t, cui_resolution, cui_save_dir, realtime_show_file_size, classify
+                ),
+                cui_download_mode,
+            )
+        if task is None:
+            err_print(anime_sn, "任務已在列隊中", status=1)
+            return False
+        thread_tasks.append(task)
+        return True
+
     if cui_download_mode == "single":
         if get_info:
             print("當前模式: 查詢本集資訊\n")
         else:
             print("當前下載模式: 僅下載本集\n")
 
-        if get_info:
-            __get_info_only(sn)
-        else:
-            __download_only(
-                sn,
-                cui_resolution,
-                cui_save_dir,
-                realtime_show_file_size=realtime_show_file_size,
-                classify=classify,
-            )
+        submit(sn)
 
     elif cui_download_mode == "latest" or cui_download_mode == "largest-sn":
         if cui_download_mode == "latest":
@@ -730,16 +785,7 @@ def __cui(
         if cui_download_mode == "largest-sn":
             bangumi_list.sort()
 
-        if get_info:
-            __get_info_only(bangumi_list[-1])
-        else:
-            __download_only(
-                bangumi_list[-1],
-                cui_resolution,
-                cui_save_dir,
-                realtime_show_file_size=realtime_show_file_size,
-                classify=classify,
-            )
+        submit(bangumi_list[-1])
 
     elif cui_download_mode == "all":
         if get_info:
@@ -755,36 +801,12 @@ def __cui(
         bangumi_list = list(anime.get_episode_list().values())
         bangumi_list.sort()
         tasks_counter = 0  # 任务计数器
-        
-        # 先將所有任務添加到手動任務隊列（顯示在"等待中"）
-        if not get_info:
-            for anime_sn in bangumi_list:
-                config.add_manual_task(
-                    int(anime_sn),
-                    f"SN: {anime_sn}",  # 先用簡單文件名，後面會更新
-                    "all"
-                )
-        
-        # 再啟動所有線程
+
+        # 加入調度器後即顯示在"等待中"
         for anime_sn in bangumi_list:
-            if get_info:
-                task = threading.Thread(target=__get_info_only, args=(anime_sn,))
-            else:
-                task = threading.Thread(
-                    target=__download_only,
-                    args=(
-                        anime_sn,
-                        cui_resolution,
-                        cui_save_dir,
-                        realtime_show_file_size,
-                        classify,
-                    ),
-                )
-            task.daemon = True
-            thread_tasks.append(task)
-            task.start()
-            tasks_counter = tasks_counter + 1
-            print("添加任务列隊: sn=" + str(anime_sn))
+            if submit(anime_sn):
+                tasks_counter = tasks_counter + 1
+                print("添加任务列隊: sn=" + str(anime_sn))
         if get_info:
             print("所有查詢任務已添加至列隊, 共 " + str(tasks_counter) + " 個任務\n")
         else:
@@ -813,23 +835,8 @@ def __cui(
         tasks_counter = 0  # 任务计数器
         for ep in ep_range:
             if ep in bangumi_ep_list:
-                if get_info:
-                    a = threading.Thread(
-                        target=__get_info_only, args=(episode_dict[ep],)
-                    )
-                else:
-                    a = threading.Thread(
-                        target=__download_only,
-                        args=(
-                            episode_dict[ep],
-                            cui_resolution,
-                            cui_save_dir,
-                            realtime_show_file_size,
-                        ),
-                    )
-                a.daemon = True
-                thread_tasks.append(a)
-                a.start()
+                if not submit(episode_dict[ep]):
+                    continue
                 tasks_counter = tasks_counter + 1
                 if get_info:
                     print(
@@ -886,21 +893,8 @@ def __cui(
         for sn in ep_sn_list:
             if sn in ep_range:
                 # 如果该 sn 在用户指定的 sn 范围里
-                if get_info:
-                    a = threading.Thread(target=__get_info_only, args=(sn,))
-                else:
-                    a = threading.Thread(
-                        target=__download_only,
-                        args=(
-                            sn,
-                            cui_resolution,
-                            cui_save_dir,
-                            realtime_show_file_size,
-                        ),
-                    )
-                a.daemon = True
-                thread_tasks.append(a)
-                a.start()
+                if not submit(sn):
+                    continue
                 tasks_counter = tasks_counter + 1
                 if get_info:
                     print(
@@ -939,17 +933,8 @@ def __cui(
 
         tasks_counter = 0
         for sn in ep_range:
-            if get_info:
-                a = threading.Thread(target=__get_info_only, args=(sn,))
-            else:
-                a = threading.Thread(
-                    target=__download_only,
-                    args=(sn, cui_resolution, cui_save_dir, realtime_show_file_size),
-                )
-            a.daemon = True
-            thread_tasks.append(a)
-            a.start()
-            tasks_counter = tasks_counter + 1
+            if submit(sn):
+                tasks_counter = tasks_counter + 1
 
         print(
             "所有任務已添加至列隊, 共 "
@@ -979,17 +964,14 @@ def __cui(
             else:
                 print("當前下載模式: 單次下載sn_list.txt中的番劇\n")
 
-            check_tasks()  # 检查更新，生成任务列队
-            for sn in queue.keys():  # 遍历任务列队
-                processing_queue.append(sn)
-                task = threading.Thread(
-                    target=worker, args=(sn, queue[sn], realtime_show_file_size)
-                )
-                task.daemon = True
-                thread_tasks.append(task)
-                task.start()
-                err_print(sn, "加入任务列隊")
-            msg = "共 " + str(len(queue)) + " 個任務"
+            tasks_counter = 0
+            for sn, sn_info in check_tasks():  # 检查更新，生成任务列队
+                task = submit_worker(sn, sn_info, realtime_show_file_size)
+                if task is not None:
+                    thread_tasks.append(task)
+                    tasks_counter = tasks_counter + 1
+                    err_print(sn, "加入任务列隊")
+            msg = "共 " + str(tasks_counter) + " 個任務"
             err_print(0, "任務資訊", msg, no_sn=True)
             print()
 
@@ -1001,18 +983,16 @@ def __cui(
                     anime_db["anime_name"] is not None
                     and anime_db["local_file_path"] is not None
                 ):
-                    a = threading.Thread(
-                        target=__get_danmu_only,
-                        args=(
-                            anime_db["sn"],
-                            anime_db["anime_name"],
-                            anime_db["local_file_path"],
-                        ),
+                    task = submit_manual(
+                        anime_db["sn"],
+                        lambda t, name=anime_db["anime_name"], path=anime_db[
+                            "local_file_path"
+                        ]: __get_danmu_only(t, name, path),
+                        "danmu",
                     )
-                    a.daemon = True
-                    thread_tasks.append(a)
-                    a.start()
-                    tasks_counter = tasks_counter + 1
+                    if task is not None:
+                        thread_tasks.append(task)
+                        tasks_counter = tasks_counter + 1
                 else:
                     err_print(
                         anime_db["sn"],
@@ -1043,13 +1023,14 @@ def __cui(
 
 
 def __kill_thread_when_ctrl_c():
-    # 等待所有任务完成
-    for t in thread_tasks:  # 当用户 Ctrl+C 可以 kill 线程
-        while True:
-            if t.is_alive():
-                time.sleep(1)
-            else:
-                break
+    # 等待本次提交的任务完成
+    for t in thread_tasks:  # 分段等待, 当用户 Ctrl+C 可以退出
+        while not t.wait(1):
+            pass
+    # 下载完成后还需等待合并及上传
+    for stage in (get_finalize_stage(), get_upload_stage()):
+        while not stage.wait_idle(1):
+            pass
 
 
 def kill_gost():
@@ -1128,7 +1109,8 @@ def __init_proxy():
 
 
 def do_request(url, headers, cookies, params=None):
-    return httpx.get(url, headers=headers, cookies=cookies, params=params)
+    with create_client() as client:
+        return client.get(url, headers=headers, cookies=cookies, params=params)
 
 
 def parse_anime(soup, animes, headers, cookies):
@@ -1228,20 +1210,14 @@ settings = config.get_settings()
 
 working_dir = config.get_working_dir()
 db_path = os.path.join(working_dir, "aniGamer.db")
-queue = {}  # 储存 sn 相关信息, {'tag': TAG, 'rename': RENAME}, rename,
-processing_queue = []
-thread_limiter = threading.Semaphore(cfg.multi_thread)  # 下载并发限制器
-upload_limiter = threading.Semaphore(cfg.multi_upload)  # 并发上传限制器
-db_locker = threading.Semaphore(1)
+scheduler = get_task_scheduler()  # 下载任务调度器, 并发数为 multi_thread
+anime_db = AnimeDatabase(db_path)  # 每线程长连接, WAL 模式
 thread_tasks = []
 gost_subprocess = None  # 存放 gost 的 subprocess.Popen 对象, 用于结束时 kill gost
 gost_port = gost_port()  # gost 端口
 sn_dict = config.read_sn_list()
 danmu = cfg.danmu
 
-# 設置任務佇列引用，供 Dashboard 使用
-config.set_task_queue_refs(queue, processing_queue)
-
 if __name__ == "__main__":
     if cfg.check_latest_version:
         check_new_version()  # 检查新版
@@ -1249,23 +1225,7 @@ if __name__ == "__main__":
     print(version_msg)
 
     # 初始化 sqlite3 数据库
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute(
-        "CREATE TABLE IF NOT EXISTS anime ("
-        "sn INTEGER PRIMARY KEY NOT NULL,"
-        "title VARCHAR(100) NOT NULL,"
-        "anime_name VARCHAR(100) NOT NULL, "
-        "episode VARCHAR(10) NOT NULL,"
-        "status TINYINT DEFAULT 0,"
-        "remote_status INTEGER DEFAULT 0,"
-        "resolution INTEGER DEFAULT 0,"
-        "file_size INTEGER DEFAULT 0,"
-        "local_file_path VARCHAR(500),"
-        "[CreatedTime] TimeStamp NOT NULL DEFAULT (datetime('now','localtime')))"
-    )
-    conn.commit()
-    conn.close()
+    anime_db.init_schema()
 
     if len(sys.argv) > 1:  # 支持命令行使用
         parser = argparse.ArgumentParser()
@@ -1426,7 +1386,6 @@ if __name__ == "__main__":
         if arg.information_only:
             # 为避免排版混乱, 仅显示信息时强制为单线程
             thread_limit = 1
-            thread_limiter = threading.Semaphore(thread_limit)
         else:
             if arg.thread_limit:
                 # 用戶設定併發數
@@ -1437,6 +1396,7 @@ if __name__ == "__main__":
                     thread_limit = arg.thread_limit
             else:
                 thread_limit = cfg.multi_thread
+        scheduler.set_workers(thread_limit)
 
         if cfg.use_proxy:
             __init_proxy()
@@ -1481,37 +1441,21 @@ if __name__ == "__main__":
         if cfg.read_config_when_checking_update:
             settings = config.get_settings()
         danmu = settings.danmu  # 避免手動加入工作時，global 覆寫掉 config 的 danmu 設定
-        check_tasks()  # 检查更新，生成任务列队
+        scheduler.set_workers(settings.multi_thread)
+        scheduler.set_retry_backoff(cfg.task_retry_backoff)
         new_tasks_counter = 0  # 新增任务计数器
-        if queue:
-            for task_sn in queue.keys():
-                if task_sn not in processing_queue:  # 如果该任务没有在进行中，则启动
-                    # 立即在 tasks_progress_rate 中創建條目，避免前端顯示跳躍
-                    try:
-                        db = read_db(task_sn)
-                        filename = f"《{db['anime_name']}》- {db['episode']}"
-                    except (IndexError, KeyError, Exception):
-                        filename = f"SN: {task_sn}"
-                    
-                    config.tasks_progress_rate[int(task_sn)] = {
-                        "rate": 0,
-                        "filename": filename,
-                        "status": "等待下載"
-                    }
-                    
-                    task = threading.Thread(
-                        target=worker, args=(task_sn, queue[task_sn])
-                    )
-                    task.daemon = True
-                    task.start()
-                    processing_queue.append(task_sn)
+        with metrics.UPDATE_CYCLE_SECONDS.time():
+            for task_sn, sn_info in check_tasks():  # 检查更新，生成任务列队
+                if submit_worker(task_sn, sn_info) is not None:
                     new_tasks_counter = new_tasks_counter + 1
                     err_print(task_sn, "加入任务列隊")
+        stats = scheduler.snapshot()
+        queued = sum(stats[key] for key in ("running", "pending", "retry_wait", "waiting"))
         info = (
             "本次更新添加了 "
             + str(new_tasks_counter)
             + " 個新任務, 目前列隊中共有 "
-            + str(len(processing_queue))
+            + str(queued)
             + " 個任務"
         )
         err_print(0, "更新資訊", info, no_sn=True)
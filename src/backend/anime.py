@@ -4,6 +4,7 @@
 
 Classes:
     TryTooManyTimeError: 重試次數過多時拋出的異常
+    AnimeError: 無法繼續處理該劇集時拋出的異常
     Anime: 動畫下載主類別，處理影片解析、下載、上傳等操作
 """
 
@@ -25,20 +26,39 @@ from ftplib import FTP, FTP_TLS
 from urllib.parse import quote
 
 import httpx
-from bs4 import BeautifulSoup
 
-from . import config
+from . import config, events, metrics, progress
 from .color_print import err_print
 from .danmu import Danmu
-
-
-class TryTooManyTimeError(BaseException):
+from .database import AnimeDatabase
+from .downloader import SegmentDownloader
+from .http_client import HttpClient
+from .page_parser import page_signature, parse_series_page
+from .rate_limiter import (
+    ProcessThrottle,
+    get_playback_limiter,
+    get_request_limiter,
+    get_upload_limiter,
+)
+from .series_cache import get_series_cache
+from .transport import create_client
+
+
+class TryTooManyTimeError(Exception):
     """重試次數過多異常。
 
     當請求失敗次數超過最大重試次數時拋出此異常。
     """
 
 
+class AnimeError(Exception):
+    """劇集處理失敗異常。
+
+    該 sn 沒有動畫、地區限制、廣告去除失敗等無法繼續處理該劇集時拋出，
+    由呼叫端記錄失敗，不終止工作線程。
+    """
+
+
 class Anime:
     """動畫下載主類別。
 
@@ -58,7 +78,14 @@ class Anime:
     """
 
     def __init__(
-        self, sn: int | str, debug_mode: bool = False, gost_port: int = 34173
+        self,
+        sn: int | str,
+        debug_mode: bool = False,
+        gost_port: int = 34173,
+        page_cache: AnimeDatabase | None = None,
+        use_series_cache: bool = False,
+        lazy: bool = False,
+        mobile_metadata: bool = False,
     ) -> None:
         """初始化 Anime 物件。
 
@@ -66,6 +93,11 @@ class Anime:
             sn: 影片序號（SN碼）
             debug_mode: 除錯模式，啟用時不會執行實際下載
             gost_port: Gost 代理伺服器埠號
+            page_cache: 番劇頁面快取，提供時以條件請求及內容哈希略過未變化頁面的解析
+            use_series_cache: 是否優先由記憶體中的番劇資訊快取建立，命中時不請求頁面
+            lazy: 延遲解析頁面，直到首次需要標題、集數等資訊時才請求
+            mobile_metadata: 以 APP API 的 JSON 獲取標題及劇集列表，不影響下載使用的
+                header；資料格式異常時退回 Web 解析
         """
         self._cfg = config.get_config()
         self._settings = config.get_settings()  # 使用新的 Settings dataclass
@@ -76,8 +108,13 @@ class Anime:
         self._temp_dir = self._settings.temp_dir
         self._gost_port = str(gost_port)
 
-        # Create httpx client with timeout configuration
-        self._httpx_client = httpx.Client(
+        self._proxies = {}
+        if self._cfg.use_proxy and not debug_mode:  # 使用代理
+            self.__init_proxy()
+
+        # httpx client 共用进程内的连线池, 仅各自保存 cookie
+        self._httpx_client = create_client(
+            self._proxies.get("https"),
             timeout=10.0,
             follow_redirects=True,
         )
@@ -87,18 +124,34 @@ class Anime:
         self._bangumi_name_orig = ""
         self._episode = ""
         self._episode_list = {}
+        self._episode_labels = {}  # {sn: 页面上显示的集数}, 用于番剧信息快取
+        self._title_synthesized = False  # 标题是否由番剧名及集数拼成, 下载前需重新解析页面
+        self._page_loaded = debug_mode  # debug 模式不请求页面
+        self._mobile_metadata = mobile_metadata
+        self._mobile_src = self._cfg.use_mobile_api  # self._src 是否为 APP API 的 JSON
+        self._page_cache = page_cache
+        self._cached_page = None  # 页面未变化时命中的快取
+        self._page_hash = None  # 标题及剧集列表片段的哈希
+        self._page_validators = (None, None)  # (ETag, Last-Modified)
         self._device_id = ""
         self._playlist = {}
         self._m3u8_dict = {}
+        self._playback_ready_at = None  # 下载冷却结束的时间, 未预约时为 None
+        self._ad_ready_at = None  # 广告结束的时间, 未开始播放广告时为 None
+        self._ad_time = 0
+        self._ad_started_at = None  # 开始播放广告的时间, 广告检查通过后记录实际等待秒数
+        self._pending_finalize = None  # (SegmentDownloader, 输出路径, 文件名), 待合并的分段
         self.local_video_path = ""
         self._video_filename = ""
         self._ffmpeg_path = ""
         self.video_resolution = 0
         self.video_size = 0
+        self.download_duration = 0.0  # 下载耗时(秒), 记录到数据库
+        self.chunk_count = 0  # 分段数, 仅分段下载模式
+        self.last_error = ""  # 最近一次失败原因, 记录到数据库
         self.realtime_show_file_size = False
         self.upload_succeed_flag = False
         self._danmu = False
-        self._proxies = {}
 
         self.season_title_filter = re.compile("第[零一二三四五六七八九十]{1,3}季$")
         self.extra_title_filter = re.compile(r"\[(特別篇|中文配音)\]$")
@@ -111,15 +164,29 @@ class Anime:
         if debug_mode:
             print("當前為debug模式")
         else:
-            if self._cfg.use_proxy:  # 使用代理
-                self.__init_proxy()
             self.__init_header()  # http header
-            self.__get_src()  # 获取网页, 产生 self._src (BeautifulSoup)
-            self.__get_title()  # 提取页面标题
-            self.__get_bangumi_name()  # 提取本番名字
-            self.__get_episode()  # 提取剧集码，str
-            # 提取剧集列表，结构 {'episode': sn}，储存到 self._episode_list, sn 为 int, 考慮到 劇場版 sp 等存在, key 為 str
-            self.__get_episode_list()
+            # lazy 模式延迟到首次需要时再解析页面
+            if not lazy and not (use_series_cache and self.__load_series_cache()):
+                self.__parse_page()
+
+    @classmethod
+    def from_db_row(cls, row: dict, **kwargs) -> Anime:
+        """由資料庫紀錄建立，標題、番劇名及集數取自紀錄，不請求頁面。
+
+        劇集列表等紀錄中沒有的資訊仍會在首次需要時請求頁面。
+
+        Args:
+            row: 資料庫紀錄，見 ``database.ANIME_COLUMNS``
+            **kwargs: 傳給建構函數的其他參數
+
+        Returns:
+            Anime: 延遲解析的實例
+        """
+        anime = cls(row["sn"], lazy=True, **kwargs)
+        anime._title = row["title"] or ""
+        anime._bangumi_name = row["anime_name"] or ""
+        anime._episode = row["episode"] or ""
+        return anime
 
     def __init_proxy(self):
         if self._settings.use_gost:
@@ -145,58 +212,210 @@ class Anime:
             os.environ["NO_PROXY"] = "127.0.0.1,localhost"
 
     def renew(self):
-        self.__get_src()
-        self.__get_title()
+        self.__parse_page()
+
+    def __ensure_page(self):
+        # 延迟模式下首次需要页面信息时才解析
+        if not self._page_loaded:
+            self.__parse_page()
+
+    def __ensure_metadata(self):
+        # 标题, 番剧名, 集数齐全 (如由数据库记录建立) 时无需请求页面
+        if self._title_synthesized:
+            self.__parse_page()  # 由番剧信息快取拼成的标题不可靠, 以页面为准
+        elif not (self._title and self._bangumi_name and self._episode):
+            self.__ensure_page()
+
+    def __parse_page(self):
+        if self._mobile_metadata and not self._cfg.use_mobile_api:
+            # 仅需元数据时优先使用 APP API 的 JSON, 省去 HTML 解析
+            self._mobile_src = True
+            try:
+                self.__get_src()
+            except ValueError:  # JSON 解析失败
+                self._src = None
+            if not self.__mobile_src_valid():
+                err_print(
+                    self._sn,
+                    "解析模式",
+                    "APP API 資料格式異常, 改用 Web 解析",
+                    display=False,
+                )
+                self._mobile_src = False
+                self.__get_src()
+        else:
+            self._mobile_src = self._cfg.use_mobile_api
+            self.__get_src()  # 获取网页, 产生 self._src (BeautifulSoup)
+        self._page_loaded = True
+        self._title_synthesized = False
+        if self._cached_page is not None:
+            # 页面未变化, 直接使用上次的解析结果
+            self._title = self._cached_page["title"]
+            self._episode = self._cached_page["episode"]
+            self._episode_list = dict(self._cached_page["episode_list"])
+            self._episode_labels = dict(self._cached_page["episode_labels"])
+            self.__get_bangumi_name()
+            if self._page_hash is not None:
+                # 内容没变但验证信息可能更新了
+                self.__save_page_cache()
+        else:
+            self.__get_title()  # 提取页面标题
+            self.__get_bangumi_name()  # 提取本番名字
+            self.__get_episode()  # 提取剧集码，str
+            # 提取剧集列表，结构 {'episode': sn}，储存到 self._episode_list, sn 为 int, 考慮到 劇場版 sp 等存在, key 為 str
+            self.__get_episode_list()
+            self.__save_page_cache()
+        # 同一番剧的其他剧集可由此次解析结果建立
+        get_series_cache().put(
+            int(self._sn),
+            str(self._title),
+            self._bangumi_name,
+            self._episode_list,
+            self._episode_labels,
+        )
+
+    def __mobile_src_valid(self):
+        # 检查 APP API 返回的资料是否包含解析所需字段
+        try:
+            anime = self._src["data"]["anime"]
+            return isinstance(anime["title"], str) and all(
+                "episode" in episode and "videoSn" in episode
+                for episodes in anime["episodes"].values()
+                for episode in episodes
+            )
+        except (KeyError, TypeError, AttributeError):
+            return False
+
+    def __load_series_cache(self):
+        # 由番剧信息快取建立, 成功返回 True
+        info = get_series_cache().get(int(self._sn))
+        if info is None:
+            return False
+        self._episode = info.episode_labels[int(self._sn)]
+        self._title = info.title_of(int(self._sn))
+        if self._title is None:
+            # 未解析过的剧集暂以番剧名及集数作为标题, 下载或重命名前重新解析页面
+            self._title = f"{info.bangumi_name} [{self._episode}]"
+            self._title_synthesized = True
+        self._episode_list = dict(info.episode_list)
+        self._episode_labels = dict(info.episode_labels)
         self.__get_bangumi_name()
-        self.__get_episode()
-        self.__get_episode_list()
+        self._page_loaded = True
+        err_print(self._sn, "解析模式", "使用番劇資訊快取", display=False)
+        return True
 
     def get_sn(self):
         return self._sn
 
     def get_bangumi_name(self):
         if self._bangumi_name == "":
+            self.__ensure_page()
             self.__get_bangumi_name()
         return self._bangumi_name
 
     def get_episode(self):
         if self._episode == "":
-            self.__get_episode()
+            self.__ensure_page()
         return self._episode
 
     def get_episode_list(self):
         if self._episode_list == {}:
-            self.__get_episode_list()
+            self.__ensure_page()
         return self._episode_list
 
     def get_title(self):
+        if self._title == "":
+            self.__ensure_page()
         return self._title
 
     def get_filename(self):
+        self.__ensure_metadata()
         if self.video_resolution == 0:
             return self.__get_filename(self._cfg.download_resolution)
         else:
             return self.__get_filename(str(self.video_resolution))
 
     def __get_src(self):
-        if self._cfg.use_mobile_api:
+        # sn 解析冷却: 同一主机相邻两次解析至少间隔 parse_sn_cd 秒, 多线程检查时共用
+        host = "api.gamer.com.tw" if self._mobile_src else "ani.gamer.com.tw"
+        wait = get_request_limiter().reserve(host)
+        if wait > 0:
+            err_print(self._sn, "更新資訊", f"SN 解析冷卻 {wait:.1f} 秒", display=False)
+            time.sleep(wait)
+
+        if self._mobile_src:
             self._src = self.__request_json(
                 f"https://api.gamer.com.tw/mobile_app/anime/v4/video.php?sn={self._sn}",
                 no_cookies=True,
+                header=self._mobile_header,
             )
         else:
             req = f"https://ani.gamer.com.tw/animeVideo.php?sn={self._sn}"
-            f = self.__request(req, no_cookies=True, use_httpx=True)
-            self._src = BeautifulSoup(f.content, "html.parser")
+            cached = None
+            if self._page_cache is not None:
+                cached = self._page_cache.read_page_cache(self._sn)
+            if cached is not None and cached["episode_labels"] is None:
+                cached = None  # 旧版快取没有集数标签, 重新解析
+            conditional_header = {}
+            if cached is not None:
+                if cached["etag"]:
+                    conditional_header["If-None-Match"] = cached["etag"]
+                if cached["last_modified"]:
+                    conditional_header["If-Modified-Since"] = cached["last_modified"]
+            f = self.__request(req, no_cookies=True, addition_header=conditional_header)
+
+            self._cached_page = None
+            self._page_hash = None
+            self._page_validators = (
+                f.headers.get("etag"),
+                f.headers.get("last-modified"),
+            )
+            if cached is not None and f.status_code == 304:
+                err_print(self._sn, "頁面快取", "頁面未修改 (304)", display=False)
+                self._cached_page = cached
+                return
+
+            self._page_hash = page_signature(f.content)
+            if cached is not None and self._page_hash == cached["content_hash"]:
+                # 内容没变但验证信息可能更新了
+                err_print(self._sn, "頁面快取", "劇集列表未變化", display=False)
+                self._cached_page = cached
+                return
+            self._src = parse_series_page(f.content)  # 仅解析标题和剧集列表片段
+
+    def __save_page_cache(self):
+        if (
+            self._page_cache is None
+            or self._mobile_src
+            or self._page_hash is None
+        ):
+            return
+        etag, last_modified = self._page_validators
+        try:
+            self._page_cache.save_page_cache(
+                {
+                    "sn": int(self._sn),
+                    "etag": etag,
+                    "last_modified": last_modified,
+                    "content_hash": self._page_hash,
+                    "title": str(self._title),
+                    "episode": self._episode,
+                    "episode_list": self._episode_list,
+                    "episode_labels": self._episode_labels,
+                }
+            )
+        except Exception as e:
+            # 快取写入失败不影响解析结果
+            err_print(self._sn, "頁面快取", "快取寫入失敗: " + str(e), display=False)
 
     def __get_title(self):
-        if self._cfg.use_mobile_api:
+        if self._mobile_src:
             try:
                 self._title = self._src["data"]["anime"]["title"]
             except KeyError:
                 err_print(self._sn, "ERROR: 該 sn 下真的有動畫？", status=1)
                 self._episode_list = {}
-                sys.exit(1)
+                raise AnimeError("該 sn 下沒有動畫")
         else:
             soup = self._src
             try:
@@ -207,7 +426,7 @@ class Anime:
                 # 该sn下没有动画
                 err_print(self._sn, "ERROR: 該 sn 下真的有動畫？", status=1)
                 self._episode_list = {}
-                sys.exit(1)
+                raise AnimeError("該 sn 下沒有動畫")
 
     def __get_bangumi_name(self):
         self._bangumi_name = self._title.replace(
@@ -235,7 +454,7 @@ class Anime:
         # https://github.com/miyouzi/aniGamerPlus/issues/36
         # self._episode = re.findall(r'\[.+?\]', self._title)  # 非贪婪匹配
         # self._episode = str(self._episode[-1][1:-1])  # 考虑到 .5 集和 sp、ova 等存在，以str储存
-        if self._cfg.use_mobile_api:
+        if self._mobile_src:
             get_ep()
         else:
             soup = self._src
@@ -250,7 +469,7 @@ class Anime:
                 get_ep()
 
     def __get_episode_list(self):
-        if self._cfg.use_mobile_api:
+        if self._mobile_src:
             for _type in self._src["data"]["anime"]["episodes"]:
                 for _sn in self._src["data"]["anime"]["episodes"][_type]:
                     if _type == "0":  # 本篇
@@ -267,6 +486,8 @@ class Anime:
                         )
                     else:  # 中文電影
                         self._episode_list["中文電影"] = int(_sn["videoSn"])
+            for ep, sn in self._episode_list.items():
+                self._episode_labels[sn] = ep
         else:
             try:
                 a = self._src.find("section", "season").find_all("a")
@@ -280,6 +501,7 @@ class Anime:
                 for i in a:
                     sn = int(i["href"].replace("?sn=", ""))
                     ep = str(i.string)
+                    self._episode_labels[sn] = ep
                     if ep not in index_counter.keys():
                         index_counter[ep] = 0
                     if ep in self._episode_list.keys():
@@ -294,6 +516,7 @@ class Anime:
             except AttributeError:
                 # 当只有一集时，不存在剧集列表，self._episode_list 只有本身
                 self._episode_list[self._episode] = self._sn
+                self._episode_labels[int(self._sn)] = self._episode
 
     def __init_header(self):
         # 伪装为浏览器
@@ -333,10 +556,10 @@ class Anime:
         show_fail=True,
         max_retry=3,
         addition_header=None,
-        use_httpx=False,
+        header=None,
     ):
-        # 设置 header
-        current_header = self._req_header
+        # 设置 header, 附加 header 仅作用于本次请求; header 用于临时替换实例的 header
+        current_header = dict(header or self._req_header)
         if addition_header is None:
             addition_header = {}
         if len(addition_header) > 0:
@@ -349,31 +572,13 @@ class Anime:
             cookies = self._cookies
         else:
             cookies = {}
+        request_start = time.monotonic()
         while True:
             try:
-                if use_httpx:
-                    # Use httpx client with proxy support
-                    if self._proxies:
-                        # httpx uses 'proxies' parameter (similar to requests)
-                        proxy_url = self._proxies.get("http") or self._proxies.get(
-                            "https"
-                        )
-                        f = self._httpx_client.get(
-                            req,
-                            headers=current_header,
-                            cookies=cookies,
-                            proxies=proxy_url,
-                        )
-                    else:
-                        f = self._httpx_client.get(
-                            req, headers=current_header, cookies=cookies
-                        )
-                else:
-                    f = self._httpx_client.get(
-                        req, headers=current_header, cookies=cookies
-                    )
+                f = self._httpx_client.get(req, headers=current_header, cookies=cookies)
             except httpx.HTTPError as e:
                 if error_cnt >= max_retry >= 0:
+                    metrics.HTTP_FAILURES.inc()
                     raise TryTooManyTimeError(
                         "任務狀態: sn="
                         + str(self._sn)
@@ -388,10 +593,12 @@ class Anime:
                 )
                 if show_fail:
                     err_print(self._sn, "任務狀態", err_detail)
+                metrics.HTTP_RETRIES.inc()
                 time.sleep(3)
                 error_cnt += 1
             else:
                 break
+        metrics.HTTP_REQUEST_SECONDS.observe(time.monotonic() - request_start)
         # 处理 cookie
         if not self._cookies:
             # 当实例中尚无 cookie, 则读取
@@ -461,6 +668,11 @@ class Anime:
                                 time.sleep(random_wait_time)
                                 try_counter = try_counter + 1
                         if not succeed_flag:
+                            events.emit(
+                                "cookie_refresh_failed",
+                                self._sn,
+                                guest_mode=not self._cfg.disable_guest_mode,
+                            )
                             if self._cfg.disable_guest_mode:
                                 # 不使用遊客模式：拋出異常，保持 cookies 不變
                                 err_print(
@@ -501,6 +713,11 @@ class Anime:
                     err_print(
                         self._sn, f"用戶cookie刷新 {key_list_str} ", display=False
                     )
+                    events.emit(
+                        "cookie_refreshed",
+                        self._sn,
+                        keys=list(self._httpx_client.cookies.keys()),
+                    )
 
                     self.__request("https://ani.gamer.com.tw/")
                     # 20210724 动画疯一步到位刷新 Cookie
@@ -524,177 +741,187 @@ class Anime:
         show_fail=True,
         max_retry=3,
         addition_header=None,
-        use_httpx=False,
+        header=None,
     ):
         response = self.__request(
-            req, no_cookies, show_fail, max_retry, addition_header, use_httpx
+            req, no_cookies, show_fail, max_retry, addition_header, header
         )
         # Both httpx and requests use .json() method
         return response.json()
 
-    def __get_m3u8_dict(self):
-        # m3u8获取模块参考自 https://github.com/c0re100/BahamutAnimeDownloader
-        def get_device_id():
-            req = "https://ani.gamer.com.tw/ajax/getdeviceid.php"
-            self._device_id = self.__request_json(req)["deviceid"]
-            return self._device_id
-
-        def get_playlist():
-            if self._cfg.use_mobile_api:
-                req = f"https://api.gamer.com.tw/mobile_app/anime/v3/m3u8.php?videoSn={str(self._sn)}&device={self._device_id}"
-            else:
-                req = (
-                    "https://ani.gamer.com.tw/ajax/m3u8.php?sn="
-                    + str(self._sn)
-                    + "&device="
-                    + self._device_id
-                )
-            self._playlist = self.__request_json(req)
-
-        def random_string(num):
-            chars = "abcdefghijklmnopqrstuvwxyz0123456789"
-            random.seed(int(round(time.time() * 1000)))
-            result = []
-            for i in range(num):
-                result.append(chars[random.randint(0, len(chars) - 1)])
-            return "".join(result)
-
-        def gain_access():
-            if self._cfg.use_mobile_api:
-                req = f"https://ani.gamer.com.tw/ajax/token.php?adID=0&sn={str(self._sn)}&device={self._device_id}"
-            else:
-                req = (
-                    "https://ani.gamer.com.tw/ajax/token.php?adID=0&sn="
-                    + str(self._sn)
-                    + "&device="
-                    + self._device_id
-                    + "&hash="
-                    + random_string(12)
-                )
-            # 返回基础信息, 用于判断是不是VIP
-            return self.__request_json(req)
+    # m3u8获取模块参考自 https://github.com/c0re100/BahamutAnimeDownloader
+    def __get_device_id(self):
+        req = "https://ani.gamer.com.tw/ajax/getdeviceid.php"
+        self._device_id = self.__request_json(req)["deviceid"]
+        return self._device_id
 
-        def unlock():
+    def __get_playlist(self):
+        if self._cfg.use_mobile_api:
+            req = f"https://api.gamer.com.tw/mobile_app/anime/v3/m3u8.php?videoSn={str(self._sn)}&device={self._device_id}"
+        else:
             req = (
-                "https://ani.gamer.com.tw/ajax/unlock.php?sn="
+                "https://ani.gamer.com.tw/ajax/m3u8.php?sn="
                 + str(self._sn)
-                + "&ttl=0"
+                + "&device="
+                + self._device_id
             )
-            f = self.__request(req)  # 无响应正文
-
-        def check_lock():
+        self._playlist = self.__request_json(req)
+
+    @staticmethod
+    def __random_string(num):
+        chars = "abcdefghijklmnopqrstuvwxyz0123456789"
+        random.seed(int(round(time.time() * 1000)))
+        result = []
+        for i in range(num):
+            result.append(chars[random.randint(0, len(chars) - 1)])
+        return "".join(result)
+
+    def __gain_access(self):
+        if self._cfg.use_mobile_api:
+            req = f"https://ani.gamer.com.tw/ajax/token.php?adID=0&sn={str(self._sn)}&device={self._device_id}"
+        else:
             req = (
-                "https://ani.gamer.com.tw/ajax/checklock.php?device="
-                + self._device_id
-                + "&sn="
+                "https://ani.gamer.com.tw/ajax/token.php?adID=0&sn="
                 + str(self._sn)
+                + "&device="
+                + self._device_id
+                + "&hash="
+                + self.__random_string(12)
             )
-            f = self.__request(req)
-
-        def start_ad():
-            if self._cfg.use_mobile_api:
-                req = f"https://api.gamer.com.tw/mobile_app/anime/v1/stat_ad.php?schedule=-1&sn={str(self._sn)}"
-            else:
-                req = (
-                    "https://ani.gamer.com.tw/ajax/videoCastcishu.php?sn="
-                    + str(self._sn)
-                    + "&s=194699"
-                )
-            f = self.__request(req)  # 无响应正文
-
-        def skip_ad():
-            if self._cfg.use_mobile_api:
-                req = f"https://api.gamer.com.tw/mobile_app/anime/v1/stat_ad.php?schedule=-1&ad=end&sn={str(self._sn)}"
-            else:
-                req = (
-                    "https://ani.gamer.com.tw/ajax/videoCastcishu.php?sn="
-                    + str(self._sn)
-                    + "&s=194699&ad=end"
-                )
-            f = self.__request(req)  # 无响应正文
-
-        def video_start():
-            req = "https://ani.gamer.com.tw/ajax/videoStart.php?sn=" + str(self._sn)
-            f = self.__request(req)
+        # 返回基础信息, 用于判断是不是VIP
+        return self.__request_json(req)
+
+    def __unlock(self):
+        req = (
+            "https://ani.gamer.com.tw/ajax/unlock.php?sn="
+            + str(self._sn)
+            + "&ttl=0"
+        )
+        f = self.__request(req)  # 无响应正文
+
+    def __check_lock(self):
+        req = (
+            "https://ani.gamer.com.tw/ajax/checklock.php?device="
+            + self._device_id
+            + "&sn="
+            + str(self._sn)
+        )
+        f = self.__request(req)
 
-        def check_no_ad(error_count=10):
-            if error_count == 0:
-                err_print(self._sn, "廣告去除失敗! 請向開發者提交 issue!", status=1)
-                sys.exit(1)
+    def __start_ad(self):
+        if self._cfg.use_mobile_api:
+            req = f"https://api.gamer.com.tw/mobile_app/anime/v1/stat_ad.php?schedule=-1&sn={str(self._sn)}"
+        else:
+            req = (
+                "https://ani.gamer.com.tw/ajax/videoCastcishu.php?sn="
+                + str(self._sn)
+                + "&s=194699"
+            )
+        f = self.__request(req)  # 无响应正文
 
+    def __skip_ad(self):
+        if self._cfg.use_mobile_api:
+            req = f"https://api.gamer.com.tw/mobile_app/anime/v1/stat_ad.php?schedule=-1&ad=end&sn={str(self._sn)}"
+        else:
             req = (
-                "https://ani.gamer.com.tw/ajax/token.php?sn="
+                "https://ani.gamer.com.tw/ajax/videoCastcishu.php?sn="
                 + str(self._sn)
-                + "&device="
-                + self._device_id
-                + "&hash="
-                + random_string(12)
+                + "&s=194699&ad=end"
             )
-            resp = self.__request_json(req)
-            if "time" in resp.keys():
-                if not resp["time"] == 1:
-                    err_print(
-                        self._sn,
-                        "廣告似乎還沒去除, 追加等待2秒, 剩餘重試次數 "
-                        + str(error_count),
-                        status=1,
-                    )
-                    time.sleep(2)
-                    skip_ad()
-                    video_start()
-                    check_no_ad(error_count=error_count - 1)
-                else:
-                    # 通过广告检查
-                    if error_count != 10:
-                        ads_time = (10 - error_count) * 2 + ad_time + 2
-                        err_print(
-                            self._sn,
-                            "通过廣告時間" + str(ads_time) + "秒, 記錄到配置檔案",
-                            status=2,
-                        )
-                        # 只更新 Config 對象並保存
-                        if self._cfg.use_mobile_api:
-                            self._cfg.mobile_ads_time = ads_time
-                        else:
-                            self._cfg.ads_time = ads_time
-                        config.save_config(self._cfg)  # 保存到配置文件
-            else:
+        f = self.__request(req)  # 无响应正文
+
+    def __video_start(self):
+        req = "https://ani.gamer.com.tw/ajax/videoStart.php?sn=" + str(self._sn)
+        f = self.__request(req)
+
+    def __check_no_ad(self, error_count=10):
+        if error_count == 0:
+            err_print(self._sn, "廣告去除失敗! 請向開發者提交 issue!", status=1)
+            raise AnimeError("廣告去除失敗")
+
+        req = (
+            "https://ani.gamer.com.tw/ajax/token.php?sn="
+            + str(self._sn)
+            + "&device="
+            + self._device_id
+            + "&hash="
+            + self.__random_string(12)
+        )
+        resp = self.__request_json(req)
+        if "time" in resp.keys():
+            if not resp["time"] == 1:
                 err_print(
-                    self._sn, "遭到動畫瘋地區限制, 你的IP可能不被動畫瘋認可!", status=1
+                    self._sn,
+                    "廣告似乎還沒去除, 追加等待2秒, 剩餘重試次數 "
+                    + str(error_count),
+                    status=1,
                 )
-                sys.exit(1)
-
-        def parse_playlist():
-            playlist_url = ""
-            if self._cfg.use_mobile_api:
-                playlist_url = self._playlist["data"]["src"]
+                events.emit("ad_check_retry", self._sn, remaining=error_count)
+                time.sleep(2)
+                self.__skip_ad()
+                self.__video_start()
+                self.__check_no_ad(error_count=error_count - 1)
             else:
-                playlist_url = self._playlist["src"]
-            f = self.__request(
-                playlist_url,
-                no_cookies=True,
-                addition_header={"origin": "https://ani.gamer.com.tw"},
+                # 通过广告检查
+                if error_count != 10:
+                    ads_time = (10 - error_count) * 2 + self._ad_time + 2
+                    err_print(
+                        self._sn,
+                        "通过廣告時間" + str(ads_time) + "秒, 記錄到配置檔案",
+                        status=2,
+                    )
+                    events.emit(
+                        "ad_time_learned",
+                        self._sn,
+                        ad_time=ads_time,
+                        mobile_api=self._cfg.use_mobile_api,
+                    )
+                    # 只更新 Config 對象並保存
+                    if self._cfg.use_mobile_api:
+                        self._cfg.mobile_ads_time = ads_time
+                    else:
+                        self._cfg.ads_time = ads_time
+                    config.save_config(self._cfg)  # 保存到配置文件
+        else:
+            err_print(
+                self._sn, "遭到動畫瘋地區限制, 你的IP可能不被動畫瘋認可!", status=1
             )
-            url_prefix = re.sub(r"playlist.+", "", playlist_url)  # m3u8 URL 前缀
-            m3u8_list = re.findall(
-                r"=\d+x\d+\n.+", f.content.decode()
-            )  # 将包含分辨率和 m3u8 文件提取
-            m3u8_dict = {}
-            for i in m3u8_list:
-                key = re.findall(r"=\d+x\d+", i)[0]  # 提取分辨率
-                key = re.findall(r"x\d+", key)[0][1:]  # 提取纵向像素数，作为 key
-                value = re.findall(r".*chunklist.+", i)[0]  # 提取 m3u8 文件
-                value = url_prefix + value  # 组成完整的 m3u8 URL
-                m3u8_dict[key] = value
-            self._m3u8_dict = m3u8_dict
-
-        get_device_id()
-        user_info = gain_access()
+            raise AnimeError("遭到動畫瘋地區限制")
+
+    def __parse_playlist(self):
+        playlist_url = ""
+        if self._cfg.use_mobile_api:
+            playlist_url = self._playlist["data"]["src"]
+        else:
+            playlist_url = self._playlist["src"]
+        f = self.__request(
+            playlist_url,
+            no_cookies=True,
+            addition_header={"origin": "https://ani.gamer.com.tw"},
+        )
+        url_prefix = re.sub(r"playlist.+", "", playlist_url)  # m3u8 URL 前缀
+        m3u8_list = re.findall(
+            r"=\d+x\d+\n.+", f.content.decode()
+        )  # 将包含分辨率和 m3u8 文件提取
+        m3u8_dict = {}
+        for i in m3u8_list:
+            key = re.findall(r"=\d+x\d+", i)[0]  # 提取分辨率
+            key = re.findall(r"x\d+", key)[0][1:]  # 提取纵向像素数，作为 key
+            value = re.findall(r".*chunklist.+", i)[0]  # 提取 m3u8 文件
+            value = url_prefix + value  # 组成完整的 m3u8 URL
+            m3u8_dict[key] = value
+        self._m3u8_dict = m3u8_dict
+
+    def __start_playback(self):
+        # 获取播放授权, 非 VIP 时开始播放广告, 返回需要等待的广告秒数
+        self._ad_time = 0
+        self.__get_device_id()
+        user_info = self.__gain_access()
         if not self._cfg.use_mobile_api:
-            unlock()
-            check_lock()
-            unlock()
-            unlock()
+            self.__unlock()
+            self.__check_lock()
+            self.__unlock()
+            self.__unlock()
 
         # 收到錯誤反饋
         # 可能是限制級動畫要求登陸
@@ -708,56 +935,114 @@ class Anime:
                 + user_info["error"]["message"]
             )
             err_print(self._sn, "收到錯誤", msg, status=1)
-            sys.exit(1)
-
-        if not user_info["vip"]:
-            # 如果用户不是 VIP, 那么等待广告(20s)
-            # 20200513 网站更新，最低广告更新时间从8s增加到20s https://github.com/miyouzi/aniGamerPlus/issues/41
-            # 20200806 网站更新，最低广告更新时间从20s增加到25s https://github.com/miyouzi/aniGamerPlus/issues/55
-
-            if self._cfg.only_use_vip:
-                err_print(
-                    self._sn,
-                    "非VIP",
-                    "因為已設定只使用VIP下載，故強制停止",
-                    status=1,
-                    no_sn=True,
-                )
-                sys.exit(1)
-
-            if self._cfg.use_mobile_api:
-                ad_time = self._cfg.mobile_ads_time  # APP解析廣告解析時間不同
-            else:
-                ad_time = self._cfg.ads_time
+            raise AnimeError(msg)
 
+        if user_info["vip"]:
             err_print(
                 self._sn,
-                "正在等待",
-                "《"
-                + self.get_title()
-                + "》 由於不是VIP賬戶, 正在等待"
-                + str(ad_time)
-                + "s廣告時間",
+                "開始下載",
+                "《" + self.get_title() + "》 識別到VIP賬戶, 立即下載",
             )
-            start_ad()
-            time.sleep(ad_time)
-            skip_ad()
-        else:
+            return 0
+
+        # 如果用户不是 VIP, 那么等待广告(20s)
+        # 20200513 网站更新，最低广告更新时间从8s增加到20s https://github.com/miyouzi/aniGamerPlus/issues/41
+        # 20200806 网站更新，最低广告更新时间从20s增加到25s https://github.com/miyouzi/aniGamerPlus/issues/55
+
+        if self._cfg.only_use_vip:
             err_print(
                 self._sn,
-                "開始下載",
-                "《" + self.get_title() + "》 識別到VIP賬戶, 立即下載",
+                "非VIP",
+                "因為已設定只使用VIP下載，故強制停止",
+                status=1,
+                no_sn=True,
             )
+            raise AnimeError("非VIP賬戶, 已設定只使用VIP下載")
 
+        if self._cfg.use_mobile_api:
+            self._ad_time = self._cfg.mobile_ads_time  # APP解析廣告解析時間不同
+        else:
+            self._ad_time = self._cfg.ads_time
+
+        err_print(
+            self._sn,
+            "正在等待",
+            "《"
+            + self.get_title()
+            + "》 由於不是VIP賬戶, 正在等待"
+            + str(self._ad_time)
+            + "s廣告時間",
+        )
+        self.__start_ad()
+        self._ad_started_at = time.monotonic()
+        events.emit("ad_wait_started", self._sn, seconds=self._ad_time)
+        return self._ad_time
+
+    def __finish_playback(self):
+        # 广告结束后获取 m3u8 列表
+        if self._ad_time:
+            self.__skip_ad()
         if not self._cfg.use_mobile_api:
-            video_start()
-            check_no_ad()
-        get_playlist()
-        parse_playlist()
+            self.__video_start()
+            self.__check_no_ad()
+        if self._ad_started_at is not None:
+            # 实际等待时间, 含广告检查失败后的追加等待
+            metrics.AD_WAIT_SECONDS.observe(time.monotonic() - self._ad_started_at)
+            self._ad_started_at = None
+        self.__get_playlist()
+        self.__parse_playlist()
+
+    def __get_m3u8_dict(self, cooldown=True):
+        # 一次完成冷却、广告等待及 m3u8 列表获取; 已由 prepare_playback() 推进的阶段不再重复
+        while True:
+            wait = self.prepare_playback(cooldown)
+            if wait <= 0:
+                break
+            time.sleep(wait)
+        self.__finish_playback()
+        self._playback_ready_at = None  # 再次获取时重新走完整流程
+        self._ad_ready_at = None
+
+    def prepare_playback(self, cooldown=True):
+        """推進下載前的等待階段，本身不等待。
+
+        依次預約下載冷卻、獲取播放授權並開始播放廣告。返回值大於 0 時，呼叫端可先處理
+        其他工作，到時再次呼叫。
+
+        Args:
+            cooldown: 是否遵守下載冷卻，僅查詢資訊時不需要
+
+        Returns:
+            float: 還需等待的秒數，0 表示可以開始下載
+        """
+        self.__ensure_metadata()
+        now = time.monotonic()
+        if self._playback_ready_at is None:
+            # 下载冷却: 与上一集的播放授权请求至少间隔 download_cd 秒
+            wait = get_playback_limiter().reserve("ani.gamer.com.tw") if cooldown else 0
+            self._playback_ready_at = now + wait
+            if wait > 0:
+                err_print(self._sn, "下載冷卻", f"等待 {wait:.0f} 秒後開始解析")
+                self.__set_waiting_status("下載冷卻中")
+
+        if self._ad_ready_at is None:
+            if now < self._playback_ready_at:
+                return self._playback_ready_at - now
+            self.__set_waiting_status("正在解析")
+            ad_time = self.__start_playback()
+            self._ad_ready_at = time.monotonic() + ad_time
+            if ad_time > 0:
+                self.__set_waiting_status("等待廣告")
+
+        return max(0.0, self._ad_ready_at - time.monotonic())
+
+    def __set_waiting_status(self, status):
+        # 在面板显示下载前的等待阶段, 仅更新已有的进度条目
+        progress.update_task(self._sn, status=status)
 
     def get_m3u8_dict(self):
         if not self._m3u8_dict:
-            self.__get_m3u8_dict()
+            self.__get_m3u8_dict(cooldown=False)
         return self._m3u8_dict
 
     def get_season_num(self, zh_num):
@@ -889,7 +1174,7 @@ class Anime:
         temp_filename = config.legalize_filename(temp_filename)
         return temp_filename
 
-    def __segment_download_mode(self, resolution=""):
+    def __segment_download_mode(self, resolution="", merge=True):
         # 设定文件存放路径
         filename = self.__get_filename(resolution)
         merging_filename = self.__get_temp_filename(resolution, temp_suffix="MERGING")
@@ -897,199 +1182,37 @@ class Anime:
         output_file = os.path.join(self._bangumi_dir, filename)  # 完整输出路径
         merging_file = os.path.join(self._temp_dir, merging_filename)
 
-        url_path = os.path.split(self._m3u8_dict[resolution])[
-            0
-        ]  # 用于构造完整 chunk 链接
-        temp_dir = os.path.join(
-            self._temp_dir, str(self._sn) + "-downloading-by-aniGamerPlus"
-        )  # 临时目录以 sn 命令
-        if not os.path.exists(temp_dir):  # 创建临时目录
-            os.makedirs(temp_dir)
-        m3u8_path = os.path.join(temp_dir, str(self._sn) + ".m3u8")  # m3u8 存放位置
-        m3u8_text = self.__request(
-            self._m3u8_dict[resolution], no_cookies=True
-        ).text  # 请求 m3u8 文件
-        with open(m3u8_path, "w", encoding="utf-8") as f:  # 保存 m3u8 文件在本地
-            f.write(m3u8_text)
-            pass
-        key_match = re.search(r'(?<=AES-128,URI=")(.*)(?=")', m3u8_text)
-        if not key_match:
-            raise ValueError(f"無法從 m3u8 文件中提取 key URI: {m3u8_text[:200]}")
-        key_uri = key_match.group()  # 把 key 的链接提取出来
-        original_key_uri = key_uri
-
-        if not re.match(r"http.+", key_uri):
-            # https://github.com/miyouzi/aniGamerPlus/issues/46
-            # 如果不是完整的URI
-            key_uri = url_path + "/" + key_uri  # 组成完成的 URI
-
-        m3u8_key_path = os.path.join(temp_dir, "key.m3u8key")  # key 的存放位置
-        with open(m3u8_key_path, "wb") as f:  # 保存 key
-            f.write(self.__request(key_uri, no_cookies=True).content)
-
-        chunk_list = re.findall(r"media_b.+ts.*", m3u8_text)  # chunk
-
-        limiter = threading.Semaphore(
-            self._cfg.multi_downloading_segment
-        )  # chunk 并发下载限制器
-        total_chunk_num = len(chunk_list)
-        finished_chunk_counter = 0
-        failed_flag = False
-
-        def download_chunk(uri):
-            chunk_name = re.findall(r"media_b.+ts", uri)[0]  # chunk 文件名
-            chunk_local_path = os.path.join(temp_dir, chunk_name)  # chunk 路径
-            nonlocal failed_flag
-
-            try:
-                with open(chunk_local_path, "wb") as f:
-                    f.write(
-                        self.__request(
-                            uri,
-                            no_cookies=True,
-                            show_fail=False,
-                            max_retry=self._cfg.segment_max_retry,
-                        ).content
-                    )
-            except TryTooManyTimeError:
-                failed_flag = True
-                err_print(self._sn, "下載狀態", "Bad segment=" + chunk_name, status=1)
-                limiter.release()
-                sys.exit(1)
-            except BaseException as e:
-                failed_flag = True
-                err_print(
-                    self._sn,
-                    "下載狀態",
-                    "Bad segment=" + chunk_name + " 發生未知錯誤: " + str(e),
-                    status=1,
-                )
-                limiter.release()
-                sys.exit(1)
-
-            # 显示完成百分比
-            nonlocal finished_chunk_counter
-            finished_chunk_counter = finished_chunk_counter + 1
-            progress_rate = float(finished_chunk_counter / total_chunk_num * 100)
-            progress_rate = round(progress_rate, 2)
-            config.tasks_progress_rate[int(self._sn)]["rate"] = progress_rate
-
-            if self.realtime_show_file_size:
-                sys.stdout.write(
-                    "\r正在下載: sn="
-                    + str(self._sn)
-                    + " "
-                    + filename
-                    + " "
-                    + str(progress_rate)
-                    + "%  "
-                )
-                sys.stdout.flush()
-            limiter.release()
-
-        if self.realtime_show_file_size:
-            # 是否实时显示文件大小, 设计仅 cui 下载单个文件或线程数=1时适用
-            sys.stdout.write("正在下載: sn=" + str(self._sn) + " " + filename)
-            sys.stdout.flush()
-        else:
-            err_print(self._sn, "正在下載", filename + " title=" + self._title)
-
-        chunk_tasks_list = []
-        for chunk in chunk_list:
-            chunk_uri = url_path + "/" + chunk
-            task = threading.Thread(target=download_chunk, args=(chunk_uri,))
-            chunk_tasks_list.append(task)
-            task.daemon = True
-            limiter.acquire()
-            task.start()
-
-        for task in chunk_tasks_list:  # 等待所有任務完成
-            while True:
-                if failed_flag:
-                    err_print(self._sn, "下載失败", filename, status=1)
-                    self.video_size = 0
-                    return
-                if task.is_alive():
-                    time.sleep(1)
-                else:
-                    break
-
-        # m3u8 本地化
-        # replace('\\', '\\\\') 为转义win路径
-        m3u8_text_local_version = m3u8_text.replace(
-            original_key_uri, os.path.join(temp_dir, "key.m3u8key")
-        ).replace("\\", "\\\\")
-        for chunk in chunk_list:
-            chunk_filename = re.findall(r"media_b.+ts", chunk)[0]  # chunk 文件名
-            chunk_path = os.path.join(temp_dir, chunk_filename).replace(
-                "\\", "\\\\"
-            )  # chunk 本地路径
-            m3u8_text_local_version = m3u8_text_local_version.replace(chunk, chunk_path)
-        with open(m3u8_path, "w", encoding="utf-8") as f:  # 保存本地化的 m3u8
-            f.write(m3u8_text_local_version)
-
-        if self.realtime_show_file_size:
-            sys.stdout.write("\n")
-            sys.stdout.flush()
-        err_print(self._sn, "下載狀態", filename + " 下載完成, 正在解密合并……")
-        config.tasks_progress_rate[int(self._sn)]["status"] = "下載完成"
-
-        # 构造 ffmpeg 命令
-        ffmpeg_cmd = [
-            self._ffmpeg_path,
-            "-allowed_extensions",
-            "ALL",
-            "-i",
-            m3u8_path,
-            "-c",
-            "copy",
-            merging_file,
-            "-y",
-        ]
-
-        if self._cfg.faststart_movflags:
-            # 将 metadata 移至视频文件头部
-            # 此功能可以更快的在线播放视频
-            ffmpeg_cmd[7:7] = iter(["-movflags", "faststart"])
-
-        if self._cfg.audio_language:
-            if self._title.find("中文") == -1:
-                ffmpeg_cmd[7:7] = iter(["-metadata:s:a:0", "language=jpn"])
-            else:
-                ffmpeg_cmd[7:7] = iter(["-metadata:s:a:0", "language=chi"])
-
-        # 执行 ffmpeg
-        run_ffmpeg = subprocess.Popen(
-            ffmpeg_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-        )
-        run_ffmpeg.communicate()
-        # 记录文件大小，单位为 MB
-        self.video_size = int(os.path.getsize(merging_file) / float(1024 * 1024))
-        # 重命名
-        err_print(
+        # 分段下载交由 SegmentDownloader, chunk 由全局分段线程池并发下载
+        http_client = HttpClient(self._sn, self._cfg)
+        http_client.set_proxies(self._proxies)
+        http_client.init_headers(use_mobile=self._cfg.use_mobile_api)
+        downloader = SegmentDownloader(
             self._sn,
-            "下載狀態",
-            filename
-            + " 解密合并完成, 本集 "
-            + str(self.video_size)
-            + "MB, 正在移至番劇目錄……",
+            http_client,
+            self._cfg,
+            self._m3u8_dict[resolution],
+            output_file,
+            merging_file,
+            filename,
         )
-        if os.path.exists(output_file):
-            os.remove(output_file)
-
-        if self._cfg.use_copyfile_method:
-            shutil.copyfile(merging_file, output_file)  # 适配rclone挂载盘
-            os.remove(merging_file)  # 刪除临时合并文件
-        else:
-            shutil.move(merging_file, output_file)  # 此方法在遇到rclone挂载盘时会出错
-
-        # 删除临时目录
-        shutil.rmtree(temp_dir, ignore_errors=True)
+        downloader.set_title(self._title)
+        downloader.set_ffmpeg_path(self._ffmpeg_path)
+        # 是否实时显示进度, 设计仅 cui 下载单个文件或线程数=1时适用
+        downloader.realtime_show = self.realtime_show_file_size
 
-        self.local_video_path = output_file  # 记录保存路径, FTP上传用
-        self._video_filename = filename  # 记录文件名, FTP上传用
-
-        err_print(self._sn, "下載完成", filename, status=2)
+        try:
+            succeed = downloader.download(merge=merge)
+        finally:
+            http_client.close()
+
+        self.video_size = downloader.video_size
+        self.chunk_count = downloader.chunk_count
+        if succeed and downloader.needs_finalize:
+            # 分段已下载, 合并由 finalize() 执行
+            self._pending_finalize = (downloader, output_file, filename)
+        elif succeed:
+            self.local_video_path = output_file  # 记录保存路径, FTP上传用
+            self._video_filename = filename  # 记录文件名, FTP上传用
 
     def __ffmpeg_download_mode(self, resolution=""):
         # 设定文件存放路径
@@ -1123,6 +1246,8 @@ class Anime:
         run_ffmpeg = subprocess.Popen(
             ffmpeg_cmd, stdout=subprocess.PIPE, bufsize=204800, stderr=subprocess.PIPE
         )
+        throttle = ProcessThrottle(self._sn, run_ffmpeg, downloading_file)  # 频宽限制
+        throttle.start()
 
         def check_ffmpeg_alive():
             # 应对ffmpeg卡死, 资源限速等，若 1min 中内文件大小没有增加超过 3M, 则判定卡死
@@ -1167,7 +1292,8 @@ class Anime:
                 if time_counter % 60 == 0 and os.path.exists(downloading_file):
                     temp_file_size = os.path.getsize(downloading_file)
                     a = temp_file_size - pre_temp_file_size
-                    if a < (3 * 1024 * 1024):
+                    # 因频宽限制暂停过的不算卡死
+                    if a < (3 * 1024 * 1024) and not throttle.paused_within(60):
                         err_msg_detail = (
                             downloading_filename
                             + " 在一分钟内仅增加"
@@ -1198,9 +1324,9 @@ class Anime:
             if os.path.exists(output_file):
                 os.remove(output_file)
             # 记录文件大小，单位为 MB
-            self.video_size = int(
-                os.path.getsize(downloading_file) / float(1024 * 1024)
-            )
+            downloaded_bytes = os.path.getsize(downloading_file)
+            metrics.DOWNLOADED_BYTES.inc(downloaded_bytes)
+            self.video_size = int(downloaded_bytes / float(1024 * 1024))
             err_print(
                 self._sn,
                 "下載狀態",
@@ -1236,7 +1362,10 @@ class Anime:
         realtime_show_file_size=False,
         rename="",
         classify=True,
+        defer_finalize=False,
     ):
+        # defer_finalize: 分段下载完成即返回, 合并及通知由调用方通过 finalize() 和 notify() 执行
+        self.__ensure_metadata()
         self.realtime_show_file_size = realtime_show_file_size
         if not resolution:
             resolution = self._cfg.download_resolution
@@ -1269,11 +1398,7 @@ class Anime:
             self._bangumi_name = self._bangumi_name.replace(bangumi_name, rename)
 
         # 下载任務开始
-        config.tasks_progress_rate[int(self._sn)] = {
-            "rate": 0,
-            "filename": "《" + self.get_title() + "》",
-            "status": "正在解析",
-        }
+        progress.start_task(self._sn, "《" + self.get_title() + "》", "正在解析")
 
         try:
             self.__get_m3u8_dict()  # 获取 m3u8 列表
@@ -1281,6 +1406,12 @@ class Anime:
             # 如果在获取 m3u8 过程中发生意外, 则取消此次下载
             err_print(self._sn, "下載狀態", "獲取 m3u8 失敗!", status=1)
             self.video_size = 0
+            self.last_error = "獲取 m3u8 失敗"
+            return
+        except AnimeError as e:
+            # 地区限制, 广告去除失败等, 原因已输出
+            self.video_size = 0
+            self.last_error = str(e)
             return
 
         check_ffmpeg = subprocess.Popen(
@@ -1388,6 +1519,7 @@ class Anime:
                     + "P"
                 )
                 err_print(self._sn, "任務狀態", err_msg_detail, status=1)
+                self.last_error = "指定清晰度不存在"
                 return
 
             resolution_list = map(lambda x: int(x), self._m3u8_dict.keys())
@@ -1407,23 +1539,66 @@ class Anime:
         self.video_resolution = int(resolution)
 
         # 解析完成, 开始下载
-        config.tasks_progress_rate[int(self._sn)]["status"] = "正在下載"
-        config.tasks_progress_rate[int(self._sn)]["filename"] = self.get_filename()
+        progress.update_task(self._sn, status="正在下載", filename=self.get_filename())
 
+        download_start = time.monotonic()
         if self._cfg.segment_download_mode:
-            self.__segment_download_mode(resolution)
+            self.__segment_download_mode(resolution, merge=not defer_finalize)
         else:
             self.__ffmpeg_download_mode(resolution)
+        self.download_duration = round(time.monotonic() - download_start, 2)
+
+        if self._pending_finalize is not None:
+            progress.update_task(self._sn, status="等待合并")
+            return
+        if not self.local_video_path:
+            # 下载失败, 由调用方标记等待重试或记录为失败任务
+            return
+
+        self.__complete_download()
+        if not defer_finalize:
+            self.notify()
+
+    def needs_finalize(self):
+        # 是否有 download(defer_finalize=True) 留下的待合并分段
+        return self._pending_finalize is not None
+
+    def finalize(self):
+        # 合并 download(defer_finalize=True) 留下的分段, 返回是否成功; 没有待合并的分段时直接返回 True
+        if self._pending_finalize is None:
+            return True
+        downloader, output_file, filename = self._pending_finalize
+        self._pending_finalize = None
+
+        succeed = downloader.finalize()
+        self.video_size = downloader.video_size
+        if not succeed:
+            return False
+        self.local_video_path = output_file  # 记录保存路径, FTP上传用
+        self._video_filename = filename  # 记录文件名, FTP上传用
+        self.__complete_download()
+        return True
 
+    def __complete_download(self):
         # 任務完成, 记录到已完成列表并从进度表中删除
-        config.record_completed_task(int(self._sn), self.get_filename(), "success")
-        del config.tasks_progress_rate[int(self._sn)]
+        progress.finish_task(self._sn, "success", self.get_filename())
+        events.emit(
+            "download_finished",
+            self._sn,
+            duration=self.download_duration,
+            bytes=os.path.getsize(self.local_video_path),
+            chunks=self.chunk_count,
+            resolution=self.video_resolution,
+            segment_mode=self._cfg.segment_download_mode,
+        )
 
+    def notify(self):
+        # 下载完成后下载弹幕并推送通知
         # 下載彈幕
         if self._danmu:
             try:
                 full_filename = os.path.join(
-                    self._bangumi_dir, self.__get_filename(resolution)
+                    self._bangumi_dir, self.get_filename()
                 ).replace("." + self._cfg.video_filename_extension, ".ass")
                 d = Danmu(self._sn, full_filename, config.read_cookie())
                 d.download(self._cfg.danmu_ban_words)
@@ -1548,7 +1723,8 @@ class Anime:
                         }
                     ],
                 }
-                r = httpx.post(url, json=data)
+                with create_client() as client:
+                    r = client.post(url, json=data)
                 if r.status_code != 204:
                     err_print(
                         self._sn,
@@ -1572,7 +1748,8 @@ class Anime:
                     plex_section=self._cfg.plex_section,
                     plex_token=self._cfg.plex_token,
                 )
-                r = httpx.get(url)
+                with create_client() as client:
+                    r = client.get(url)
                 if r.status_code != 200:
                     err_print(self._sn, "Plex auto Refresh ERROR", status=1)
             except Exception as e:
@@ -1596,6 +1773,8 @@ class Anime:
         if not self._video_filename:  # 用于仅上传, 将文件名提取出来
             self._video_filename = os.path.split(self.local_video_path)[-1]
 
+        self.__ensure_metadata()  # 由数据库记录建立时无需请求页面
+
         socket.setdefaulttimeout(20)  # 超时时间20s
 
         if self._cfg.ftp.tls:
@@ -1756,6 +1935,7 @@ class Anime:
             self._sn, "正在上傳", self._video_filename + " title=" + self._title + "……"
         )
         try_counter = 0
+        upload_start = time.monotonic()
         video_filename = (
             self._video_filename
         )  # video_filename 将可能会储存 pure-ftpd 缓存文件名
@@ -1765,6 +1945,8 @@ class Anime:
             try:
                 if try_counter > 0:
                     # 传输遭中断后处理
+                    metrics.UPLOAD_RETRIES.inc()
+                    events.emit("ftp_retry", self._sn, attempt=try_counter)
                     detail = (
                         self._video_filename
                         + " 发生异常, 重連FTP, 續傳文件, 將重試最多"
@@ -1807,7 +1989,9 @@ class Anime:
                     f.seek(ftp_binary_size)  # 从断点处开始读取
                     while True:
                         block = f.read(1048576)  # 读取1M
+                        get_upload_limiter().consume(len(block))  # 频宽限制
                         conn.sendall(block)  # 送出 block
+                        metrics.UPLOADED_BYTES.inc(len(block))
                         if not block:
                             time.sleep(3)  # 等待一下, 让sendall()完成
                             break
@@ -1879,6 +2063,7 @@ class Anime:
                 break
 
             except ConnectionResetError as e:
+                events.emit("ftp_error", self._sn, attempt=try_counter, error=e)
                 if self._cfg.ftp.show_error_detail:
                     detail = (
                         self._video_filename
@@ -1891,6 +2076,7 @@ class Anime:
                     err_print(self._sn, "上傳狀態", detail, status=1)
                 try_counter = try_counter + 1
             except TimeoutError as e:
+                events.emit("ftp_error", self._sn, attempt=try_counter, error=e)
                 if self._cfg.ftp.show_error_detail:
                     detail = (
                         self._video_filename
@@ -1902,6 +2088,7 @@ class Anime:
                     err_print(self._sn, "上傳狀態", detail, status=1)
                 try_counter = try_counter + 1
             except socket.timeout as e:
+                events.emit("ftp_error", self._sn, attempt=try_counter, error=e)
                 if self._cfg.ftp.show_error_detail:
                     detail = (
                         self._video_filename
@@ -1917,10 +2104,19 @@ class Anime:
             err_print(
                 self._sn, "上傳失敗", self._video_filename + " 放棄上傳!", status=1
             )
+            events.emit("upload_failed", self._sn, attempts=try_counter)
             exit_ftp()
             return self.upload_succeed_flag
 
         err_print(self._sn, "上傳完成", self._video_filename, status=2)
+        metrics.UPLOAD_SECONDS.observe(time.monotonic() - upload_start)
+        events.emit(
+            "upload_finished",
+            self._sn,
+            bytes=local_size,
+            duration=round(time.monotonic() - upload_start, 3),
+            attempts=try_counter + 1,
+        )
         exit_ftp()  # 登出 FTP
         return self.upload_succeed_flag
 
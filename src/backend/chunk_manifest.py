@@ -0,0 +1,177 @@
+"""分段清單模組。
+
+在分段臨時目錄中記錄每個分段的下載狀態，使中斷的任務重新開始時只需下載
+缺失或損壞的分段，並提供過期臨時目錄的清理。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+from .color_print import err_print
+
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_VERSION = 2
+CHUNK_DIR_SUFFIX = "-downloading-by-aniGamerPlus"
+
+
+def chunk_checksum(data: bytes) -> str:
+    """計算分段校驗值。
+
+    Args:
+        data: 分段內容
+
+    Returns:
+        SHA-1 十六進位字串
+    """
+    return hashlib.sha1(data).hexdigest()
+
+
+class ChunkManifest:
+    """分段下載清單。
+
+    清單以 JSON 保存於分段臨時目錄，記錄每個分段的索引、大小、校驗值及是否完成，
+    以及分段所屬的金鑰及播放列表序號。分段以該金鑰加密，金鑰改變後舊分段無法解密。
+    """
+
+    def __init__(
+        self,
+        temp_dir: Path,
+        chunk_names: list[str],
+        key_sha1: str = "",
+        media_sequence: int | None = None,
+    ) -> None:
+        """初始化清單並載入既有紀錄。
+
+        若既有清單的分段列表、金鑰或播放列表序號與本次不同（例如解析度改變、
+        金鑰更換），則舊紀錄作廢。
+
+        Args:
+            temp_dir: 分段臨時目錄
+            chunk_names: 本次播放列表的分段檔名
+            key_sha1: 本次金鑰的 SHA-1
+            media_sequence: 本次播放列表的 ``EXT-X-MEDIA-SEQUENCE``
+        """
+        self._temp_dir = temp_dir
+        self._path = temp_dir / MANIFEST_FILENAME
+        self._chunk_names = chunk_names
+        self._key_sha1 = key_sha1
+        self._media_sequence = media_sequence
+        self._chunks: dict[str, dict] = {}
+        self._dirty = 0
+        self._load()
+
+    def _load(self) -> None:
+        """載入既有清單。"""
+        try:
+            data = json.loads(self._path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+
+        if (
+            data.get("version") != MANIFEST_VERSION
+            or data.get("chunk_names") != list(self._chunk_names)
+            or data.get("key_sha1") != self._key_sha1
+            or data.get("media_sequence") != self._media_sequence
+        ):
+            return
+
+        self._chunks = data.get("chunks", {})
+
+    def completed_indexes(self) -> set[int]:
+        """校驗既有分段並返回已完成的索引。
+
+        分段檔案缺失、大小不符或校驗值不符者視為未完成。
+
+        Returns:
+            已完成且檔案完好的分段索引
+        """
+        completed = set()
+        for index, name in enumerate(self._chunk_names):
+            entry = self._chunks.get(name)
+            if not entry or not entry.get("completed"):
+                continue
+
+            chunk_path = self._temp_dir / name
+            try:
+                if chunk_path.stat().st_size != entry["size"]:
+                    raise ValueError
+                if chunk_checksum(chunk_path.read_bytes()) != entry["sha1"]:
+                    raise ValueError
+            except (OSError, ValueError):
+                del self._chunks[name]
+                continue
+
+            completed.add(index)
+        return completed
+
+    def mark_completed(self, index: int, name: str, size: int, sha1: str) -> None:
+        """記錄分段完成，每累積若干筆寫入一次磁碟。
+
+        Args:
+            index: 分段索引
+            name: 分段檔名
+            size: 分段大小
+            sha1: 分段校驗值
+        """
+        self._chunks[name] = {
+            "index": index,
+            "size": size,
+            "sha1": sha1,
+            "completed": True,
+        }
+        self._dirty += 1
+        if self._dirty >= 20:
+            self.save()
+
+    def save(self) -> None:
+        """寫入清單。"""
+        data = {
+            "version": MANIFEST_VERSION,
+            "updated": int(time.time()),
+            "chunk_names": self._chunk_names,
+            "key_sha1": self._key_sha1,
+            "media_sequence": self._media_sequence,
+            "chunks": self._chunks,
+        }
+        tmp_path = self._path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp_path, self._path)
+        self._dirty = 0
+
+
+def cleanup_stale_chunk_dirs(temp_root: Path, expire_hours: float) -> None:
+    """清理過期的分段臨時目錄。
+
+    以清單（若無則以目錄）的最後修改時間判斷，超過 ``expire_hours`` 未更新者刪除。
+
+    Args:
+        temp_root: 臨時目錄根路徑
+        expire_hours: 過期時數，小於等於 0 時不清理
+    """
+    if expire_hours <= 0 or not temp_root.is_dir():
+        return
+
+    deadline = time.time() - expire_hours * 3600
+    for chunk_dir in temp_root.glob(f"*{CHUNK_DIR_SUFFIX}"):
+        manifest_path = chunk_dir / MANIFEST_FILENAME
+        try:
+            target = manifest_path if manifest_path.exists() else chunk_dir
+            if target.stat().st_mtime >= deadline:
+                continue
+        except OSError:
+            continue
+
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+        err_print(
+            0,
+            "清理分段",
+            f"刪除過期分段目錄 {chunk_dir.name}",
+            no_sn=True,
+            display=False,
+        )
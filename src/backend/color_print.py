@@ -1,23 +1,30 @@
 """彩色終端輸出工具模組。
 
 此模組提供彩色終端輸出和日誌記錄功能，支援 Windows 和 Unix-like 系統。
+日誌由背景線程批次寫入，呼叫 ``err_print`` 的線程不會因磁碟 I/O 而阻塞。
 
 Functions:
     read_log_settings: 讀取日誌配置
     err_print: 列印彩色狀態訊息並記錄到日誌檔案
+    get_log_writer: 獲取全域日誌寫入器
 
 Classes:
+    LogWriter: 背景日誌寫入線程
     WindowsColorPrinter: Windows 主控台彩色輸出工具
 """
 
 from __future__ import annotations
 
+import atexit
 import ctypes
+import functools
 import platform
+import queue
 import subprocess
+import threading
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Literal
+from typing import IO, Any, Literal
 
 from termcolor import cprint
 
@@ -52,6 +59,173 @@ def read_log_settings() -> dict[str, Any]:
 
 log_settings = read_log_settings()
 
+# 日誌佇列容量及每批次最多寫入的行數
+_LOG_QUEUE_SIZE = 10000
+_LOG_BATCH_SIZE = 500
+
+
+class LogWriter:
+    """背景日誌寫入線程。
+
+    日誌行先放入有界佇列，由單一線程批次寫入並 flush。日誌檔案保持開啟，
+    日期變更時切換到新一天的檔案。佇列已滿時丟棄新日誌而不阻塞呼叫端，
+    並在之後記錄丟棄的行數。
+    """
+
+    def __init__(
+        self,
+        logs_dir: Path,
+        capacity: int = _LOG_QUEUE_SIZE,
+        filename: str = "{date}.log",
+    ) -> None:
+        """初始化寫入器，寫入線程在首次寫入時啟動。
+
+        Args:
+            logs_dir: 日誌目錄
+            capacity: 佇列容量
+            filename: 日誌檔名格式，``{date}`` 替換為日期
+        """
+        self._logs_dir = logs_dir
+        self._filename = filename
+        self._queue: queue.Queue[tuple[str, str] | None] = queue.Queue(capacity)
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._dropped = 0
+        self._file: IO[str] | None = None
+        self._file_date = ""
+
+    def write(self, line: str) -> None:
+        """加入一行日誌，不等待寫入完成。
+
+        Args:
+            line: 日誌內容（不含換行）
+        """
+        item = (datetime.now().strftime("%Y-%m-%d"), line)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="log-writer", daemon=True
+                )
+                self._thread.start()
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self._dropped += 1
+
+    def close(self, timeout: float = 5.0) -> None:
+        """寫入佇列中剩餘的日誌並關閉檔案。
+
+        Args:
+            timeout: 最長等待秒數
+        """
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
+
+    def _run(self) -> None:
+        """寫入線程主循環。"""
+        while True:
+            batch = [self._queue.get()]
+            while batch[-1] is not None and len(batch) < _LOG_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self._write_batch(batch)
+            except Exception:
+                # 寫入失敗時丟棄本批次，避免影響程序運行
+                self._close_file()
+
+            if batch[-1] is None:
+                self._close_file()
+                return
+
+    def _write_batch(self, batch: list[tuple[str, str] | None]) -> None:
+        """寫入一批日誌並 flush。"""
+        with self._lock:
+            dropped, self._dropped = self._dropped, 0
+        if dropped:
+            date = datetime.now().strftime("%Y-%m-%d")
+            batch.insert(0, (date, f"日誌佇列已滿, 丟棄 {dropped} 行日誌"))
+
+        for item in batch:
+            if item is None:
+                break
+            date, line = item
+            if date != self._file_date or self._file is None:
+                self._open_file(date)
+            assert self._file is not None
+            self._file.write(line + "\n")
+
+        if self._file is not None:
+            self._file.flush()
+
+    def _open_file(self, date: str) -> None:
+        """切換到指定日期的日誌檔案。"""
+        self._close_file()
+        self._logs_dir.mkdir(parents=True, exist_ok=True)
+        self._file = (self._logs_dir / self._filename.format(date=date)).open(
+            "a", encoding="utf-8", errors="replace"
+        )
+        self._file_date = date
+
+    def _close_file(self) -> None:
+        """關閉當前日誌檔案。"""
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+        self._file = None
+        self._file_date = ""
+
+
+_log_writer: LogWriter | None = None
+_log_writer_lock = threading.Lock()
+
+
+def get_log_writer() -> LogWriter:
+    """獲取全域日誌寫入器，首次呼叫時建立並在程序結束時寫完剩餘日誌。
+
+    Returns:
+        LogWriter: 所有線程共用的寫入器
+    """
+    global _log_writer
+    with _log_writer_lock:
+        if _log_writer is None:
+            _log_writer = LogWriter(Path(config.get_working_dir()) / "logs")
+            atexit.register(_log_writer.close)
+        return _log_writer
+
+
+@functools.lru_cache(maxsize=1)
+def _windows_console() -> WindowsColorPrinter | None:
+    """檢測是否需要以 Windows API 輸出彩色文字，結果只檢測一次。
+
+    Returns:
+        Windows 主控台時為 WindowsColorPrinter，否則為 None（使用 ANSI 顏色）
+    """
+    if "Windows" not in platform.system():
+        return None
+    try:
+        check_tty = subprocess.run(
+            "tty", shell=True, capture_output=True, check=False
+        )
+    except OSError:
+        return None
+    if check_tty.stdout.decode("utf-8").rstrip() in ("/dev/cons0", ""):
+        return WindowsColorPrinter()
+    return None
+
 
 def err_print(
     sn: int | str,
@@ -82,21 +256,8 @@ def err_print(
 
     def succeed_or_failed_print(msg: str, green: bool) -> None:
         """Print colored text for success/failure."""
-        check_tty = subprocess.Popen(
-            "tty",
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-        if not check_tty.stdout:
-            return
-        check_tty_return_str = check_tty.stdout.read().decode("utf-8").rstrip()
-
-        if "Windows" in platform.system() and check_tty_return_str in (
-            "/dev/cons0",
-            "",
-        ):
-            color_printer = WindowsColorPrinter()
+        color_printer = _windows_console()
+        if color_printer is not None:
             if green:
                 color_printer.print_green_text(msg)
             else:
@@ -126,19 +287,9 @@ def err_print(
         else:  # status == 2
             succeed_or_failed_print(msg, green=True)
 
-    # Write to log file
+    # Write to log file (background thread)
     if log_settings.get("save_logs", True):
-        try:
-            logs_dir = Path(config.get_working_dir()) / "logs"
-            logs_dir.mkdir(parents=True, exist_ok=True)
-
-            log_path = logs_dir / f"{datetime.now().strftime('%Y-%m-%d')}.log"
-            # Use append mode to avoid reading existing content
-            with log_path.open("a", encoding="utf-8", errors="replace") as f:
-                f.write(msg + "\n")
-        except Exception:
-            # Silently ignore log writing errors to prevent cascading failures
-            pass
+        get_log_writer().write(msg)
 
 
 class WindowsColorPrinter:
@@ -0,0 +1,115 @@
+"""自適應並發控制模組。
+
+依分段下載實測的吞吐量動態調整同時進行中的分段數（AIMD）。
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+
+import httpx
+
+# 觸發退避的 HTTP 狀態碼
+_BACKOFF_STATUS = {429, 500, 502, 503, 504}
+
+
+def is_congestion_error(exc: BaseException) -> bool:
+    """判斷異常是否代表伺服器或網路壅塞。
+
+    Args:
+        exc: 請求異常
+
+    Returns:
+        是否為 429/5xx 或超時
+    """
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in _BACKOFF_STATUS
+    return isinstance(exc, (httpx.TimeoutException, httpx.NetworkError))
+
+
+class AdaptiveConcurrency:
+    """AIMD 分段並發控制器。
+
+    以「一輪」（完成數等於當前窗口大小的分段）為單位量測吞吐量：吞吐量未下降時
+    窗口加一，明顯下降時減一；遇到 429/5xx 或超時則窗口減半，每輪至多減半一次。
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int) -> None:
+        """初始化控制器。
+
+        Args:
+            initial: 初始窗口
+            minimum: 窗口下限
+            maximum: 窗口上限
+        """
+        self._min = max(1, minimum)
+        self._max = max(self._min, maximum)
+        self._window = float(min(max(initial, self._min), self._max))
+        self._lock = threading.Lock()
+
+        self._round_start = time.monotonic()
+        self._round_bytes = 0
+        self._round_count = 0
+        self._last_rate = 0.0
+        self._last_backoff = 0.0
+        self.throughput = 0.0  # bytes/s，指數移動平均
+
+    def limit(self) -> int:
+        """返回當前窗口大小，供線程池補充任務時查詢。
+
+        Returns:
+            允許同時進行中的分段數
+        """
+        return int(self._window)
+
+    def on_success(self, size: int) -> None:
+        """記錄一個分段下載成功。
+
+        Args:
+            size: 分段大小（位元組）
+        """
+        with self._lock:
+            self._round_bytes += size
+            self._round_count += 1
+            if self._round_count < math.ceil(self._window):
+                return
+
+            now = time.monotonic()
+            elapsed = max(now - self._round_start, 1e-3)
+            rate = self._round_bytes / elapsed
+            self.throughput = (
+                rate if self.throughput == 0 else 0.7 * self.throughput + 0.3 * rate
+            )
+
+            if rate >= self._last_rate * 0.95:
+                self._window = min(self._window + 1, self._max)
+            elif rate < self._last_rate * 0.8:
+                self._window = max(self._window - 1, self._min)
+
+            self._last_rate = rate
+            self._round_start = now
+            self._round_bytes = 0
+            self._round_count = 0
+
+    def on_failure(self, exc: BaseException) -> None:
+        """記錄一次請求失敗，壅塞類錯誤時窗口減半。
+
+        Args:
+            exc: 請求異常
+        """
+        if not is_congestion_error(exc):
+            return
+
+        with self._lock:
+            if self._last_backoff >= self._round_start:
+                # 本輪已退避過
+                return
+            now = time.monotonic()
+            self._window = max(self._window / 2, self._min)
+            self._last_backoff = now
+            self._last_rate = 0.0
+            self._round_start = now
+            self._round_bytes = 0
+            self._round_count = 0
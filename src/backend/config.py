@@ -9,10 +9,10 @@ from pathlib import Path
 from urllib.parse import quote
 
 import chardet
-import httpx
 
 from .config_manager import load_config, save_config
 from .schema import Config, Settings
+from .transport import create_client
 
 # 你猜猜看我是 .exe 或是 .py 檔案
 if getattr(sys, "frozen", False):
@@ -29,22 +29,16 @@ aniGamerPlus_version = "v24.6"
 cookie = None
 max_multi_thread = 5
 max_multi_downloading_segment = 5
-tasks_progress_rate = {}  # 储存任务进度, 供面板使用,
+max_segment_concurrency = 10  # 自適應並發上限
+tasks_progress_rate = {}  # 储存任务进度, 供面板使用, 经由 progress 模块修改以推送变化
 # 格式: {sn: {'rate': 任務进度百分比(float), 'status': 任務状态, 'filename': 文件名} }
-# 任務状态有:  '正在下載' '正在解密合并' '正在移至番劇目錄' '任務失敗, 等待重啓' '等待下載'
+# 任務状态有:  '正在下載' '正在解密合并' '正在移至番劇目錄' '失敗! 等待重試'
+# 等待中的任務由任務調度器提供, 見 get_task_queue_info()
 
 # 已完成任務記錄（供 Dashboard 顯示）
 completed_tasks = {}  # 储存已完成的任務, 格式: {sn: {'filename': str, 'completion_time': str, 'status': 'success'|'failed'}}
 _completed_tasks_lock = None  # 線程鎖，確保並發安全
 
-# 任務佇列資訊（由 ani_gamer_next 模組設置）
-_task_queue_ref = None  # 儲存對 ani_gamer_next.queue 的引用
-_processing_queue_ref = None  # 儲存對 ani_gamer_next.processing_queue 的引用
-
-# 手動任務佇列（用於 Dashboard 手動下載）
-manual_task_queue = {}  # 格式: {sn: {"filename": str, "mode": str, "started": bool}}
-_manual_task_lock = None  # 線程鎖
-
 # 全局配置對象
 _global_config: Config | None = None
 
@@ -219,6 +213,11 @@ def get_settings(skip_dashboard_check: bool = False) -> Settings:
         overrides["multi_downloading_segment"] = min(
             cfg.multi_downloading_segment, max_multi_downloading_segment
         )
+        overrides["segment_concurrency_min"] = max(cfg.segment_concurrency_min, 1)
+        overrides["segment_concurrency_max"] = min(
+            max(cfg.segment_concurrency_max, overrides["segment_concurrency_min"]),
+            max_segment_concurrency,
+        )
 
         # 防呆處理：影片格式
         if cfg.video_filename_extension.lower() == "flv":
@@ -545,7 +544,7 @@ def read_latest_version_on_github():
     req = "https://api.github.com/repos/miyouzi/aniGamerPlus/releases/latest"
     remote_version = {}
     try:
-        with httpx.Client() as client:
+        with create_client() as client:
             response = client.get(req, timeout=3)
             latest_releases_info = response.json()
             remote_version["tag_name"] = latest_releases_info["tag_name"]
@@ -560,14 +559,20 @@ def read_latest_version_on_github():
 
 def __remove_superfluous_logs(max_num):
     if logs_dir.exists():
-        logs_list = [x.name for x in logs_dir.iterdir() if "web" not in x.name]
-        if len(logs_list) > max_num:
-            logs_list.sort()
-            logs_need_remove = logs_list[0 : len(logs_list) - max_num]
-            for log in logs_need_remove:
-                log_path = logs_dir / log
-                log_path.unlink()
-                __color_print(0, "刪除過期日志: " + log, no_sn=True, display=False)
+        # 文字日誌及事件日誌各自保留 max_num 個
+        for suffix in (".log", ".jsonl"):
+            logs_list = [
+                x.name
+                for x in logs_dir.iterdir()
+                if x.suffix == suffix and "web" not in x.name
+            ]
+            if len(logs_list) > max_num:
+                logs_list.sort()
+                logs_need_remove = logs_list[0 : len(logs_list) - max_num]
+                for log in logs_need_remove:
+                    log_path = logs_dir / log
+                    log_path.unlink()
+                    __color_print(0, "刪除過期日志: " + log, no_sn=True, display=False)
 
 
 def write_settings(web_config: dict | Settings):
@@ -605,7 +610,13 @@ def write_settings(web_config: dict | Settings):
 
     # 使用新的 TOML 配置系統保存
     try:
-        from schema import CoolQSettings, DashboardConfig, FTPConfig
+        from schema import (
+            BandwidthConfig,
+            BandwidthSchedule,
+            CoolQSettings,
+            DashboardConfig,
+            FTPConfig,
+        )
         from dataclasses import replace
 
         # 處理嵌套對象
@@ -617,6 +628,13 @@ def write_settings(web_config: dict | Settings):
             web_config["coolq_settings"] = CoolQSettings(**web_config["coolq_settings"])
         if "dashboard" in web_config and isinstance(web_config["dashboard"], dict):
             web_config["dashboard"] = DashboardConfig(**web_config["dashboard"])
+        if "bandwidth" in web_config and isinstance(web_config["bandwidth"], dict):
+            bandwidth = web_config["bandwidth"]
+            bandwidth["schedules"] = [
+                BandwidthSchedule(**schedule)
+                for schedule in bandwidth.get("schedules", [])
+            ]
+            web_config["bandwidth"] = BandwidthConfig(**bandwidth)
 
         # 獲取當前 config 以保留 sn_list
         current_config = get_config()
@@ -687,80 +705,6 @@ def parse_proxy(proxy_str: str) -> dict:
     return result
 
 
-def set_task_queue_refs(queue_ref, processing_queue_ref):
-    """設置任務佇列的引用（由 ani_gamer_next 模組呼叫）。
-
-    Args:
-        queue_ref: queue 字典的引用
-        processing_queue_ref: processing_queue 列表的引用
-    """
-    global _task_queue_ref, _processing_queue_ref, _completed_tasks_lock, _manual_task_lock
-    import threading
-
-    _task_queue_ref = queue_ref
-    _processing_queue_ref = processing_queue_ref
-
-    # 初始化鎖
-    if _completed_tasks_lock is None:
-        _completed_tasks_lock = threading.Lock()
-    if _manual_task_lock is None:
-        _manual_task_lock = threading.Lock()
-
-
-def add_manual_task(sn: int, filename: str, mode: str = "unknown"):
-    """添加手動任務到等待隊列。
-    
-    Args:
-        sn: 任務 SN
-        filename: 文件名
-        mode: 下載模式
-    """
-    global manual_task_queue, _manual_task_lock
-    import threading
-    
-    if _manual_task_lock is None:
-        _manual_task_lock = threading.Lock()
-    
-    with _manual_task_lock:
-        manual_task_queue[int(sn)] = {
-            "filename": filename,
-            "mode": mode,
-            "started": False  # 是否已開始執行（獲取到線程資源）
-        }
-
-
-def start_manual_task(sn: int):
-    """標記手動任務已開始執行（獲取到線程資源）。
-    
-    Args:
-        sn: 任務 SN
-    """
-    global manual_task_queue, _manual_task_lock
-    
-    if _manual_task_lock is None:
-        return
-    
-    with _manual_task_lock:
-        if int(sn) in manual_task_queue:
-            manual_task_queue[int(sn)]["started"] = True
-
-
-def remove_manual_task(sn: int):
-    """從手動任務隊列中移除任務。
-    
-    Args:
-        sn: 任務 SN
-    """
-    global manual_task_queue, _manual_task_lock
-    
-    if _manual_task_lock is None:
-        return
-    
-    with _manual_task_lock:
-        if int(sn) in manual_task_queue:
-            del manual_task_queue[int(sn)]
-
-
 def record_completed_task(sn: int, filename: str, status: str = "success"):
     """記錄已完成的任務。
 
@@ -768,6 +712,9 @@ def record_completed_task(sn: int, filename: str, status: str = "success"):
         sn: 任務 SN
         filename: 文件名
         status: 任務狀態，'success' 或 'failed'
+
+    Returns:
+        list[int]: 因超出 max_completed_tasks 而移除的任務 SN
     """
     global completed_tasks, _completed_tasks_lock
     from datetime import datetime
@@ -786,6 +733,7 @@ def record_completed_task(sn: int, filename: str, status: str = "success"):
         # 根據配置限制已完成任務數量（0 表示不限制）
         cfg = get_config()
         max_tasks = cfg.max_completed_tasks
+        removed = []
         if max_tasks > 0 and len(completed_tasks) > max_tasks:
             # 按完成時間排序，移除最舊的
             sorted_tasks = sorted(
@@ -794,9 +742,11 @@ def record_completed_task(sn: int, filename: str, status: str = "success"):
                 reverse=True
             )
             # 保留最新的 N 個
+            removed = [sn for sn, _ in sorted_tasks[max_tasks:]]
             completed_tasks.clear()
             for sn, info in sorted_tasks[:max_tasks]:
                 completed_tasks[sn] = info
+        return removed
 
 
 def get_completed_tasks():
@@ -818,105 +768,19 @@ def get_completed_tasks():
 def get_task_queue_info():
     """獲取任務佇列資訊（供 WebSocket 使用）。
 
+    等待中任務的顯示資訊由任務調度器維護, 佇列未改變時直接返回同一份結果,
+    不會逐個任務查詢資料庫。
+
     Returns:
         dict: 包含 pending (等待中任務) 的字典
               格式: {
                   "pending": {sn: {"filename": str, "position": int, "mode": str}}
               }
     """
-    result = {"pending": {}}
-
-    # 如果沒有設置引用，返回空資料
-    if _task_queue_ref is None or _processing_queue_ref is None:
-        return result
-
-    # 獲取等待中的任務
-    # 1. 自動任務：在 queue 中但不在 processing_queue 中
-    # 2. 手動任務：在 manual_task_queue 中且 started=False
-    # 按 SN 排序以確保順序一致
-    pending_tasks = []
-    
-    # 添加自動任務中的等待任務
-    for sn, task_info in _task_queue_ref.items():
-        if sn not in _processing_queue_ref:
-            pending_tasks.append((sn, task_info))
-    
-    # 添加手動任務中的等待任務
-    global manual_task_queue, _manual_task_lock
-    if _manual_task_lock is not None:
-        with _manual_task_lock:
-            for sn, task_info in manual_task_queue.items():
-                # 只顯示未開始的手動任務（started=False 且不在 tasks_progress_rate 中）
-                if not task_info.get("started", False) and int(sn) not in tasks_progress_rate:
-                    # 轉換為與自動任務相同的格式
-                    pending_tasks.append((sn, {"mode": task_info.get("mode", "unknown")}))
-
-    # 按照 SN 排序（數字順序）
-    pending_tasks.sort(key=lambda x: x[0])
-
-    # 調試日志：記錄等待中任務的數量
-    if pending_tasks:
-        __color_print(
-            0, "任務佇列", 
-            f"當前等待中任務: {len(pending_tasks)} 個 (總任務: {len(_task_queue_ref)}, 執行中: {len(_processing_queue_ref)})",
-            no_sn=True, display=False
-        )
-
-    # 構建結果字典
-    position = 1
-    for sn, task_info in pending_tasks:
-        # 優先從手動任務隊列獲取文件名（如果是手動任務）
-        filename = None
-        if _manual_task_lock is not None:
-            with _manual_task_lock:
-                if int(sn) in manual_task_queue:
-                    manual_info = manual_task_queue[int(sn)]
-                    if manual_info.get("filename") and manual_info["filename"] != f"SN: {sn}":
-                        filename = manual_info["filename"]
-        
-        # 如果手動任務隊列中沒有詳細文件名，從資料庫讀取
-        if filename is None:
-            try:
-                # 動態導入避免循環依賴
-                from . import ani_gamer_next
-                import sqlite3
-
-                db_path = ani_gamer_next.db_path
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                cursor.execute(
-                    "SELECT bangumi_name, episode FROM anime WHERE sn = ?",
-                    (int(sn),)
-                )
-                row = cursor.fetchone()
-                cursor.close()
-                conn.close()
-
-                if row and row[0]:
-                    filename = f"《{row[0]}》- {row[1]}"
-                else:
-                    filename = f"SN: {sn}"
-            except Exception as e:
-                # 如果資料庫查詢失敗，使用 SN 作為文件名
-                __color_print(
-                    0, "任務佇列", f"查詢 SN {sn} 資訊失敗: {e}", no_sn=True, display=False
-                )
-                filename = f"SN: {sn}"
+    # 動態導入避免循環依賴
+    from .scheduler import get_task_scheduler
 
-        # 獲取任務模式
-        if isinstance(task_info, dict):
-            mode = task_info.get("mode", "unknown")
-        else:
-            mode = "unknown"
-
-        result["pending"][str(sn)] = {
-            "filename": filename,
-            "position": position,
-            "mode": mode
-        }
-        position += 1
-
-    return result
+    return {"pending": get_task_scheduler().pending_view()}
 
 
 if __name__ == "__main__":
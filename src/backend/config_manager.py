@@ -29,7 +29,13 @@ def load_config() -> Config:
     Returns:
         Config: 配置對象
     """
-    from .schema import CoolQSettings, DashboardConfig, FTPConfig
+    from .schema import (
+        BandwidthConfig,
+        BandwidthSchedule,
+        CoolQSettings,
+        DashboardConfig,
+        FTPConfig,
+    )
 
     if not CONFIG_PATH.exists():
         raise FileNotFoundError(f"配置文件不存在: {CONFIG_PATH}")
@@ -47,6 +53,13 @@ def load_config() -> Config:
     if "coolq" in data and isinstance(data["coolq"], dict):
         data["coolq"] = CoolQSettings(**data["coolq"])
 
+    if "bandwidth" in data and isinstance(data["bandwidth"], dict):
+        bandwidth = data["bandwidth"]
+        bandwidth["schedules"] = [
+            BandwidthSchedule(**schedule) for schedule in bandwidth.get("schedules", [])
+        ]
+        data["bandwidth"] = BandwidthConfig(**bandwidth)
+
     return Config(**data)
 
 
@@ -129,6 +129,15 @@ class Timeout:
     FFMPEG_CHECK_INTERVAL = 60  # ffmpeg 活動檢查間隔
 
 
+class ConnectionPool:
+    """HTTP 連線池配置常數。"""
+
+    # 每個 (主機, 代理) 的連線上限，需容納所有分段線程同時下載
+    MAX_CONNECTIONS_PER_HOST = 64
+    MAX_KEEPALIVE_PER_HOST = 16
+    KEEPALIVE_EXPIRY = 30.0  # 閒置連線保留秒數
+
+
 class RetryConfig:
     """重試配置常數。"""
 
@@ -10,11 +10,10 @@ import time
 from pathlib import Path
 from urllib.parse import quote
 
-import httpx
-
 from . import config
 from .color_print import err_print
 from .constants import AnimeUrl
+from .transport import create_client
 
 
 class CookieManager:
@@ -101,7 +100,7 @@ class CookieManager:
                 "Accept-Language": "zh-TW,zh;q=0.9,en-US;q=0.8,en;q=0.6",
             }
 
-            with httpx.Client(follow_redirects=True, timeout=10) as client:
+            with create_client(follow_redirects=True, timeout=10) as client:
                 # 設置現有 cookies
                 for key, value in current_cookies.items():
                     client.cookies.set(key, value)
@@ -17,6 +17,7 @@ import httpx
 from . import config
 from .color_print import err_print
 from .danmu_formatter import DanmuFormatter, RollChannelManager
+from .transport import create_client
 
 
 class Danmu:
@@ -80,12 +81,12 @@ class Danmu:
         data = {"sn": self._sn}
 
         try:
-            response = httpx.post(
-                f"{self._BASE_URL}/ajax/danmuGet.php",
-                data=data,
-                headers=headers,
-                timeout=30,
-            )
+            with create_client(timeout=30) as client:
+                response = client.post(
+                    f"{self._BASE_URL}/ajax/danmuGet.php",
+                    data=data,
+                    headers=headers,
+                )
             response.raise_for_status()
             return response.json()
         except httpx.HTTPError as e:
@@ -111,12 +112,12 @@ class Danmu:
         }
 
         try:
-            response = httpx.get(
-                f"{self._BASE_URL}/ajax/keywordGet.php",
-                headers=headers,
-                cookies=self._cookies,
-                timeout=30,
-            )
+            with create_client(timeout=30) as client:
+                response = client.get(
+                    f"{self._BASE_URL}/ajax/keywordGet.php",
+                    headers=headers,
+                    cookies=self._cookies,
+                )
             response.raise_for_status()
 
             online_ban_words = response.json()
@@ -45,7 +45,7 @@ from fastapi.responses import (
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
-from . import config
+from . import config, metrics, progress
 from .ani_gamer_next import __cui as cui
 from .color_print import err_print
 from .schema import Settings
@@ -180,6 +180,7 @@ id_list = [
 # JWT Configuration
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 24
+PROGRESS_PUSH_INTERVAL = 0.5  # 任務進度推送的合併間隔（秒）
 
 
 def get_or_create_secret_key() -> str:
@@ -565,6 +566,17 @@ async def update_sn_list(
     return JSONResponse(content={"status": "200"})
 
 
+@app.get("/metrics")
+async def get_metrics() -> PlainTextResponse:
+    """Export runtime metrics in Prometheus text format (no auth, opt-in)."""
+    if not settings_manager.get().dashboard.metrics:
+        return PlainTextResponse(content="Not Found", status_code=404)
+    return PlainTextResponse(
+        content=metrics.REGISTRY.expose(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
 @app.get("/data/get_token")
 async def get_websocket_token(
     _user: Annotated[dict[str, Any], Depends(verify_token)],
@@ -586,50 +598,35 @@ async def stream_tasks_progress(websocket: WebSocket, token: str | None = None)
 
     await websocket.accept()
 
-    # Stream progress updates
-    try:
-        # 立即發送第一次數據，不等待
-        queue_info = config.get_task_queue_info()
-        completed_tasks = config.get_completed_tasks()
-
-        response_data = {
-            "active": config.tasks_progress_rate,  # 正在執行的任務
-            "pending": queue_info.get("pending", {}),  # 等待執行的任務
-            "completed": completed_tasks,  # 已完成的任務
-            "stats": {
-                "active_count": len(config.tasks_progress_rate),
-                "pending_count": len(queue_info.get("pending", {})),
-                "completed_count": len(completed_tasks)
-            }
-        }
+    # 訂閱後再取完整狀態, 期間的變化會在之後的增量中重複送出, 套用結果相同
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+    bus = progress.get_progress_bus()
+    subscription = bus.subscribe(lambda: loop.call_soon_threadsafe(changed.set))
 
-        msg = json.dumps(response_data)
-        await websocket.send_text(msg)
-
-        # 定期更新
+    async def push_changes() -> None:
+        await websocket.send_text(json.dumps(bus.snapshot()))
         while True:
-            await asyncio.sleep(1)
-            
-            # 獲取任務佇列資訊
-            queue_info = config.get_task_queue_info()
-            completed_tasks = config.get_completed_tasks()
-
-            # 構建回傳數據
-            response_data = {
-                "active": config.tasks_progress_rate,  # 正在執行的任務
-                "pending": queue_info.get("pending", {}),  # 等待執行的任務
-                "completed": completed_tasks,  # 已完成的任務
-                "stats": {
-                    "active_count": len(config.tasks_progress_rate),
-                    "pending_count": len(queue_info.get("pending", {})),
-                    "completed_count": len(completed_tasks)
-                }
-            }
-
-            msg = json.dumps(response_data)
-            await websocket.send_text(msg)
-    except WebSocketDisconnect:
+            await changed.wait()
+            # 等待一段時間, 合併短時間內的連續變化
+            await asyncio.sleep(PROGRESS_PUSH_INTERVAL)
+            changed.clear()
+            delta = subscription.drain()
+            if delta is not None:
+                await websocket.send_text(json.dumps(delta))
+
+    sender = asyncio.create_task(push_changes())
+    try:
+        # 只推送不接收, 讀取訊息僅為偵測斷線
+        while not sender.done():
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+    except (WebSocketDisconnect, RuntimeError):
         pass
+    finally:
+        bus.unsubscribe(subscription)
+        sender.cancel()
 
 
 def run() -> None:
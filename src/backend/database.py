@@ -0,0 +1,407 @@
+"""資料庫模組。
+
+管理下載紀錄資料庫（SQLite）。每個線程持有一條長期連線，資料庫使用 WAL 模式，
+讀取不會被寫入阻塞；寫入以鎖串行化。資料表結構以 ``PRAGMA user_version``
+記錄版本，啟動時依序執行尚未套用的遷移。
+
+除下載紀錄外，亦保存番劇頁面快取（條件請求驗證資訊及解析結果），供檢查更新時略過
+未變化頁面的解析。
+"""
+
+from __future__ import annotations
+
+import functools
+import json
+import sqlite3
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+from . import metrics
+
+# anime 表欄位，決定讀取結果字典的鍵
+ANIME_COLUMNS = (
+    "sn",
+    "title",
+    "anime_name",
+    "episode",
+    "status",
+    "remote_status",
+    "resolution",
+    "file_size",
+    "local_file_path",
+    "download_duration",
+    "download_bytes",
+    "chunk_count",
+    "last_error",
+)
+
+_SELECT_COLUMNS = ", ".join(ANIME_COLUMNS)
+_SQL_SELECT_ONE = f"SELECT {_SELECT_COLUMNS} FROM anime WHERE sn=:sn"
+_SQL_SELECT_ALL = f"SELECT {_SELECT_COLUMNS} FROM anime"
+_SQL_INSERT = (
+    "INSERT INTO anime (sn, title, anime_name, episode) "
+    "VALUES (:sn, :title, :anime_name, :episode)"
+)
+_SQL_INSERT_OR_IGNORE = _SQL_INSERT.replace("INSERT", "INSERT OR IGNORE", 1)
+
+# 單條 IN 查詢的參數上限（舊版 SQLite 限制為 999）
+_MAX_IN_PARAMS = 500
+_SQL_UPDATE = (
+    "UPDATE anime SET status=:status,"
+    "remote_status=:remote_status,"
+    "resolution=:resolution,"
+    "file_size=:file_size,"
+    "local_file_path=:local_file_path WHERE sn=:sn"
+)
+_SQL_UPDATE_STATS = (
+    "UPDATE anime SET download_duration=:download_duration,"
+    "download_bytes=:download_bytes,"
+    "chunk_count=:chunk_count,"
+    "last_error=NULL WHERE sn=:sn"
+)
+_SQL_UPDATE_ERROR = "UPDATE anime SET last_error=:last_error WHERE sn=:sn"
+_SQL_UPDATE_TITLE = (
+    "UPDATE anime SET title=:title, anime_name=:anime_name, episode=:episode "
+    "WHERE sn=:sn"
+)
+
+# page_cache 表欄位，決定讀取結果字典的鍵
+PAGE_CACHE_COLUMNS = (
+    "sn",
+    "etag",
+    "last_modified",
+    "content_hash",
+    "title",
+    "episode",
+    "episode_list",
+    "episode_labels",
+)
+_SQL_SELECT_PAGE_CACHE = (
+    f"SELECT {', '.join(PAGE_CACHE_COLUMNS)} FROM page_cache WHERE sn=:sn"
+)
+_SQL_SAVE_PAGE_CACHE = (
+    "INSERT OR REPLACE INTO page_cache "
+    "(sn, etag, last_modified, content_hash, title, episode, episode_list, "
+    "episode_labels) "
+    "VALUES (:sn, :etag, :last_modified, :content_hash, :title, :episode, "
+    ":episode_list, :episode_labels)"
+)
+
+
+def _migrate_create_table(conn: sqlite3.Connection) -> None:
+    """版本 1：建立 anime 表。"""
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS anime ("
+        "sn INTEGER PRIMARY KEY NOT NULL,"
+        "title VARCHAR(100) NOT NULL,"
+        "anime_name VARCHAR(100) NOT NULL, "
+        "episode VARCHAR(10) NOT NULL,"
+        "status TINYINT DEFAULT 0,"
+        "remote_status INTEGER DEFAULT 0,"
+        "resolution INTEGER DEFAULT 0,"
+        "file_size INTEGER DEFAULT 0,"
+        "local_file_path VARCHAR(500),"
+        "[CreatedTime] TimeStamp NOT NULL DEFAULT (datetime('now','localtime')))"
+    )
+
+
+def _migrate_indexes_and_stats(conn: sqlite3.Connection) -> None:
+    """版本 2：建立查詢索引，新增下載統計欄位。"""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(anime)")}
+    for column, definition in (
+        ("download_duration", "REAL DEFAULT 0"),
+        ("download_bytes", "INTEGER DEFAULT 0"),
+        ("chunk_count", "INTEGER DEFAULT 0"),
+        ("last_error", "TEXT"),
+    ):
+        if column not in existing:
+            conn.execute(f"ALTER TABLE anime ADD COLUMN {column} {definition}")
+
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_anime_name_episode "
+        "ON anime (anime_name, episode)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_anime_status ON anime (status)")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_anime_remote_status ON anime (remote_status)"
+    )
+
+
+def _migrate_page_cache(conn: sqlite3.Connection) -> None:
+    """版本 3：建立番劇頁面快取表。"""
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS page_cache ("
+        "sn INTEGER PRIMARY KEY NOT NULL,"
+        "etag TEXT,"
+        "last_modified TEXT,"
+        "content_hash TEXT NOT NULL,"
+        "title TEXT NOT NULL,"
+        "episode TEXT NOT NULL,"
+        "episode_list TEXT NOT NULL,"
+        "[UpdatedTime] TimeStamp NOT NULL DEFAULT (datetime('now','localtime')))"
+    )
+
+
+def _migrate_page_cache_labels(conn: sqlite3.Connection) -> None:
+    """版本 4：番劇頁面快取新增各劇集的集數標籤。"""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(page_cache)")}
+    if "episode_labels" not in existing:
+        conn.execute("ALTER TABLE page_cache ADD COLUMN episode_labels TEXT")
+
+
+# 依版本順序排列，第 i 個遷移執行後 user_version 為 i + 1
+MIGRATIONS = (
+    _migrate_create_table,
+    _migrate_indexes_and_stats,
+    _migrate_page_cache,
+    _migrate_page_cache_labels,
+)
+
+
+def _timed[F: Callable[..., Any]](func: F) -> F:
+    """記錄資料庫操作耗時（含等待寫入鎖）到指標 ``anigamer_db_query_seconds``。"""
+    histogram = metrics.DB_QUERY_SECONDS.labels(func.__name__)
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        start = time.monotonic()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            histogram.observe(time.monotonic() - start)
+
+    return wrapper  # type: ignore[return-value]
+
+
+class AnimeDatabase:
+    """下載紀錄資料庫。
+
+    以線程本地連線存取 anime 表，語句由 sqlite3 的語句快取重用。
+    """
+
+    def __init__(self, db_path: str) -> None:
+        """初始化資料庫。
+
+        Args:
+            db_path: 資料庫檔案路徑
+        """
+        self._db_path = db_path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """獲取當前線程的連線，不存在時建立。
+
+        Returns:
+            sqlite3 連線
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._db_path, timeout=30, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def init_schema(self) -> None:
+        """建立資料表並執行尚未套用的遷移。
+
+        每個遷移完成後即更新 ``user_version``；遷移本身可重複執行，中途中斷後重啟
+        會從未完成的版本繼續。
+        """
+        with self._write_lock:
+            conn = self._connect()
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for target, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                with conn:
+                    migration(conn)
+                    conn.execute(f"PRAGMA user_version={target}")
+
+    @staticmethod
+    def _to_dict(row: tuple) -> dict[str, Any]:
+        """將查詢結果轉為字典。"""
+        return dict(zip(ANIME_COLUMNS, row))
+
+    @_timed
+    def read(self, sn: int | str) -> dict[str, Any]:
+        """讀取單集紀錄。
+
+        Args:
+            sn: 影片序號
+
+        Returns:
+            紀錄字典
+
+        Raises:
+            IndexError: 紀錄不存在
+        """
+        row = self._connect().execute(_SQL_SELECT_ONE, {"sn": sn}).fetchone()
+        if row is None:
+            raise IndexError(f"sn={sn} 不存在於資料庫")
+        return self._to_dict(row)
+
+    @_timed
+    def read_all(self) -> list[dict[str, Any]]:
+        """讀取所有紀錄。
+
+        Returns:
+            紀錄字典列表
+        """
+        rows = self._connect().execute(_SQL_SELECT_ALL).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    @_timed
+    def read_many(self, sns: list[int]) -> dict[int, dict[str, Any]]:
+        """批次讀取多集紀錄。
+
+        Args:
+            sns: 影片序號列表
+
+        Returns:
+            {sn: 紀錄字典}，不存在的 sn 不在結果中
+        """
+        conn = self._connect()
+        result: dict[int, dict[str, Any]] = {}
+        for start in range(0, len(sns), _MAX_IN_PARAMS):
+            batch = [int(sn) for sn in sns[start : start + _MAX_IN_PARAMS]]
+            placeholders = ", ".join("?" * len(batch))
+            rows = conn.execute(
+                f"{_SQL_SELECT_ALL} WHERE sn IN ({placeholders})", batch
+            ).fetchall()
+            for row in rows:
+                record = self._to_dict(row)
+                result[int(record["sn"])] = record
+        return result
+
+    @_timed
+    def insert(self, record: dict[str, Any]) -> None:
+        """插入新紀錄。
+
+        Args:
+            record: 包含 sn, title, anime_name, episode 的字典
+
+        Raises:
+            sqlite3.IntegrityError: 紀錄已存在
+        """
+        with self._write_lock, self._connect() as conn:
+            conn.execute(_SQL_INSERT, record)
+
+    @_timed
+    def insert_many(self, records: list[dict[str, Any]]) -> int:
+        """在同一交易中插入多筆新紀錄，已存在的紀錄略過。
+
+        Args:
+            records: 包含 sn, title, anime_name, episode 的字典列表
+
+        Returns:
+            實際插入的筆數
+        """
+        if not records:
+            return 0
+        with self._write_lock, self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany(_SQL_INSERT_OR_IGNORE, records)
+            return conn.total_changes - before
+
+    @_timed
+    def update(self, record: dict[str, Any]) -> None:
+        """更新下載狀態。
+
+        Args:
+            record: 包含 sn 及 status, remote_status, resolution, file_size,
+                local_file_path 的字典
+        """
+        with self._write_lock, self._connect() as conn:
+            conn.execute(_SQL_UPDATE, record)
+
+    @_timed
+    def update_stats(
+        self,
+        sn: int | str,
+        duration: float,
+        size: int,
+        chunk_count: int,
+    ) -> None:
+        """記錄一次成功下載的統計，並清除錯誤紀錄。
+
+        Args:
+            sn: 影片序號
+            duration: 下載耗時（秒）
+            size: 影片大小（位元組）
+            chunk_count: 分段數，非分段模式為 0
+        """
+        with self._write_lock, self._connect() as conn:
+            conn.execute(
+                _SQL_UPDATE_STATS,
+                {
+                    "sn": sn,
+                    "download_duration": duration,
+                    "download_bytes": size,
+                    "chunk_count": chunk_count,
+                },
+            )
+
+    @_timed
+    def update_error(self, sn: int | str, error: str) -> None:
+        """記錄最近一次失敗原因。
+
+        Args:
+            sn: 影片序號
+            error: 錯誤訊息
+        """
+        with self._write_lock, self._connect() as conn:
+            conn.execute(_SQL_UPDATE_ERROR, {"sn": sn, "last_error": error})
+
+    @_timed
+    def update_title(self, record: dict[str, Any]) -> None:
+        """以頁面上的實際標題更新紀錄。
+
+        Args:
+            record: 包含 sn, title, anime_name, episode 的字典
+        """
+        with self._write_lock, self._connect() as conn:
+            conn.execute(_SQL_UPDATE_TITLE, record)
+
+    @_timed
+    def read_page_cache(self, sn: int | str) -> dict[str, Any] | None:
+        """讀取番劇頁面快取。
+
+        Args:
+            sn: 影片序號
+
+        Returns:
+            快取字典，``episode_list`` 已還原為 {集數: sn}，``episode_labels`` 已還原為
+            {sn: 集數}（舊版快取沒有時為 None）；不存在時為 None
+        """
+        row = (
+            self._connect().execute(_SQL_SELECT_PAGE_CACHE, {"sn": sn}).fetchone()
+        )
+        if row is None:
+            return None
+        record = dict(zip(PAGE_CACHE_COLUMNS, row))
+        record["episode_list"] = json.loads(record["episode_list"])
+        if record["episode_labels"] is not None:
+            record["episode_labels"] = {
+                int(sn): label
+                for sn, label in json.loads(record["episode_labels"]).items()
+            }
+        return record
+
+    @_timed
+    def save_page_cache(self, record: dict[str, Any]) -> None:
+        """寫入番劇頁面快取，已存在時覆蓋。
+
+        Args:
+            record: 包含 sn, etag, last_modified, content_hash, title, episode,
+                episode_list, episode_labels 的字典，``episode_list`` 為 {集數: sn}，
+                ``episode_labels`` 為 {sn: 集數}
+        """
+        record = dict(
+            record,
+            episode_list=json.dumps(record["episode_list"]),
+            episode_labels=json.dumps(record["episode_labels"]),
+        )
+        with self._write_lock, self._connect() as conn:
+            conn.execute(_SQL_SAVE_PAGE_CACHE, record)
@@ -10,18 +10,49 @@ import re
 import shutil
 import subprocess
 import sys
-import threading
 import time
 from abc import ABC, abstractmethod
+from collections.abc import Callable
 from pathlib import Path
+from typing import Any
 
-from . import config
+import httpx
+
+from . import config, events, metrics, progress
+from .chunk_manifest import (
+    CHUNK_DIR_SUFFIX,
+    ChunkManifest,
+    chunk_checksum,
+    cleanup_stale_chunk_dirs,
+)
 from .color_print import err_print
+from .concurrency import AdaptiveConcurrency, is_congestion_error
 from .constants import DownloadStatus, RetryConfig, Timeout
+from .hls_decryptor import HlsDecryptor
 from .http_client import HttpClient, TryTooManyTimeError
+from .rate_limiter import ProcessThrottle, get_download_limiter
+from .reorder_buffer import ReorderBuffer
+from .segment_pool import get_segment_pool
 from .utils import ProgressTracker
 
 
+def _should_retry_chunk(exc: Exception) -> bool:
+    """判斷分段請求失敗是否值得重試。
+
+    403/404 等非壅塞的 4xx 回應重試也不會成功，``segment_max_retry`` 為 -1 時更會
+    無限重試，故立即失敗；壅塞類錯誤及其他網路錯誤照常重試。
+
+    Args:
+        exc: 請求異常
+
+    Returns:
+        是否重試
+    """
+    if isinstance(exc, httpx.HTTPStatusError):
+        return is_congestion_error(exc)
+    return True
+
+
 class BaseDownloader(ABC):
     """下載器基礎類別。
 
@@ -59,6 +90,7 @@ class BaseDownloader(ABC):
         self._ffmpeg_path = ""
         self._title = ""
         self.video_size = 0
+        self.chunk_count = 0
         self.realtime_show = False
 
     def set_title(self, title: str) -> None:
@@ -106,84 +138,250 @@ class BaseDownloader(ABC):
 
         err_print(self._sn, "下載完成", self._filename, status=2)
 
-    def _build_ffmpeg_cmd(self, input_file: str, output_file: str) -> list[str]:
+    def _build_ffmpeg_cmd(
+        self,
+        input_file: str,
+        output_file: str,
+        input_options: list[str] | None = None,
+    ) -> list[str]:
         """建構 FFmpeg 命令。
 
         Args:
             input_file: 輸入檔案
             output_file: 輸出檔案
+            input_options: 輸入選項，預設為讀取本地化 M3U8 所需的選項
 
         Returns:
             FFmpeg 命令列表
         """
-        cmd = [
-            self._ffmpeg_path,
-            "-allowed_extensions",
-            "ALL",
-            "-i",
-            input_file,
-            "-c",
-            "copy",
-            output_file,
-            "-y",
-        ]
+        if input_options is None:
+            input_options = ["-allowed_extensions", "ALL"]
 
-        # Faststart movflags
-        if self._cfg.faststart_movflags:
-            cmd[7:7] = ["-movflags", "faststart"]
+        cmd = [self._ffmpeg_path, *input_options, "-i", input_file, "-c", "copy"]
 
         # Audio language metadata
         if self._cfg.audio_language:
             language = "chi" if "中文" in self._title else "jpn"
-            cmd[7:7] = ["-metadata:s:a:0", f"language={language}"]
+            cmd += ["-metadata:s:a:0", f"language={language}"]
+
+        # Faststart movflags
+        if self._cfg.faststart_movflags:
+            cmd += ["-movflags", "faststart"]
 
+        cmd += [output_file, "-y"]
         return cmd
 
 
 class SegmentDownloader(BaseDownloader):
     """分段下載器。
 
-    使用多線程下載影片片段並合併。
+    使用多線程下載影片片段並合併。分段檔案模式會在臨時目錄保存分段清單，
+    中斷後重新下載時只補齊缺失或損壞的分段。啟用 ``stream_decrypt`` 且已安裝
+    cryptography 時，分段在記憶體中解密後按順序直接送入 FFmpeg，不再落地為分段檔案。
+
+    分段檔案模式可延後合併：``download(merge=False)`` 下載完分段即返回，之後在其他
+    線程呼叫 ``finalize`` 合併。
     """
 
-    def download(self) -> bool:
+    _concurrency: AdaptiveConcurrency
+    # 已下載待合併的 (M3U8 內容, 金鑰路徑, 片段列表, 臨時目錄)
+    _pending_merge: tuple[str, Path, list[str], Path] | None = None
+
+    @property
+    def needs_finalize(self) -> bool:
+        """分段是否已下載完成、尚待合併。"""
+        return self._pending_merge is not None
+
+    def download(self, merge: bool = True) -> bool:
         """執行分段下載。
 
+        Args:
+            merge: 是否立即合併；為 False 時分段下載完成即返回，由 ``finalize`` 合併。
+                串流解密模式在下載時即完成合併，不受影響
+
         Returns:
             是否下載成功
         """
-        # 創建臨時目錄
-        temp_dir = self._temp_path.parent / f"{self._sn}-downloading-by-aniGamerPlus"
+        # 分段並發控制器；未啟用自適應時上下限相同，窗口固定但仍量測吞吐量
+        settings = config.get_settings()
+        if settings.adaptive_segment_concurrency:
+            self._concurrency = AdaptiveConcurrency(
+                settings.multi_downloading_segment,
+                settings.segment_concurrency_min,
+                settings.segment_concurrency_max,
+            )
+        else:
+            fixed = settings.multi_downloading_segment
+            self._concurrency = AdaptiveConcurrency(fixed, fixed, fixed)
+
+        if self._cfg.stream_decrypt:
+            if HlsDecryptor.is_available():
+                return self._download_streaming()
+            err_print(
+                self._sn,
+                "下載狀態",
+                "未安裝 cryptography, 無法使用串流解密, 改用分段檔案模式",
+                status=1,
+                display=False,
+            )
+
+        # 創建臨時目錄，保留上次中斷留下的分段
+        temp_root = self._temp_path.parent
+        cleanup_stale_chunk_dirs(temp_root, self._cfg.segment_manifest_expire_hours)
+        temp_dir = temp_root / f"{self._sn}{CHUNK_DIR_SUFFIX}"
         temp_dir.mkdir(parents=True, exist_ok=True)
 
-        try:
-            # 下載並解析 M3U8
-            m3u8_content = self._download_m3u8(temp_dir)
-            key_path = self._download_key(m3u8_content, temp_dir)
-            chunk_list = re.findall(r"media_b.+ts.*", m3u8_content)
+        # 下載並解析 M3U8
+        m3u8_content = self._download_m3u8(temp_dir)
+        key_path = self._download_key(m3u8_content, temp_dir)
+        chunk_list = re.findall(r"media_b.+ts.*", m3u8_content)
+
+        # 校驗已下載的分段；金鑰或播放列表序號改變時舊分段作廢
+        chunk_names = [re.findall(r"media_b.+ts", chunk)[0] for chunk in chunk_list]
+        media_sequence = re.search(r"#EXT-X-MEDIA-SEQUENCE:(\d+)", m3u8_content)
+        manifest = ChunkManifest(
+            temp_dir,
+            chunk_names,
+            key_sha1=chunk_checksum(key_path.read_bytes()),
+            media_sequence=int(media_sequence.group(1)) if media_sequence else None,
+        )
+        completed = manifest.completed_indexes()
+        if completed:
+            err_print(
+                self._sn,
+                "下載狀態",
+                f"{self._filename} 續傳, 已完成分段 {len(completed)}/{len(chunk_list)}",
+            )
 
-            # 下載所有片段
-            if not self._download_chunks(chunk_list, temp_dir):
-                return False
+        # 下載缺失的片段
+        def save_chunk(index: int, chunk_name: str, content: bytes) -> tuple[int, str]:
+            (temp_dir / chunk_name).write_bytes(content)
+            return len(content), chunk_checksum(content)
+
+        def record_chunk(index: int, result: tuple[int, str]) -> None:
+            manifest.mark_completed(index, chunk_names[index], *result)
 
-            # 本地化 M3U8
-            localized_m3u8 = self._localize_m3u8(
-                m3u8_content, key_path, chunk_list, temp_dir
+        try:
+            succeed = self._download_chunks(
+                chunk_list, save_chunk, record_chunk, skip=completed
             )
-            m3u8_path = temp_dir / f"{self._sn}.m3u8"
-            m3u8_path.write_text(localized_m3u8, encoding="utf-8")
+        finally:
+            manifest.save()
+        if not succeed:
+            return False
 
-            # 使用 FFmpeg 合併
-            self._merge_segments(m3u8_path)
+        self._pending_merge = (m3u8_content, key_path, chunk_list, temp_dir)
+        if not merge:
+            return True
+        return self.finalize()
 
-            # 移動到輸出目錄
-            self._move_to_output(self._temp_path)
+    def finalize(self) -> bool:
+        """合併已下載的分段並移至輸出目錄，沒有待合併的分段時直接返回。
 
+        Returns:
+            是否成功
+        """
+        if self._pending_merge is None:
             return True
+        m3u8_content, key_path, chunk_list, temp_dir = self._pending_merge
+        self._pending_merge = None
+
+        # 本地化 M3U8
+        localized_m3u8 = self._localize_m3u8(
+            m3u8_content, key_path, chunk_list, temp_dir
+        )
+        m3u8_path = temp_dir / f"{self._sn}.m3u8"
+        m3u8_path.write_text(localized_m3u8, encoding="utf-8")
+
+        # 使用 FFmpeg 合併
+        merge_start = time.monotonic()
+        if not self._merge_segments(m3u8_path):
+            # 刪除不完整的輸出, 保留分段目錄供下次續傳
+            self._temp_path.unlink(missing_ok=True)
+            self.video_size = 0
+            return False
+        metrics.MERGE_SECONDS.observe(time.monotonic() - merge_start)
+        events.emit(
+            "merge_finished",
+            self._sn,
+            duration=round(time.monotonic() - merge_start, 3),
+            bytes=self._temp_path.stat().st_size if self._temp_path.exists() else 0,
+        )
+
+        # 移動到輸出目錄
+        self._move_to_output(self._temp_path)
 
+        # 清理臨時目錄
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        return True
+
+    def _download_streaming(self) -> bool:
+        """串流解密下載。
+
+        分段下載完成即在工作線程中解密，再由本線程按順序寫入常駐的 FFmpeg 進程，
+        下載結束時合併也隨之完成。
+
+        Returns:
+            是否下載成功
+        """
+        m3u8_content = self._client.request(self._m3u8_url, no_cookies=True).text
+        decryptor = HlsDecryptor(self._fetch_key(m3u8_content), m3u8_content)
+        chunk_list = re.findall(r"media_b.+ts.*", m3u8_content)
+
+        cmd = self._build_ffmpeg_cmd(
+            "pipe:0", str(self._temp_path), input_options=["-f", "mpegts"]
+        )
+        process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        assert process.stdin is not None
+
+        # 亂序完成的分段在此重組，湊齊連續段落即寫入 FFmpeg；
+        # 進行中的分段數隨緩衝區剩餘空間收縮，緩衝區滿時暫停提交，直到缺口分段到達
+        buffer = ReorderBuffer(
+            process.stdin.write, self._cfg.segment_buffer_mb * 1024 * 1024
+        )
+
+        def decrypt_chunk(index: int, chunk_name: str, content: bytes) -> bytes:
+            return decryptor.decrypt(index, content)
+
+        def segment_limit() -> int:
+            return buffer.capacity(self._concurrency.limit())
+
+        try:
+            succeed = self._download_chunks(
+                chunk_list, decrypt_chunk, buffer.put, max_in_flight=segment_limit
+            )
+            process.stdin.close()
+            process.wait()
+        except (BrokenPipeError, OSError) as e:
+            err_print(
+                self._sn, "下載失败", f"{self._filename} FFmpeg 串流中斷: {e}", status=1
+            )
+            succeed = False
         finally:
-            # 清理臨時目錄
-            shutil.rmtree(temp_dir, ignore_errors=True)
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            buffer.clear()
+
+        if not succeed or process.returncode != 0:
+            if succeed:
+                err_print(
+                    self._sn,
+                    "下載失败",
+                    f"{self._filename} ffmpeg_return_code={process.returncode}",
+                    status=1,
+                )
+            self._temp_path.unlink(missing_ok=True)
+            self.video_size = 0
+            return False
+
+        self._move_to_output(self._temp_path)
+        return True
 
     def _download_m3u8(self, temp_dir: Path) -> str:
         """下載 M3U8 檔案。
@@ -197,15 +395,14 @@ class SegmentDownloader(BaseDownloader):
         response = self._client.request(self._m3u8_url, no_cookies=True)
         return response.text
 
-    def _download_key(self, m3u8_content: str, temp_dir: Path) -> Path:
-        """下載加密金鑰。
+    def _fetch_key(self, m3u8_content: str) -> bytes:
+        """獲取加密金鑰。
 
         Args:
             m3u8_content: M3U8 內容
-            temp_dir: 臨時目錄
 
         Returns:
-            金鑰檔案路徑
+            金鑰內容
         """
         key_match = re.search(r'(?<=AES-128,URI=")(.*)(?=")', m3u8_content)
         if not key_match:
@@ -218,65 +415,136 @@ class SegmentDownloader(BaseDownloader):
         if not re.match(r"http.+", key_uri):
             key_uri = f"{url_path}/{key_uri}"
 
-        # 下載金鑰
-        key_path = temp_dir / "key.m3u8key"
         response = self._client.request(key_uri, no_cookies=True)
-        key_path.write_bytes(response.content)
+        return response.content
+
+    def _download_key(self, m3u8_content: str, temp_dir: Path) -> Path:
+        """下載加密金鑰至臨時目錄。
+
+        Args:
+            m3u8_content: M3U8 內容
+            temp_dir: 臨時目錄
 
+        Returns:
+            金鑰檔案路徑
+        """
+        key_path = temp_dir / "key.m3u8key"
+        key_path.write_bytes(self._fetch_key(m3u8_content))
         return key_path
 
-    def _download_chunks(self, chunk_list: list[str], temp_dir: Path) -> bool:
+    def _download_chunks(
+        self,
+        chunk_list: list[str],
+        handle_chunk: Callable[[int, str, bytes], Any],
+        on_complete: Callable[[int, Any], None] | None = None,
+        max_in_flight: int | Callable[[], int] | None = None,
+        skip: set[int] | None = None,
+    ) -> bool:
         """下載所有片段。
 
+        片段交由全域分段線程池下載，本影片同時進行中的片段數不超過
+        ``multi_downloading_segment``。
+
         Args:
             chunk_list: 片段列表
-            temp_dir: 臨時目錄
+            handle_chunk: 在工作線程中處理片段內容 (索引, 檔名, 內容)，返回值交給 on_complete
+            on_complete: 在本線程中按完成順序接收 (索引, handle_chunk 返回值)
+            max_in_flight: 同時進行中的片段數，或返回該值的函數，預設由並發控制器決定
+            skip: 已完成、無需下載的片段索引
 
         Returns:
             是否下載成功
         """
         url_path = os.path.dirname(self._m3u8_url)
-        limiter = threading.Semaphore(self._cfg.multi_downloading_segment)
         total_chunks = len(chunk_list)
-        finished_counter = 0
-        failed_flag = False
+        self.chunk_count = total_chunks
+        skip = skip or set()
+        finished_counter = len(skip)
 
         # 進度追蹤
-        progress = ProgressTracker(self._sn, total_chunks)
+        tracker = ProgressTracker(self._sn, total_chunks)
+
+        def download_chunk(chunk: tuple[int, str]) -> Any:
+            index, chunk_name = chunk
+            start = time.monotonic()
+
+            def on_retry(exc: Exception) -> None:
+                if is_congestion_error(exc):
+                    self._concurrency.on_failure(exc)
+                metrics.CHUNK_RETRIES.inc()
+                events.emit("chunk_retry", self._sn, chunk=chunk_name, error=exc)
+
+            response = self._client.request(
+                f"{url_path}/{chunk_name}",
+                no_cookies=True,
+                show_fail=False,
+                max_retry=self._cfg.segment_max_retry,
+                raise_for_status=True,
+                on_retry=on_retry,
+                retry_if=_should_retry_chunk,
+            )
+            metrics.CHUNK_SECONDS.observe(time.monotonic() - start)
+            metrics.DOWNLOADED_BYTES.inc(len(response.content))
+            events.emit(
+                "chunk_done",
+                self._sn,
+                chunk=chunk_name,
+                bytes=len(response.content),
+                duration=round(time.monotonic() - start, 3),
+            )
+            get_download_limiter().consume(len(response.content))
+            self._concurrency.on_success(len(response.content))
+            return handle_chunk(index, chunk_name, response.content)
 
-        def download_chunk(chunk_name: str) -> None:
-            nonlocal finished_counter, failed_flag
+        # 顯示開始訊息
+        if self.realtime_show:
+            sys.stdout.write(f"正在下載: sn={self._sn} {self._filename}")
+            sys.stdout.flush()
+        else:
+            err_print(self._sn, "正在下載", f"{self._filename} title={self._title}")
 
-            chunk_path = temp_dir / chunk_name
-            chunk_url = f"{url_path}/{chunk_name}"
+        chunks = [
+            (index, re.findall(r"media_b.+ts", chunk)[0])
+            for index, chunk in enumerate(chunk_list)
+            if index not in skip
+        ]
+        if max_in_flight is None:
+            max_in_flight = self._concurrency.limit
+        results = get_segment_pool().run(download_chunk, chunks, max_in_flight)
+
+        for (index, chunk_name), result, exc in results:
+            if exc is not None:
+                metrics.CHUNK_FAILURES.inc()
+                events.emit("chunk_failed", self._sn, chunk=chunk_name, error=exc)
+                if isinstance(exc, TryTooManyTimeError):
+                    err_print(
+                        self._sn,
+                        "下載狀態",
+                        f"Bad segment={chunk_name} {exc.__cause__ or ''}".rstrip(),
+                        status=1,
+                    )
+                else:
+                    err_print(
+                        self._sn,
+                        "下載狀態",
+                        f"Bad segment={chunk_name} 發生未知錯誤: {exc}",
+                        status=1,
+                    )
+                results.close()  # 停止提交剩餘片段
+                err_print(self._sn, "下載失败", self._filename, status=1)
+                self.video_size = 0
+                return False
 
-            try:
-                response = self._client.request(
-                    chunk_url,
-                    no_cookies=True,
-                    show_fail=False,
-                    max_retry=self._cfg.segment_max_retry,
-                )
-                chunk_path.write_bytes(response.content)
-            except TryTooManyTimeError:
-                failed_flag = True
-                err_print(self._sn, "下載狀態", f"Bad segment={chunk_name}", status=1)
-                limiter.release()
-                return
-            except Exception as e:
-                failed_flag = True
-                err_print(
-                    self._sn,
-                    "下載狀態",
-                    f"Bad segment={chunk_name} 發生未知錯誤: {e}",
-                    status=1,
-                )
-                limiter.release()
-                return
+            if on_complete is not None:
+                on_complete(index, result)
 
             # 更新進度
             finished_counter += 1
-            progress.update(finished_counter, DownloadStatus.DOWNLOADING)
+            tracker.update(finished_counter, DownloadStatus.DOWNLOADING)
+            tracker.set_info(
+                segment_window=self._concurrency.limit(),
+                speed=round(self._concurrency.throughput / 1024, 1),  # KB/s
+            )
 
             if self.realtime_show:
                 progress_rate = round(finished_counter / total_chunks * 100, 2)
@@ -285,34 +553,6 @@ class SegmentDownloader(BaseDownloader):
                 )
                 sys.stdout.flush()
 
-            limiter.release()
-
-        # 顯示開始訊息
-        if self.realtime_show:
-            sys.stdout.write(f"正在下載: sn={self._sn} {self._filename}")
-            sys.stdout.flush()
-        else:
-            err_print(self._sn, "正在下載", f"{self._filename} title={self._title}")
-
-        # 建立下載任務
-        tasks = []
-        for chunk in chunk_list:
-            chunk_name = re.findall(r"media_b.+ts", chunk)[0]
-            task = threading.Thread(target=download_chunk, args=(chunk_name,))
-            task.daemon = True
-            tasks.append(task)
-            limiter.acquire()
-            task.start()
-
-        # 等待所有任務完成
-        for task in tasks:
-            while task.is_alive():
-                if failed_flag:
-                    err_print(self._sn, "下載失败", self._filename, status=1)
-                    self.video_size = 0
-                    return False
-                time.sleep(1)
-
         if self.realtime_show:
             sys.stdout.write("\n")
             sys.stdout.flush()
@@ -349,18 +589,33 @@ class SegmentDownloader(BaseDownloader):
 
         return localized
 
-    def _merge_segments(self, m3u8_path: Path) -> None:
+    def _merge_segments(self, m3u8_path: Path) -> bool:
         """合併片段。
 
         Args:
             m3u8_path: M3U8 檔案路徑
+
+        Returns:
+            FFmpeg 是否成功結束
         """
         err_print(self._sn, "下載狀態", f"{self._filename} 下載完成, 正在解密合并……")
-        config.tasks_progress_rate[int(self._sn)]["status"] = DownloadStatus.MERGING
+        progress.update_task(self._sn, status=DownloadStatus.MERGING)
 
         cmd = self._build_ffmpeg_cmd(str(m3u8_path), str(self._temp_path))
         process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        process.communicate()
+        _, stderr = process.communicate()
+        if process.returncode == 0:
+            return True
+
+        detail = stderr.decode("utf-8", "replace").strip().splitlines()[-5:]
+        err_print(
+            self._sn,
+            "合并失敗",
+            f"{self._filename} ffmpeg_return_code={process.returncode}\n"
+            + "\n".join(detail),
+            status=1,
+        )
+        return False
 
 
 class FfmpegDownloader(BaseDownloader):
@@ -399,8 +654,12 @@ class FfmpegDownloader(BaseDownloader):
             cmd, stdout=subprocess.PIPE, bufsize=204800, stderr=subprocess.PIPE
         )
 
+        # 頻寬限制
+        throttle = ProcessThrottle(self._sn, process, self._temp_path)
+        throttle.start()
+
         # 監控下載
-        if not self._monitor_ffmpeg(process):
+        if not self._monitor_ffmpeg(process, throttle):
             return False
 
         # 檢查結果
@@ -423,11 +682,14 @@ class FfmpegDownloader(BaseDownloader):
             )
             return False
 
-    def _monitor_ffmpeg(self, process: subprocess.Popen) -> bool:
+    def _monitor_ffmpeg(
+        self, process: subprocess.Popen, throttle: ProcessThrottle
+    ) -> bool:
         """監控 FFmpeg 執行。
 
         Args:
             process: FFmpeg 進程
+            throttle: 頻寬限制器，因限速暫停過的時段不判定為卡死
 
         Returns:
             是否正常執行
@@ -457,7 +719,9 @@ class FfmpegDownloader(BaseDownloader):
                 current_size = self._temp_path.stat().st_size
                 growth = current_size - prev_size
 
-                if growth < 3 * 1024 * 1024:  # 少於 3MB
+                if growth < 3 * 1024 * 1024 and not throttle.paused_within(
+                    Timeout.FFMPEG_CHECK_INTERVAL
+                ):  # 少於 3MB
                     err_print(
                         self._sn,
                         "下載失败",
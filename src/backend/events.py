@@ -0,0 +1,70 @@
+"""結構化事件日誌模組。
+
+與終端輸出的文字日誌並行，將下載、合併、上傳、Cookie 刷新等事件以 JSON Lines
+格式寫入 ``logs/events-<日期>.jsonl``，供離線統計每集下載耗時、分段重試率及 CDN
+吞吐量。由配置 ``save_event_log`` 啟用，寫入由背景線程完成。
+
+每行包含 ``ts``（ISO 8601 時間）、``event``（事件類型）、``sn`` 及事件欄位；
+附帶異常時另有 ``error`` 及 ``error_class``。
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from . import config
+from .color_print import LogWriter
+
+_event_writer: LogWriter | None = None
+_event_writer_lock = threading.Lock()
+
+
+def _get_event_writer() -> LogWriter:
+    """獲取事件日誌寫入器，首次呼叫時建立。"""
+    global _event_writer
+    with _event_writer_lock:
+        if _event_writer is None:
+            _event_writer = LogWriter(
+                Path(config.get_working_dir()) / "logs",
+                filename="events-{date}.jsonl",
+            )
+            atexit.register(_event_writer.close)
+        return _event_writer
+
+
+def emit(
+    event: str,
+    sn: int | str | None = None,
+    *,
+    error: BaseException | str | None = None,
+    **fields: Any,
+) -> None:
+    """記錄一個事件，未啟用事件日誌時不做任何事。
+
+    Args:
+        event: 事件類型，如 ``chunk_retry``、``download_finished``
+        sn: 影片序號，與單集無關的事件為 None
+        error: 異常或失敗原因
+        **fields: 事件欄位，需可序列化為 JSON；時長以秒、大小以位元組為單位
+    """
+    if not config.get_config().save_event_log:
+        return
+
+    record: dict[str, Any] = {
+        "ts": datetime.now().isoformat(timespec="milliseconds"),
+        "event": event,
+        "sn": int(sn) if sn not in (None, "") else None,
+    }
+    record.update(fields)
+    if isinstance(error, BaseException):
+        record["error"] = str(error)
+        record["error_class"] = type(error).__name__
+    elif error is not None:
+        record["error"] = error
+
+    _get_event_writer().write(json.dumps(record, ensure_ascii=False, default=str))
@@ -13,9 +13,10 @@ import time
 from ftplib import FTP, FTP_TLS
 from pathlib import Path
 
-from . import config
+from . import config, metrics
 from .color_print import err_print
 from .constants import RetryConfig, Timeout
+from .rate_limiter import get_upload_limiter
 
 
 class FtpUploader:
@@ -67,9 +68,11 @@ class FtpUploader:
             return False
 
         # 執行上傳
+        start = time.monotonic()
         try:
             success = self._upload_with_retry(local_file, filename, temp_dir)
             if success:
+                metrics.UPLOAD_SECONDS.observe(time.monotonic() - start)
                 err_print(self._sn, "上傳完成", filename, status=2)
             return success
         finally:
@@ -269,6 +272,7 @@ class FtpUploader:
         while retry_count <= self._cfg.ftp.max_retry_num:
             try:
                 if retry_count > 0:
+                    metrics.UPLOAD_RETRIES.inc()
                     err_print(
                         self._sn,
                         "上傳狀態",
@@ -304,7 +308,9 @@ class FtpUploader:
                         if not block:
                             time.sleep(3)
                             break
+                        get_upload_limiter().consume(len(block))
                         conn.sendall(block)
+                        metrics.UPLOADED_BYTES.inc(len(block))
 
                 conn.close()
 
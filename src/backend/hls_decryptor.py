@@ -0,0 +1,77 @@
+"""HLS 分段解密模組。
+
+提供 AES-128 (CBC) 加密 HLS 分段的記憶體內解密功能。
+解密依賴可選套件 cryptography，未安裝時 ``HlsDecryptor.is_available()`` 返回 False。
+"""
+
+from __future__ import annotations
+
+import re
+
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:  # 可選依賴
+    Cipher = None  # type: ignore[assignment, misc]
+
+
+class HlsDecryptor:
+    """HLS AES-128 分段解密器。
+
+    依照 HLS 規範，若 ``EXT-X-KEY`` 未指定 IV，則以分段的媒體序號作為 IV。
+    """
+
+    def __init__(self, key: bytes, m3u8_content: str) -> None:
+        """初始化解密器。
+
+        Args:
+            key: 16 位元組 AES 金鑰
+            m3u8_content: M3U8 內容（用於解析 IV 及媒體序號）
+        """
+        if len(key) != 16:
+            raise ValueError(f"AES-128 金鑰長度錯誤: {len(key)} bytes")
+
+        self._key = key
+        self._iv: bytes | None = None
+        self._media_sequence = 0
+
+        iv_match = re.search(r"#EXT-X-KEY:.*IV=0[xX]([0-9a-fA-F]+)", m3u8_content)
+        if iv_match:
+            self._iv = bytes.fromhex(iv_match.group(1).zfill(32))
+
+        sequence_match = re.search(r"#EXT-X-MEDIA-SEQUENCE:(\d+)", m3u8_content)
+        if sequence_match:
+            self._media_sequence = int(sequence_match.group(1))
+
+    @staticmethod
+    def is_available() -> bool:
+        """檢查解密依賴是否已安裝。
+
+        Returns:
+            是否可用
+        """
+        return Cipher is not None
+
+    def decrypt(self, index: int, data: bytes) -> bytes:
+        """解密單個分段。
+
+        Args:
+            index: 分段在播放列表中的索引（從 0 開始）
+            data: 加密的分段內容
+
+        Returns:
+            解密後的 MPEG-TS 內容
+        """
+        if self._iv is not None:
+            iv = self._iv
+        else:
+            iv = (self._media_sequence + index).to_bytes(16, "big")
+
+        decryptor = Cipher(algorithms.AES(self._key), modes.CBC(iv)).decryptor()
+        plain = decryptor.update(data) + decryptor.finalize()
+
+        # 去除 PKCS#7 填充
+        padding = plain[-1] if plain else 0
+        if 0 < padding <= 16 and plain.endswith(bytes([padding]) * padding):
+            plain = plain[:-padding]
+
+        return plain
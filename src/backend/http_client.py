@@ -6,18 +6,21 @@
 from __future__ import annotations
 
 import random
+import sys
 import time
+from collections.abc import Callable
 from typing import Any
 
 import httpx
 
-from . import config
+from . import config, events, metrics
 from .color_print import err_print
 from .constants import AnimeUrl, HttpHeader, RetryConfig, Timeout
+from .transport import create_client
 from .utils import RetryHandler
 
 
-class TryTooManyTimeError(BaseException):
+class TryTooManyTimeError(Exception):
     """重試次數過多異常。"""
 
 
@@ -46,11 +49,8 @@ class HttpClient:
         self._cookies: dict[str, str] = {}
         self._proxies: dict[str, str] = {}
 
-        # 創建 httpx 客戶端
-        self._httpx_client = httpx.Client(
-            timeout=Timeout.HTTP_REQUEST,
-            follow_redirects=True,
-        )
+        # 創建 httpx 客戶端（共用進程內的連線池）
+        self._httpx_client = self._create_client()
 
         # 初始化 headers
         self._web_header: dict[str, str] = {}
@@ -96,6 +96,21 @@ class HttpClient:
             proxies: 代理字典
         """
         self._proxies = proxies
+        self._httpx_client.close()
+        self._httpx_client = self._create_client()
+
+    def _create_client(self) -> httpx.Client:
+        """依目前代理設定建立 httpx 客戶端。
+
+        Returns:
+            httpx 客戶端
+        """
+        proxy = self._proxies.get("https") or self._proxies.get("http")
+        return create_client(
+            proxy,
+            timeout=Timeout.HTTP_REQUEST,
+            follow_redirects=True,
+        )
 
     def request(
         self,
@@ -105,6 +120,9 @@ class HttpClient:
         show_fail: bool = True,
         max_retry: int = RetryConfig.MAX_REQUEST_RETRY,
         additional_headers: dict[str, str] | None = None,
+        raise_for_status: bool = False,
+        on_retry: Callable[[Exception], None] | None = None,
+        retry_if: Callable[[Exception], bool] | None = None,
     ) -> httpx.Response:
         """發送 HTTP GET 請求。
 
@@ -114,6 +132,9 @@ class HttpClient:
             show_fail: 是否顯示失敗訊息
             max_retry: 最大重試次數
             additional_headers: 額外的 headers
+            raise_for_status: 是否將 4xx/5xx 回應視為失敗並重試
+            on_retry: 每次失敗重試前呼叫，接收異常
+            retry_if: 判斷異常是否值得重試，返回 False 時不再重試；None 時一律重試
 
         Returns:
             HTTP 回應
@@ -131,18 +152,18 @@ class HttpClient:
 
         # 定義請求函數
         def do_request() -> httpx.Response:
-            if self._proxies:
-                proxy_url = self._proxies.get("http") or self._proxies.get("https")
-                return self._httpx_client.get(
-                    url,
-                    headers=current_header,
-                    cookies=cookies,
-                    proxies=proxy_url,
-                )
-            return self._httpx_client.get(url, headers=current_header, cookies=cookies)
+            response = self._httpx_client.get(
+                url, headers=current_header, cookies=cookies
+            )
+            if raise_for_status:
+                response.raise_for_status()
+            return response
 
         # 定義錯誤處理
         def on_error(e: Exception, attempt: int) -> None:
+            metrics.HTTP_RETRIES.inc()
+            if on_retry is not None:
+                on_retry(e)
             if show_fail:
                 err_print(
                     self._sn,
@@ -150,19 +171,27 @@ class HttpClient:
                     f"請求失敗！{e}\n3s後重試（最多重試{max_retry}次）",
                 )
 
-        # 使用重試處理器
-        retry_handler = RetryHandler(max_retries=max_retry, base_delay=3.0)
+        # 使用重試處理器（max_retry 為負數時無限重試）
+        retry_handler = RetryHandler(
+            max_retries=max_retry if max_retry >= 0 else sys.maxsize,
+            base_delay=3.0,
+        )
 
+        start = time.monotonic()
         try:
             response = retry_handler.execute(
                 do_request,
                 on_error=on_error,
                 error_types=(httpx.HTTPError,),
+                retry_if=retry_if,
             )
-        except httpx.HTTPError:
+        except httpx.HTTPError as e:
+            metrics.HTTP_FAILURES.inc()
             raise TryTooManyTimeError(
                 f"任務狀態: sn={self._sn} 請求失敗次數過多！請求鏈接：\n{url}"
-            )
+            ) from e
+
+        metrics.HTTP_REQUEST_SECONDS.observe(time.monotonic() - start)
 
         # 處理 cookie
         self._handle_cookie_response(response)
@@ -267,6 +296,11 @@ class HttpClient:
             time.sleep(random.uniform(2, 5))
 
         # 三次嘗試後仍失敗
+        events.emit(
+            "cookie_refresh_failed",
+            self._sn,
+            guest_mode=not self._cfg.disable_guest_mode,
+        )
         if self._cfg.disable_guest_mode:
             # 不使用遊客模式：拋出異常，保持 cookies 不變
             err_print(
@@ -300,6 +334,9 @@ class HttpClient:
 
         key_list_str = ", ".join(self._httpx_client.cookies.keys())
         err_print(self._sn, f"用戶cookie刷新 {key_list_str}", display=False)
+        events.emit(
+            "cookie_refreshed", self._sn, keys=list(self._httpx_client.cookies.keys())
+        )
 
         self.request(AnimeUrl.BASE)
 
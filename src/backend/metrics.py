@@ -0,0 +1,315 @@
+"""運行指標模組。
+
+以 Prometheus 文字格式匯出計數器、量表及直方圖，由 Web 控制面板的 ``/metrics`` 提供。
+記錄指標只是在鎖內累加數值；佇列深度、工作線程數等量表以回呼函數實現，只在抓取時計算，
+沒有人抓取時幾乎沒有額外開銷。
+"""
+
+from __future__ import annotations
+
+import bisect
+import math
+import threading
+import time
+from collections.abc import Callable, Iterator, Sequence
+from contextlib import contextmanager
+
+# 秒數直方圖的預設區間
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _format_value(value: float) -> str:
+    """格式化數值。"""
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    """格式化標籤，無標籤時為空字串。"""
+    if not labels:
+        return ""
+    pairs = (
+        '{}="{}"'.format(
+            key,
+            str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'),
+        )
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(pairs) + "}"
+
+
+class _Metric:
+    """指標基底類，管理標籤及子指標。"""
+
+    _type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        """初始化指標。
+
+        Args:
+            name: 指標名稱
+            documentation: 說明
+            labelnames: 標籤名稱
+        """
+        self.name = name
+        self.documentation = documentation
+        self._labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: dict[tuple[str, ...], _Metric] = {}
+        self._labelvalues: tuple[str, ...] = ()
+        REGISTRY.register(self)
+
+    def labels(self, *values: object) -> _Metric:
+        """獲取指定標籤值的子指標，不存在時建立。
+
+        Args:
+            *values: 依標籤名稱順序的標籤值
+
+        Returns:
+            子指標
+        """
+        if len(values) != len(self._labelnames):
+            raise ValueError(f"{self.name} 需要標籤 {self._labelnames}")
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._new_child()
+                    child._labelvalues = key
+                    self._children[key] = child
+        return child
+
+    def _new_child(self) -> _Metric:
+        """建立子指標（不登記到 REGISTRY）。"""
+        child = object.__new__(type(self))
+        child.name = self.name
+        child.documentation = self.documentation
+        child._labelnames = self._labelnames
+        child._lock = threading.Lock()
+        child._children = {}
+        self._configure_child(child)
+        child._init_value()
+        return child
+
+    def _configure_child(self, child: _Metric) -> None:
+        """將本指標的設定（如直方圖區間）複製到子指標。"""
+
+    def _init_value(self) -> None:
+        """初始化數值。"""
+
+    def _samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        """產生本指標（不含子指標）的樣本。"""
+        return iter(())
+
+    def expose(self) -> list[str]:
+        """以 Prometheus 文字格式輸出。
+
+        Returns:
+            文字行列表
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self._type}",
+        ]
+        metrics = list(self._children.values()) if self._labelnames else [self]
+        for metric in metrics:
+            base = dict(zip(self._labelnames, metric._labelvalues))
+            for suffix, labels, value in metric._samples():
+                lines.append(
+                    f"{self.name}{suffix}{_format_labels({**base, **labels})} "
+                    f"{_format_value(value)}"
+                )
+        return lines
+
+
+class Counter(_Metric):
+    """只增不減的計數器。"""
+
+    _type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._init_value()
+
+    def _init_value(self) -> None:
+        self._value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        """增加計數。
+
+        Args:
+            amount: 增加量，不可為負
+        """
+        with self._lock:
+            self._value += amount
+
+    def _samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        yield "", {}, self._value
+
+
+class Gauge(_Metric):
+    """可增可減的量表，也可設定回呼函數在抓取時取值。"""
+
+    _type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._init_value()
+
+    def _init_value(self) -> None:
+        self._value = 0.0
+        self._function: Callable[[], float] | None = None
+
+    def set(self, value: float) -> None:
+        """設定數值。"""
+        with self._lock:
+            self._value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """設定回呼函數，抓取時以其返回值為數值。"""
+        self._function = function
+
+    def _samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        yield "", {}, self._function() if self._function else self._value
+
+
+class Histogram(_Metric):
+    """直方圖，統計數值落在各區間的次數及總和。"""
+
+    _type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        """初始化直方圖。
+
+        Args:
+            name: 指標名稱
+            documentation: 說明
+            labelnames: 標籤名稱
+            buckets: 區間上界，遞增排列，不含 +Inf
+        """
+        self._buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+        self._init_value()
+
+    def _configure_child(self, child: _Metric) -> None:
+        child._buckets = self._buckets
+
+    def _init_value(self) -> None:
+        self._counts = [0] * (len(self._buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """記錄一個數值。"""
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """記錄區塊執行的秒數。"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start)
+
+    def _samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = 0
+        for bound, count in zip((*self._buckets, math.inf), counts):
+            cumulative += count
+            yield "_bucket", {"le": _format_value(bound)}, cumulative
+        yield "_sum", {}, total
+        yield "_count", {}, cumulative
+
+
+class Registry:
+    """指標登記表。"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> None:
+        """登記指標。"""
+        with self._lock:
+            self._metrics.append(metric)
+
+    def expose(self) -> str:
+        """以 Prometheus 文字格式輸出所有指標。"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines: list[str] = []
+        for metric in metrics:
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# 下載
+DOWNLOADED_BYTES = Counter("anigamer_downloaded_bytes_total", "下載的位元組數")
+CHUNK_SECONDS = Histogram(
+    "anigamer_chunk_seconds",
+    "單個分段下載耗時（含重試）",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60),
+)
+CHUNK_RETRIES = Counter("anigamer_chunk_retries_total", "分段下載重試次數")
+CHUNK_FAILURES = Counter("anigamer_chunk_failures_total", "分段下載最終失敗次數")
+MERGE_SECONDS = Histogram("anigamer_merge_seconds", "FFmpeg 合併分段耗時")
+AD_WAIT_SECONDS = Histogram(
+    "anigamer_ad_wait_seconds",
+    "非 VIP 帳號實際等待廣告的秒數（含廣告檢查失敗後的追加等待）",
+    buckets=(5, 10, 20, 30, 45, 60, 90),
+)
+
+# HTTP
+HTTP_REQUEST_SECONDS = Histogram(
+    "anigamer_http_request_seconds", "HttpClient 請求耗時（含重試）"
+)
+HTTP_RETRIES = Counter("anigamer_http_retries_total", "HttpClient 請求重試次數")
+HTTP_FAILURES = Counter("anigamer_http_failures_total", "HttpClient 重試用盡的請求數")
+
+# 上傳
+UPLOADED_BYTES = Counter("anigamer_uploaded_bytes_total", "FTP 上傳的位元組數")
+UPLOAD_RETRIES = Counter("anigamer_upload_retries_total", "FTP 上傳重試次數")
+UPLOAD_SECONDS = Histogram(
+    "anigamer_upload_seconds",
+    "FTP 上傳單個檔案耗時",
+    buckets=(10, 30, 60, 120, 300, 600, 1200, 3600),
+)
+
+# 資料庫
+DB_QUERY_SECONDS = Histogram(
+    "anigamer_db_query_seconds",
+    "資料庫操作耗時",
+    ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1),
+)
+
+# 調度
+TASK_QUEUE_DEPTH = Gauge(
+    "anigamer_task_queue_depth", "調度器中各狀態的任務數", ["state"]
+)
+STAGE_QUEUE_DEPTH = Gauge("anigamer_stage_queue_depth", "流水線階段佇列中的工作數", ["stage"])
+ACTIVE_WORKERS = Gauge("anigamer_active_workers", "正在執行工作的線程數", ["stage"])
+TASK_RESULTS = Counter("anigamer_tasks_total", "結束的任務數", ["result"])
+UPDATE_CYCLE_SECONDS = Histogram(
+    "anigamer_update_cycle_seconds",
+    "一次檢查更新耗時",
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600),
+)
@@ -0,0 +1,93 @@
+"""番劇頁面解析模組。
+
+``animeVideo.php`` 只有標題（``div.anime_name``）及劇集列表（``section.season``，
+內含 ``li.playing``）兩個片段會被使用。此模組先從原始內容中切出這兩個片段再解析，
+避免以純 Python 解析器處理整個頁面；切片失敗時退回以 ``SoupStrainer`` 限制建樹範圍的
+完整解析。已安裝 lxml 時使用 lxml 解析器。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import importlib.util
+import re
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+# 已安裝 lxml 時使用較快的解析器
+PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+
+# 標題片段只取到 </h1>，避免 anime_name 內有巢狀 div 時提前截斷
+_TITLE_FRAGMENT = re.compile(rb'<div class="anime_name">.*?</h1>', re.DOTALL)
+_SEASON_FRAGMENT = re.compile(
+    rb'<section\b[^>]*\bclass="[^"]*\bseason\b[^"]*"[^>]*>.*?</section>', re.DOTALL
+)
+
+_SERIES_STRAINER = SoupStrainer(
+    lambda name, attrs: (name == "div" and _has_class(attrs, "anime_name"))
+    or (name == "section" and _has_class(attrs, "season"))
+)
+
+
+def _has_class(attrs: dict, class_name: str) -> bool:
+    """檢查標籤屬性是否包含指定 class。"""
+    classes = attrs.get("class") or ""
+    if isinstance(classes, str):
+        classes = classes.split()
+    return class_name in classes
+
+
+def extract_fragments(content: bytes) -> tuple[bytes | None, bytes | None]:
+    """從頁面原始內容切出標題及劇集列表片段。
+
+    Args:
+        content: 頁面原始內容
+
+    Returns:
+        (標題片段, 劇集列表片段)，找不到的片段為 None
+    """
+    title = _TITLE_FRAGMENT.search(content)
+    season = _SEASON_FRAGMENT.search(content)
+    return (
+        title.group(0) if title else None,
+        season.group(0) if season else None,
+    )
+
+
+def page_signature(content: bytes) -> str | None:
+    """計算標題及劇集列表片段的哈希，忽略頁面上其他經常變化的內容。
+
+    Args:
+        content: 頁面原始內容
+
+    Returns:
+        sha1 十六進位字串，兩個片段都找不到時為 None
+    """
+    fragments = extract_fragments(content)
+    if not any(fragments):
+        return None
+    digest = hashlib.sha1()
+    for fragment in fragments:
+        digest.update(fragment or b"")
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def parse_series_page(content: bytes) -> BeautifulSoup:
+    """解析番劇頁面中會被使用的片段。
+
+    返回的文件僅包含 ``div.anime_name`` 及 ``section.season``，對這兩部分的
+    ``find`` 結果與解析完整頁面相同。只有兩個片段都切出時才只解析片段；單集番劇
+    沒有劇集列表，或標記與預期不符時，均退回完整解析，以免遺漏劇集列表。
+
+    Args:
+        content: 頁面原始內容
+
+    Returns:
+        BeautifulSoup: 解析結果
+    """
+    title, season = extract_fragments(content)
+    if title is not None and season is not None:
+        return BeautifulSoup(title + season, PARSER)
+    # 缺少任一片段時退回完整解析，但只為需要的標籤建樹
+    return BeautifulSoup(content, PARSER, parse_only=_SERIES_STRAINER)
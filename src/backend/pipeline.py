@@ -0,0 +1,208 @@
+"""下載流水線模組。
+
+下載任務分為三個階段：擷取（由任務調度器執行）、合併（解密合併分段並移至番劇目錄）、
+上傳及通知。後兩個階段各自以有界佇列及獨立數量的工作線程執行，CPU 密集的合併不與
+分段下載爭用線程，FTP 上傳緩慢也不會佔用下載的並發數。
+"""
+
+from __future__ import annotations
+
+import threading
+import traceback
+from collections import deque
+from collections.abc import Callable
+
+from . import config, metrics
+from .color_print import err_print
+
+
+class StagePool:
+    """流水線階段：有界佇列及一組工作線程。
+
+    佇列以 sn 標記每個工作，可查詢某 sn 是否仍在此階段中（等待或執行）。
+    """
+
+    def __init__(self, name: str, max_workers: int, capacity: int = 0) -> None:
+        """初始化階段。
+
+        Args:
+            name: 階段名稱，用於線程名稱及日誌
+            max_workers: 工作線程數量
+            capacity: 佇列容量，小於等於 0 為不限制
+        """
+        self._name = name
+        self._cond = threading.Condition()
+        self._max_workers = max(1, max_workers)
+        self._capacity = capacity
+        self._workers = 0
+        self._queue: deque[tuple[int, Callable[[], object]]] = deque()
+        self._running: dict[int, int] = {}  # {sn: 執行中的工作數}
+
+    def configure(self, max_workers: int, capacity: int) -> None:
+        """調整工作線程數量及佇列容量，多出的線程在完成手上工作後退出。
+
+        Args:
+            max_workers: 工作線程數量
+            capacity: 佇列容量，小於等於 0 為不限制
+        """
+        with self._cond:
+            self._max_workers = max(1, max_workers)
+            self._capacity = capacity
+            self._spawn_workers()
+            self._cond.notify_all()
+
+    def put(self, sn: int | str, job: Callable[[], object], block: bool = True) -> bool:
+        """加入工作。
+
+        Args:
+            sn: 影片序號
+            job: 工作函數
+            block: 佇列已滿時是否等待
+
+        Returns:
+            是否已加入；``block`` 為 False 且佇列已滿時為 False
+        """
+        with self._cond:
+            while self._full():
+                if not block:
+                    return False
+                self._cond.wait()
+            self._queue.append((int(sn), job))
+            self._spawn_workers()
+            self._cond.notify_all()
+            return True
+
+    def contains(self, sn: int | str) -> bool:
+        """該 sn 是否仍在此階段中。"""
+        sn = int(sn)
+        with self._cond:
+            return sn in self._running or any(item[0] == sn for item in self._queue)
+
+    def wait_idle(self, timeout: float | None = None) -> bool:
+        """等待佇列清空且沒有執行中的工作。
+
+        Args:
+            timeout: 最長等待秒數，None 為一直等待
+
+        Returns:
+            是否已空閒
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._queue and not self._running, timeout
+            )
+
+    def snapshot(self) -> dict[str, int]:
+        """獲取階段狀態摘要。
+
+        Returns:
+            包含 workers、running、queued 數量的字典
+        """
+        with self._cond:
+            return {
+                "workers": self._max_workers,
+                "running": sum(self._running.values()),
+                "queued": len(self._queue),
+            }
+
+    def register_metrics(self, label: str) -> None:
+        """登記佇列深度及工作線程量表，抓取指標時才讀取狀態。
+
+        Args:
+            label: 指標的 stage 標籤值
+        """
+        metrics.STAGE_QUEUE_DEPTH.labels(label).set_function(
+            lambda: self.snapshot()["queued"]
+        )
+        metrics.ACTIVE_WORKERS.labels(label).set_function(
+            lambda: self.snapshot()["running"]
+        )
+
+    def _full(self) -> bool:
+        """佇列是否已滿，需持有鎖。"""
+        return 0 < self._capacity <= len(self._queue)
+
+    def _spawn_workers(self) -> None:
+        """補足工作線程，需持有鎖。"""
+        while self._workers < self._max_workers and self._queue:
+            self._workers += 1
+            thread = threading.Thread(
+                target=self._worker_loop,
+                name=f"{self._name}-worker-{self._workers}",
+                daemon=True,
+            )
+            thread.start()
+
+    def _worker_loop(self) -> None:
+        """工作線程主循環。"""
+        while True:
+            with self._cond:
+                while not self._queue and self._workers <= self._max_workers:
+                    self._cond.wait()
+                if self._workers > self._max_workers:
+                    self._workers -= 1
+                    self._cond.notify_all()
+                    return
+                sn, job = self._queue.popleft()
+                self._running[sn] = self._running.get(sn, 0) + 1
+                self._cond.notify_all()  # 通知等待空位的 put()
+
+            try:
+                job()
+            except Exception as e:
+                err_print(sn, f"{self._name}異常", "發生未知錯誤: " + str(e), status=1)
+                err_print(
+                    sn,
+                    f"{self._name}異常",
+                    "異常詳情:\n" + traceback.format_exc(),
+                    status=1,
+                    display=False,
+                )
+            finally:
+                with self._cond:
+                    self._running[sn] -= 1
+                    if not self._running[sn]:
+                        del self._running[sn]
+                    self._cond.notify_all()
+
+
+_finalize_stage: StagePool | None = None
+_upload_stage: StagePool | None = None
+_stage_lock = threading.Lock()
+
+
+def get_finalize_stage() -> StagePool:
+    """獲取全域合併階段。
+
+    線程數及佇列容量取自配置 ``finalize_workers`` 及 ``finalize_queue_size``，
+    每次獲取時更新。佇列已滿時擷取階段等待，避免未合併的分段佔滿磁碟。
+
+    Returns:
+        StagePool: 合併階段
+    """
+    global _finalize_stage
+    cfg = config.get_config()
+    with _stage_lock:
+        if _finalize_stage is None:
+            _finalize_stage = StagePool("合并", cfg.finalize_workers)
+            _finalize_stage.register_metrics("finalize")
+    _finalize_stage.configure(cfg.finalize_workers, cfg.finalize_queue_size)
+    return _finalize_stage
+
+
+def get_upload_stage() -> StagePool:
+    """獲取全域上傳及通知階段。
+
+    線程數取自配置 ``multi_upload``，佇列容量取自 ``upload_queue_size``，每次獲取時更新。
+
+    Returns:
+        StagePool: 上傳及通知階段
+    """
+    global _upload_stage
+    cfg = config.get_config()
+    with _stage_lock:
+        if _upload_stage is None:
+            _upload_stage = StagePool("上傳", cfg.multi_upload)
+            _upload_stage.register_metrics("upload")
+    _upload_stage.configure(cfg.multi_upload, cfg.upload_queue_size)
+    return _upload_stage
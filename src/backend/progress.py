@@ -0,0 +1,319 @@
+"""任務進度推送模組。
+
+面板顯示的任務進度（執行中、等待中、已完成）由此模組修改，並將變化推送給訂閱者，
+取代每秒重新計算並傳送完整狀態。執行中任務的進度百分比變化不足 1% 時不推送，
+下載速度等頻繁變化的欄位每秒最多推送一次；每個訂閱者各自合併尚未送出的變化，傳送量只隨變化多寡增長。
+
+執行中任務仍保存在 ``config.tasks_progress_rate``，已完成任務保存在
+``config.completed_tasks``；等待中任務由任務調度器維護，佇列變化時才推送。
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+from . import config
+
+# 進度百分比變化達到此值才推送
+RATE_STEP = 1.0
+# 每個分段都會改變的欄位（下載速度、分段並發數），同一任務每隔此秒數最多推送一次
+VOLATILE_FIELDS = frozenset({"speed", "segment_window"})
+VOLATILE_INTERVAL = 1.0
+
+
+class Subscription:
+    """訂閱者，合併尚未送出的變化。"""
+
+    def __init__(self, bus: ProgressBus, wakeup: Callable[[], None]) -> None:
+        """初始化訂閱者。
+
+        Args:
+            bus: 所屬的進度推送器
+            wakeup: 有新變化時呼叫，在送出前只呼叫一次；會在其他線程中呼叫
+        """
+        self._bus = bus
+        self._wakeup = wakeup
+        self._lock = threading.Lock()
+        self._notified = False
+        self._active: dict[int, dict[str, Any]] = {}
+        self._active_removed: set[int] = set()
+        self._completed: dict[int, dict[str, Any]] = {}
+        self._completed_removed: set[int] = set()
+        self._pending_dirty = False
+
+    def drain(self) -> dict[str, Any] | None:
+        """取出合併後的變化。
+
+        Returns:
+            增量訊息，沒有變化時為 None。``active_removed`` 需先於 ``active`` 套用，
+            ``active`` 中的欄位合併到已有條目；``pending`` 為完整的等待中任務
+        """
+        with self._lock:
+            self._notified = False
+            active, self._active = self._active, {}
+            active_removed, self._active_removed = self._active_removed, set()
+            completed, self._completed = self._completed, {}
+            completed_removed, self._completed_removed = self._completed_removed, set()
+            pending_dirty, self._pending_dirty = self._pending_dirty, False
+
+        if not (active or active_removed or completed or completed_removed or pending_dirty):
+            return None
+
+        pending = self._bus.pending()
+        message: dict[str, Any] = {"type": "delta"}
+        if active_removed:
+            message["active_removed"] = sorted(active_removed)
+        if active:
+            message["active"] = active
+        if pending_dirty:
+            message["pending"] = pending
+        if completed_removed:
+            message["completed_removed"] = sorted(completed_removed)
+        if completed:
+            message["completed"] = completed
+        message["stats"] = self._bus.stats(pending)
+        return message
+
+    def _push(
+        self,
+        active: dict[int, dict[str, Any] | None] | None = None,
+        replace: bool = False,
+        completed: dict[int, dict[str, Any] | None] | None = None,
+        pending: bool = False,
+    ) -> None:
+        """合併一次變化。
+
+        Args:
+            active: {sn: 欄位}，None 表示移除
+            replace: ``active`` 中的欄位是否為完整條目（新任務）
+            completed: {sn: 紀錄}，None 表示移除
+            pending: 等待中任務是否改變
+        """
+        with self._lock:
+            for sn, fields in (active or {}).items():
+                if fields is None:
+                    self._active.pop(sn, None)
+                    self._active_removed.add(sn)
+                elif replace:
+                    self._active_removed.add(sn)
+                    self._active[sn] = fields
+                else:
+                    self._active.setdefault(sn, {}).update(fields)
+            for sn, record in (completed or {}).items():
+                if record is None:
+                    self._completed.pop(sn, None)
+                    self._completed_removed.add(sn)
+                else:
+                    self._completed_removed.discard(sn)
+                    self._completed[sn] = record
+            self._pending_dirty = self._pending_dirty or pending
+            if self._notified:
+                return
+            self._notified = True
+        self._wakeup()
+
+
+class ProgressBus:
+    """任務進度推送器。"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._subscribers: set[Subscription] = set()
+        self._published_rate: dict[int, float] = {}  # {sn: 最後推送的進度}
+        self._published_at: dict[int, float] = {}  # {sn: 最後推送的時間}
+
+    def subscribe(self, wakeup: Callable[[], None]) -> Subscription:
+        """訂閱變化，之後再以 ``snapshot()`` 取得初始狀態。
+
+        Args:
+            wakeup: 有新變化時呼叫，會在其他線程中呼叫
+
+        Returns:
+            訂閱者
+        """
+        subscription = Subscription(self, wakeup)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """取消訂閱。"""
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def snapshot(self) -> dict[str, Any]:
+        """獲取完整狀態，格式與 ``drain()`` 的增量訊息相同但各部分均為完整內容。"""
+        with self._lock:
+            active = {
+                sn: dict(entry) for sn, entry in config.tasks_progress_rate.items()
+            }
+        pending = self.pending()
+        completed = config.get_completed_tasks()
+        return {
+            "type": "snapshot",
+            "active": active,
+            "pending": pending,
+            "completed": completed,
+            "stats": {
+                "active_count": len(active),
+                "pending_count": len(pending),
+                "completed_count": len(completed),
+            },
+        }
+
+    def pending(self) -> dict[str, Any]:
+        """獲取等待中任務，由任務調度器維護，佇列未改變時為同一份結果。"""
+        return config.get_task_queue_info().get("pending", {})
+
+    def stats(self, pending: dict[str, Any]) -> dict[str, int]:
+        """獲取各類任務數量。"""
+        with self._lock:
+            active_count = len(config.tasks_progress_rate)
+        return {
+            "active_count": active_count,
+            "pending_count": len(pending),
+            "completed_count": len(config.completed_tasks),
+        }
+
+    def start_task(self, sn: int | str, filename: str, status: str) -> None:
+        """新增（或重置）執行中任務。
+
+        Args:
+            sn: 影片序號
+            filename: 顯示的文件名
+            status: 任務狀態
+        """
+        sn = int(sn)
+        entry = {"rate": 0, "filename": filename, "status": status}
+        with self._lock:
+            config.tasks_progress_rate[sn] = entry
+            self._published_rate[sn] = 0
+            self._published_at.pop(sn, None)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription._push(active={sn: dict(entry)}, replace=True)
+
+    def update_task(self, sn: int | str, **fields: Any) -> bool:
+        """更新執行中任務的欄位，任務不存在時不做任何事。
+
+        ``rate`` 與上次推送相差不足 ``RATE_STEP``、或只有 ``VOLATILE_FIELDS`` 改變且
+        距上次推送不足 ``VOLATILE_INTERVAL`` 秒時只更新不推送。推送時一併送出這些欄位的
+        當前值。
+
+        Args:
+            sn: 影片序號
+            **fields: 欄位名稱與值，如 rate、status、filename、speed
+
+        Returns:
+            任務是否存在
+        """
+        sn = int(sn)
+        with self._lock:
+            entry = config.tasks_progress_rate.get(sn)
+            if entry is None:
+                return False
+            changed = {
+                key: value for key, value in fields.items() if entry.get(key) != value
+            }
+            entry.update(fields)
+            now = time.monotonic()
+            rate = changed.pop("rate", None)
+            volatile = VOLATILE_FIELDS & changed.keys()
+            for key in volatile:
+                del changed[key]
+            if rate is not None and (
+                abs(rate - self._published_rate.get(sn, 0)) >= RATE_STEP or rate >= 100
+            ):
+                changed["rate"] = rate
+            if volatile and now - self._published_at.get(sn, 0) >= VOLATILE_INTERVAL:
+                changed.update((key, entry[key]) for key in volatile)
+            if not changed or not self._subscribers:
+                return True
+            # 一併送出當前進度及頻繁變化欄位的最新值
+            for key in ("rate", *VOLATILE_FIELDS):
+                if key in entry:
+                    changed[key] = entry[key]
+            self._published_rate[sn] = entry.get("rate", 0)
+            self._published_at[sn] = now
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription._push(active={sn: changed})
+        return True
+
+    def finish_task(
+        self, sn: int | str, status: str = "success", filename: str | None = None
+    ) -> bool:
+        """將任務移出執行中並記錄到已完成任務。
+
+        Args:
+            sn: 影片序號
+            status: 'success' 或 'failed'
+            filename: 文件名，None 時取執行中條目的文件名
+
+        Returns:
+            是否已記錄；未指定文件名且任務不在執行中時為 False
+        """
+        sn = int(sn)
+        with self._lock:
+            entry = config.tasks_progress_rate.pop(sn, None)
+            self._published_rate.pop(sn, None)
+            self._published_at.pop(sn, None)
+        if filename is None:
+            if entry is None:
+                return False
+            filename = entry.get("filename", f"SN: {sn}")
+
+        removed = config.record_completed_task(sn, filename, status)
+        record = config.get_completed_tasks().get(sn)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        completed: dict[int, dict[str, Any] | None] = dict.fromkeys(removed)
+        if record is not None:
+            completed[sn] = record
+        for subscription in subscribers:
+            subscription._push(
+                active={sn: None} if entry is not None else None, completed=completed
+            )
+        return True
+
+    def pending_changed(self) -> None:
+        """通知等待中任務已改變，訂閱者送出時重新獲取。"""
+        with self._lock:
+            if not self._subscribers:
+                return
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription._push(pending=True)
+
+
+_bus = ProgressBus()
+
+
+def get_progress_bus() -> ProgressBus:
+    """獲取全域進度推送器。"""
+    return _bus
+
+
+def start_task(sn: int | str, filename: str, status: str) -> None:
+    """新增（或重置）執行中任務，見 ``ProgressBus.start_task``。"""
+    _bus.start_task(sn, filename, status)
+
+
+def update_task(sn: int | str, **fields: Any) -> bool:
+    """更新執行中任務的欄位，見 ``ProgressBus.update_task``。"""
+    return _bus.update_task(sn, **fields)
+
+
+def finish_task(
+    sn: int | str, status: str = "success", filename: str | None = None
+) -> bool:
+    """將任務移出執行中並記錄到已完成任務，見 ``ProgressBus.finish_task``。"""
+    return _bus.finish_task(sn, status, filename)
+
+
+def pending_changed() -> None:
+    """通知等待中任務已改變，見 ``ProgressBus.pending_changed``。"""
+    _bus.pending_changed()
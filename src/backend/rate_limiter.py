@@ -0,0 +1,341 @@
+"""頻寬及請求頻率限制模組。
+
+提供進程內共用的令牌桶，分別限制所有下載與上傳的總頻寬，並支援依時段切換限速；
+另提供按主機計算的請求間隔限制，供並行檢查更新及下載冷卻使用。
+"""
+
+from __future__ import annotations
+
+import os
+import signal
+import subprocess
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from . import config
+from .color_print import err_print
+from .schema import BandwidthConfig
+
+# 重新讀取限速設定的間隔（秒），使時段切換和配置變更生效
+_REFRESH_INTERVAL = 30.0
+
+
+class TokenBucket:
+    """線程安全的令牌桶。
+
+    令牌不足時允許透支，透支部分由呼叫端等待償還，使所有使用者的平均速度不超過限速。
+    """
+
+    def __init__(self, rate: float = 0) -> None:
+        """初始化令牌桶。
+
+        Args:
+            rate: 每秒補充的位元組數，小於等於 0 為不限速
+        """
+        self._lock = threading.Lock()
+        self._rate = 0.0
+        self._tokens = 0.0
+        self._last = time.monotonic()
+        self.set_rate(rate)
+
+    @property
+    def rate(self) -> float:
+        """每秒補充的位元組數。"""
+        return self._rate
+
+    def set_rate(self, rate: float) -> None:
+        """修改限速，容量為一秒的流量。
+
+        Args:
+            rate: 每秒補充的位元組數，小於等於 0 為不限速
+        """
+        with self._lock:
+            rate = max(0.0, float(rate))
+            if rate != self._rate:
+                self._rate = rate
+                self._tokens = min(self._tokens, rate)
+
+    def reserve(self, size: int) -> float:
+        """取出令牌，返回需要等待的秒數。
+
+        Args:
+            size: 位元組數
+
+        Returns:
+            等待秒數，不限速時為 0
+        """
+        with self._lock:
+            if self._rate <= 0:
+                return 0.0
+
+            now = time.monotonic()
+            self._tokens = min(
+                self._tokens + (now - self._last) * self._rate, self._rate
+            )
+            self._last = now
+            self._tokens -= size
+            return max(0.0, -self._tokens / self._rate)
+
+    def consume(self, size: int) -> None:
+        """取出令牌，令牌不足時阻塞等待。
+
+        Args:
+            size: 位元組數
+        """
+        wait = self.reserve(size)
+        if wait > 0:
+            time.sleep(wait)
+
+
+def _in_time_range(time_range: str, now: datetime) -> bool:
+    """判斷當前時間是否位於時段內。
+
+    Args:
+        time_range: 時段，格式為 HH:MM-HH:MM，可跨越午夜
+        now: 當前時間
+
+    Returns:
+        是否位於時段內
+    """
+    try:
+        start_str, end_str = time_range.split("-")
+        start = datetime.strptime(start_str.strip(), "%H:%M").time()
+        end = datetime.strptime(end_str.strip(), "%H:%M").time()
+    except ValueError:
+        err_print(0, "頻寬限制", f"時段格式錯誤: {time_range}", status=1, no_sn=True)
+        return False
+
+    current = now.time()
+    if start <= end:
+        return start <= current < end
+    return current >= start or current < end
+
+
+def current_limits(
+    bandwidth: BandwidthConfig, now: datetime | None = None
+) -> tuple[int, int]:
+    """計算當前時段的限速。
+
+    Args:
+        bandwidth: 頻寬限制配置
+        now: 當前時間，預設為現在
+
+    Returns:
+        (下載限速, 上傳限速)，單位 KB/s，0 為不限速
+    """
+    now = now or datetime.now()
+    for schedule in bandwidth.schedules:
+        if _in_time_range(schedule.time, now):
+            return schedule.max_download_speed, schedule.max_upload_speed
+    return bandwidth.max_download_speed, bandwidth.max_upload_speed
+
+
+_download_bucket = TokenBucket()
+_upload_bucket = TokenBucket()
+_last_refresh = 0.0
+_refresh_lock = threading.Lock()
+
+
+def _refresh() -> None:
+    """依配置及當前時段更新限速。"""
+    global _last_refresh
+    with _refresh_lock:
+        now = time.monotonic()
+        if _last_refresh and now - _last_refresh < _REFRESH_INTERVAL:
+            return
+        _last_refresh = now
+
+    download, upload = current_limits(config.get_config().bandwidth)
+    _download_bucket.set_rate(download * 1024)
+    _upload_bucket.set_rate(upload * 1024)
+
+
+def get_download_limiter() -> TokenBucket:
+    """獲取全域下載令牌桶。
+
+    Returns:
+        TokenBucket: 所有下載共用的令牌桶
+    """
+    _refresh()
+    return _download_bucket
+
+
+def get_upload_limiter() -> TokenBucket:
+    """獲取全域上傳令牌桶。
+
+    Returns:
+        TokenBucket: 所有上傳共用的令牌桶
+    """
+    _refresh()
+    return _upload_bucket
+
+
+class HostRateLimiter:
+    """按主機限制請求頻率。
+
+    同一主機相鄰兩次請求的間隔不少於 ``interval`` 秒，多個線程同時請求時依序分配時段，
+    不同主機互不影響。
+    """
+
+    def __init__(self, interval: float = 0) -> None:
+        """初始化限制器。
+
+        Args:
+            interval: 同一主機的最小請求間隔（秒），小於等於 0 為不限制
+        """
+        self._lock = threading.Lock()
+        self._interval = 0.0
+        self._next_slot: dict[str, float] = {}
+        self.set_interval(interval)
+
+    @property
+    def interval(self) -> float:
+        """同一主機的最小請求間隔（秒）。"""
+        return self._interval
+
+    def set_interval(self, interval: float) -> None:
+        """修改請求間隔。
+
+        Args:
+            interval: 同一主機的最小請求間隔（秒），小於等於 0 為不限制
+        """
+        with self._lock:
+            self._interval = max(0.0, float(interval))
+
+    def reserve(self, host: str) -> float:
+        """預約該主機的下一個請求時段，返回需要等待的秒數。
+
+        Args:
+            host: 主機名稱
+
+        Returns:
+            等待秒數，不限制時為 0
+        """
+        with self._lock:
+            if self._interval <= 0:
+                return 0.0
+
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, 0.0))
+            self._next_slot[host] = slot + self._interval
+            return slot - now
+
+    def acquire(self, host: str) -> float:
+        """等待直到可以向該主機發出請求。
+
+        Args:
+            host: 主機名稱
+
+        Returns:
+            實際等待的秒數
+        """
+        wait = self.reserve(host)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+_request_limiter = HostRateLimiter()
+
+
+def get_request_limiter() -> HostRateLimiter:
+    """獲取全域頁面請求限制器。
+
+    請求間隔取自配置 ``parse_sn_cd``，每次獲取時更新。
+
+    Returns:
+        HostRateLimiter: 所有解析請求共用的限制器
+    """
+    _request_limiter.set_interval(config.get_config().parse_sn_cd)
+    return _request_limiter
+
+
+_playback_limiter = HostRateLimiter()
+
+
+def get_playback_limiter() -> HostRateLimiter:
+    """獲取全域播放授權請求限制器（下載冷卻）。
+
+    同一主機相鄰兩集的 token / m3u8 請求至少間隔 ``download_cd`` 秒，每次獲取時更新。
+    冷卻只限制請求頻率，不佔用下載任務的並發數。
+
+    Returns:
+        HostRateLimiter: 所有下載共用的限制器
+    """
+    _playback_limiter.set_interval(config.get_config().download_cd)
+    return _playback_limiter
+
+
+class ProcessThrottle:
+    """限制外部下載進程（FFmpeg）的速度。
+
+    定期以輸出檔案的增長量向下載令牌桶取令牌，需要等待時暫停進程（SIGSTOP），
+    等待結束後恢復（SIGCONT）。不支援暫停進程的平台（Windows）上不做限速。
+    """
+
+    def __init__(
+        self, sn: int | str, process: subprocess.Popen, output_path: str | Path
+    ) -> None:
+        """初始化限速器。
+
+        Args:
+            sn: 影片序號
+            process: 下載進程
+            output_path: 下載進程的輸出檔案
+        """
+        self._sn = sn
+        self._process = process
+        self._output_path = Path(output_path)
+        self._last_pause = 0.0
+
+    def start(self) -> None:
+        """啟動監控線程。"""
+        if not hasattr(signal, "SIGSTOP"):
+            if get_download_limiter().rate > 0:
+                err_print(
+                    self._sn,
+                    "頻寬限制",
+                    "當前平台不支援限制 FFmpeg 下載速度",
+                    display=False,
+                )
+            return
+
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+
+    def paused_within(self, seconds: float) -> bool:
+        """檢查最近是否曾因限速暫停進程。
+
+        Args:
+            seconds: 時間範圍（秒）
+
+        Returns:
+            是否曾暫停
+        """
+        return time.monotonic() - self._last_pause < seconds
+
+    def _run(self) -> None:
+        """監控輸出檔案增長並限速。"""
+        last_size = 0
+        while self._process.poll() is None:
+            time.sleep(0.5)
+            try:
+                size = self._output_path.stat().st_size
+            except OSError:
+                continue
+
+            wait = get_download_limiter().reserve(max(0, size - last_size))
+            last_size = size
+            if wait <= 0:
+                continue
+
+            try:
+                os.kill(self._process.pid, signal.SIGSTOP)
+                self._last_pause = time.monotonic()
+                time.sleep(wait)
+                os.kill(self._process.pid, signal.SIGCONT)
+            except OSError:  # 進程已結束
+                return
+            self._last_pause = time.monotonic()
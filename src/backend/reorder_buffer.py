@@ -0,0 +1,86 @@
+"""分段重組緩衝模組。
+
+分段下載亂序完成，本模組將其按索引重新排序後連續輸出，並限制暫存的記憶體用量。
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+
+
+class ReorderBuffer:
+    """有記憶體上限的分段重組緩衝區。
+
+    接收亂序到達的分段內容，每當下一個期望的索引到達時，立即將連續的分段依序交給
+    輸出函數。緩衝區只在下載線程中使用，不需要加鎖。
+    """
+
+    def __init__(self, write: Callable[[bytes], object], max_bytes: int) -> None:
+        """初始化緩衝區。
+
+        Args:
+            write: 輸出函數，按索引順序接收分段內容
+            max_bytes: 暫存分段的記憶體上限（位元組）
+        """
+        self._write = write
+        self._max_bytes = max(0, max_bytes)
+        self._pending: dict[int, bytes] = {}
+        self._next_index = 0
+        self._seen_bytes = 0
+        self._seen_count = 0
+        self.buffered_bytes = 0
+        self.peak_bytes = 0
+
+    @property
+    def next_index(self) -> int:
+        """下一個等待輸出的分段索引。"""
+        return self._next_index
+
+    def capacity(self, limit: int) -> int:
+        """估算剩餘空間還能容納的分段數。
+
+        以已接收分段的平均大小估算，尚未接收任何分段時返回 ``limit``。
+
+        Args:
+            limit: 返回值上限
+
+        Returns:
+            可再容納的分段數，介於 0 與 ``limit`` 之間
+        """
+        if self._seen_count == 0:
+            return limit
+        average = self._seen_bytes / self._seen_count
+        room = self._max_bytes - self.buffered_bytes
+        return max(0, min(limit, int(room // max(average, 1))))
+
+    def put(self, index: int, data: bytes) -> None:
+        """放入一個分段，並輸出所有已連續的分段。
+
+        Args:
+            index: 分段索引
+            data: 分段內容
+        """
+        if index < self._next_index or index in self._pending:
+            raise ValueError(f"分段重複: index={index}")
+
+        self._seen_bytes += len(data)
+        self._seen_count += 1
+
+        if index != self._next_index:
+            self._pending[index] = data
+            self.buffered_bytes += len(data)
+            self.peak_bytes = max(self.peak_bytes, self.buffered_bytes)
+            return
+
+        self._write(data)
+        self._next_index += 1
+        while self._next_index in self._pending:
+            data = self._pending.pop(self._next_index)
+            self.buffered_bytes -= len(data)
+            self._write(data)
+            self._next_index += 1
+
+    def clear(self) -> None:
+        """丟棄所有暫存分段。"""
+        self._pending.clear()
+        self.buffered_bytes = 0
@@ -0,0 +1,425 @@
+"""任務調度模組。
+
+以優先佇列及固定數量的工作線程執行下載任務，取代每個任務一個線程並阻塞在信號量上的做法。
+調度順序為：優先級（手動任務優先於自動任務）→ sn 由大到小（新上架的劇集優先）→ 加入順序。
+失敗的任務依指數退避延遲後重新排入佇列。任務函數可返回 ``Delay`` 暫停執行（如等待廣告時間），
+等待期間不佔用工作線程，到時優先於未開始的任務繼續執行。
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import threading
+import time
+import traceback
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any
+
+from . import config, events, metrics, progress
+from .color_print import err_print
+
+
+class TaskPriority(IntEnum):
+    """任務優先級，數值越小越優先。"""
+
+    MANUAL = 0  # 命令行或 Web 控制面板下達的任務
+    AUTO = 10  # 檢查更新產生的任務
+
+
+class TaskState:
+    """任務狀態。"""
+
+    PENDING = "pending"  # 等待執行
+    RUNNING = "running"  # 執行中
+    RETRY_WAIT = "retry_wait"  # 失敗後等待重試
+    WAITING = "waiting"  # 任務要求暫停, 不佔用工作線程
+    DONE = "done"  # 成功
+    FAILED = "failed"  # 失敗且不再重試
+    CANCELLED = "cancelled"  # 已取消
+
+
+@dataclass(frozen=True)
+class Delay:
+    """任務函數返回此值表示暫停執行，``seconds`` 秒後再次呼叫，不計入重試次數。"""
+
+    seconds: float
+
+
+@dataclass(eq=False)
+class Task:
+    """調度中的任務。
+
+    ``func`` 以任務本身為參數執行，返回 False 或拋出異常視為失敗，返回 ``Delay`` 為暫停。
+    分階段執行的任務可將中間結果保存在 ``context``。
+    """
+
+    sn: int
+    func: Callable[[Task], bool | Delay | None]
+    priority: int = TaskPriority.AUTO
+    info: dict[str, Any] = field(default_factory=dict)
+    max_retries: int = 0
+    attempts: int = 0
+    state: str = TaskState.PENDING
+    ready_at: float = 0.0
+    suspended: bool = False  # 已開始執行且暫停過, 恢復時優先
+    context: dict[str, Any] = field(default_factory=dict)
+    _finished: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def will_retry(self) -> bool:
+        """本次執行失敗後是否還會重試。"""
+        return self.state != TaskState.CANCELLED and self.attempts < self.max_retries
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """等待任務結束（成功、最終失敗或取消）。
+
+        Args:
+            timeout: 最長等待秒數，None 為一直等待
+
+        Returns:
+            任務是否已結束
+        """
+        return self._finished.wait(timeout)
+
+
+class TaskScheduler:
+    """優先佇列任務調度器。
+
+    同一 sn 同時只會存在一個任務。工作線程在首次提交任務時建立，數量可在運行時調整。
+    """
+
+    def __init__(self, max_workers: int, retry_backoff: float = 10.0) -> None:
+        """初始化調度器。
+
+        Args:
+            max_workers: 工作線程數量
+            retry_backoff: 第一次重試前的等待秒數，之後每次加倍
+        """
+        self._cond = threading.Condition()
+        self._max_workers = max(1, max_workers)
+        self._retry_backoff = max(0.0, retry_backoff)
+        self._workers = 0
+        self._seq = itertools.count()
+        # (優先級, 是否未開始, -sn, 序號, 任務)
+        self._ready: list[tuple[int, int, int, int, Task]] = []
+        self._delayed: list[tuple[float, int, Task]] = []  # (可執行時間, 序號, 任務)
+        self._tasks: dict[int, Task] = {}
+        # 等待中任務的顯示資訊, 佇列改變後首次讀取時重建
+        self._pending_view: dict[str, dict[str, Any]] | None = None
+
+    def set_workers(self, max_workers: int) -> None:
+        """調整工作線程數量，多出的線程在完成手上任務後退出。
+
+        Args:
+            max_workers: 工作線程數量
+        """
+        with self._cond:
+            self._max_workers = max(1, max_workers)
+            self._spawn_workers()
+            self._cond.notify_all()
+
+    def set_retry_backoff(self, retry_backoff: float) -> None:
+        """調整重試退避時間。
+
+        Args:
+            retry_backoff: 第一次重試前的等待秒數，之後每次加倍
+        """
+        with self._cond:
+            self._retry_backoff = max(0.0, retry_backoff)
+
+    def submit(
+        self,
+        sn: int | str,
+        func: Callable[[Task], bool | Delay | None],
+        priority: int = TaskPriority.AUTO,
+        info: dict[str, Any] | None = None,
+        max_retries: int = 0,
+    ) -> Task | None:
+        """提交任務。
+
+        Args:
+            sn: 影片序號
+            func: 任務函數，以任務本身為參數
+            priority: 優先級
+            info: 任務附帶資訊（如 tag、rename、filename、mode），供任務函數及面板使用
+            max_retries: 失敗後最多重試次數
+
+        Returns:
+            新任務；該 sn 已有任務時為 None
+        """
+        sn = int(sn)
+        with self._cond:
+            if sn in self._tasks:
+                return None
+            task = Task(
+                sn=sn,
+                func=func,
+                priority=int(priority),
+                info=dict(info or {}),
+                max_retries=max(0, max_retries),
+            )
+            self._tasks[sn] = task
+            self._push_ready(task)
+            self._spawn_workers()
+            self._cond.notify()
+            return task
+
+    def cancel(self, sn: int | str) -> bool:
+        """取消任務。
+
+        等待中的任務不再執行；執行中的任務會完成本次執行，但失敗後不再重試。
+
+        Args:
+            sn: 影片序號
+
+        Returns:
+            是否存在該任務
+        """
+        with self._cond:
+            task = self._tasks.get(int(sn))
+            if task is None:
+                return False
+            running = task.state == TaskState.RUNNING
+            task.state = TaskState.CANCELLED
+            if not running:
+                # 佇列中的項目在取出時略過
+                self._finish(task)
+                self._pending_changed()
+            return True
+
+    def contains(self, sn: int | str) -> bool:
+        """該 sn 是否有未結束的任務。"""
+        with self._cond:
+            return int(sn) in self._tasks
+
+    def get(self, sn: int | str) -> Task | None:
+        """獲取該 sn 未結束的任務。"""
+        with self._cond:
+            return self._tasks.get(int(sn))
+
+    def pending(self) -> list[Task]:
+        """列出等待中的任務，依預計執行順序排列，等待重試的任務排在最後。
+
+        已開始執行後暫停的任務不在此列。
+
+        Returns:
+            任務列表
+        """
+        with self._cond:
+            return self._pending_locked()
+
+    def pending_view(self) -> dict[str, dict[str, Any]]:
+        """獲取等待中任務的顯示資訊，供 Web 控制面板使用。
+
+        結果在佇列改變前保持不變並重複返回，呼叫者不應修改。
+
+        Returns:
+            {sn: {"filename": 顯示名稱, "position": 佇列位置, "mode": 下載模式}}，
+            依 ``pending()`` 的順序排列
+        """
+        with self._cond:
+            if self._pending_view is None:
+                self._pending_view = {
+                    str(task.sn): {
+                        "filename": task.info.get("filename") or f"SN: {task.sn}",
+                        "position": position,
+                        "mode": task.info.get("mode", "unknown"),
+                    }
+                    for position, task in enumerate(self._pending_locked(), start=1)
+                }
+            return self._pending_view
+
+    def running(self) -> list[Task]:
+        """列出執行中的任務。"""
+        with self._cond:
+            return [
+                task for task in self._tasks.values() if task.state == TaskState.RUNNING
+            ]
+
+    def snapshot(self) -> dict[str, Any]:
+        """獲取調度器狀態摘要。
+
+        Returns:
+            包含 workers、running、pending、retry_wait、waiting 數量的字典
+        """
+        with self._cond:
+            states = [task.state for task in self._tasks.values()]
+            return {
+                "workers": self._max_workers,
+                "running": states.count(TaskState.RUNNING),
+                "pending": states.count(TaskState.PENDING),
+                "retry_wait": states.count(TaskState.RETRY_WAIT),
+                "waiting": states.count(TaskState.WAITING),
+            }
+
+    def _pending_locked(self) -> list[Task]:
+        """列出等待中的任務，見 ``pending()``，需持有鎖。"""
+        ready = [
+            entry[-1]
+            for entry in sorted(self._ready)
+            if entry[-1].state == TaskState.PENDING and not entry[-1].suspended
+        ]
+        delayed = [
+            entry[-1]
+            for entry in sorted(self._delayed)
+            if entry[-1].state == TaskState.RETRY_WAIT
+        ]
+        return ready + delayed
+
+    def _pending_changed(self) -> None:
+        """等待中任務改變時使顯示資訊失效並通知面板，需持有鎖。"""
+        self._pending_view = None
+        progress.pending_changed()
+
+    def _push_ready(self, task: Task) -> None:
+        """將任務放入可執行佇列，需持有鎖。"""
+        task.state = TaskState.PENDING
+        heapq.heappush(
+            self._ready,
+            (task.priority, not task.suspended, -task.sn, next(self._seq), task),
+        )
+        if not task.suspended:
+            self._pending_changed()
+
+    def _finish(self, task: Task) -> None:
+        """將任務移出調度器，需持有鎖。"""
+        if self._tasks.get(task.sn) is task:
+            del self._tasks[task.sn]
+        metrics.TASK_RESULTS.labels(task.state).inc()
+        task._finished.set()
+        self._cond.notify_all()
+
+    def _spawn_workers(self) -> None:
+        """補足工作線程，需持有鎖。"""
+        while self._workers < self._max_workers and self._tasks:
+            self._workers += 1
+            thread = threading.Thread(
+                target=self._worker_loop,
+                name=f"task-worker-{self._workers}",
+                daemon=True,
+            )
+            thread.start()
+
+    def _next_task(self) -> Task | None:
+        """取出下一個可執行的任務，沒有時等待；線程應退出時返回 None。需持有鎖。"""
+        while True:
+            if self._workers > self._max_workers:
+                return None
+
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                task = heapq.heappop(self._delayed)[-1]
+                if task.state in (TaskState.RETRY_WAIT, TaskState.WAITING):
+                    self._push_ready(task)
+
+            while self._ready:
+                task = heapq.heappop(self._ready)[-1]
+                if task.state == TaskState.PENDING:
+                    task.state = TaskState.RUNNING
+                    task.attempts += 1
+                    if not task.suspended:
+                        self._pending_changed()
+                    return task
+
+            timeout = self._delayed[0][0] - now if self._delayed else None
+            self._cond.wait(timeout)
+
+    def _worker_loop(self) -> None:
+        """工作線程主循環。"""
+        while True:
+            with self._cond:
+                task = self._next_task()
+                if task is None:
+                    self._workers -= 1
+                    return
+
+            try:
+                result = task.func(task)
+                succeeded = result is not False and not isinstance(result, Delay)
+            except Exception as e:
+                # 任務內部的異常不應終止工作線程
+                result = None
+                succeeded = False
+                err_print(task.sn, "任務異常", "發生未知錯誤: " + str(e), status=1)
+                err_print(
+                    task.sn,
+                    "任務異常",
+                    "異常詳情:\n" + traceback.format_exc(),
+                    status=1,
+                    display=False,
+                )
+
+            with self._cond:
+                if isinstance(result, Delay) and task.state != TaskState.CANCELLED:
+                    task.attempts -= 1  # 暫停不算一次執行
+                    task.suspended = True
+                    task.state = TaskState.WAITING
+                    task.ready_at = time.monotonic() + max(0.0, result.seconds)
+                    heapq.heappush(
+                        self._delayed, (task.ready_at, next(self._seq), task)
+                    )
+                    self._cond.notify_all()
+                elif succeeded:
+                    task.state = TaskState.DONE
+                    self._finish(task)
+                elif task.will_retry:
+                    delay = self._retry_backoff * 2 ** (task.attempts - 1)
+                    task.suspended = False
+                    task.context.clear()
+                    task.state = TaskState.RETRY_WAIT
+                    task.ready_at = time.monotonic() + delay
+                    heapq.heappush(
+                        self._delayed, (task.ready_at, next(self._seq), task)
+                    )
+                    err_print(
+                        task.sn,
+                        "任務重試",
+                        f"{delay:.0f} 秒後進行第 {task.attempts} 次重試",
+                        display=False,
+                    )
+                    events.emit(
+                        "task_retry", task.sn, attempt=task.attempts, delay=delay
+                    )
+                    self._pending_changed()
+                    self._cond.notify_all()
+                else:
+                    if task.state != TaskState.CANCELLED:
+                        task.state = TaskState.FAILED
+                    self._finish(task)
+
+
+_scheduler: TaskScheduler | None = None
+_scheduler_lock = threading.Lock()
+
+
+def get_task_scheduler() -> TaskScheduler:
+    """獲取全域任務調度器。
+
+    工作線程數為 ``multi_thread``，首次呼叫時建立並登記指標量表。
+
+    Returns:
+        TaskScheduler: 共用調度器
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            settings = config.get_settings()
+            _scheduler = TaskScheduler(
+                settings.multi_thread, config.get_config().task_retry_backoff
+            )
+            _register_metrics(_scheduler)
+        return _scheduler
+
+
+def _register_metrics(scheduler: TaskScheduler) -> None:
+    """登記調度器的佇列深度及工作線程量表，抓取指標時才讀取狀態。"""
+    for state in ("pending", "retry_wait", "waiting"):
+        metrics.TASK_QUEUE_DEPTH.labels(state).set_function(
+            lambda state=state: scheduler.snapshot()[state]
+        )
+    metrics.ACTIVE_WORKERS.labels("download").set_function(
+        lambda: scheduler.snapshot()["running"]
+    )
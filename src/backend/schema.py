@@ -46,6 +46,28 @@ class DashboardConfig:
     username: str = "admin"
     password: str = "admin"
     secret_key: str = ""  # JWT 密鑰（自動生成，用於持久化 token）
+    metrics: bool = False  # 提供 /metrics 運行指標（Prometheus 格式，無需登入）
+
+
+@dataclass
+class BandwidthSchedule:
+    """限速時段。"""
+
+    time: str = "09:00-23:00"  # HH:MM-HH:MM，可跨越午夜
+    max_download_speed: int = 0  # KB/s，0 為不限速
+    max_upload_speed: int = 0  # KB/s，0 為不限速
+
+
+@dataclass
+class BandwidthConfig:
+    """頻寬限制配置。
+
+    限速為所有下載（或上傳）任務共用的總頻寬，時段內以第一個匹配的時段設定為準。
+    """
+
+    max_download_speed: int = 0  # KB/s，0 為不限速
+    max_upload_speed: int = 0  # KB/s，0 為不限速
+    schedules: list[BandwidthSchedule] = field(default_factory=list)
 
 
 @dataclass
@@ -62,6 +84,9 @@ class Config:
     check_frequency: int = 5
     download_cd: int = 60
     parse_sn_cd: int = 5
+    update_check_workers: int = 4
+    update_check_use_mobile_api: bool = False
+    series_cache_ttl: int = 600  # 秒，0 為停用
     download_resolution: str = "1080"
     lock_resolution: bool = False
     only_use_vip: bool = False
@@ -72,9 +97,20 @@ class Config:
     # 多線程配置
     multi_thread: int = 1
     multi_upload: int = 3
+    task_max_retry: int = 3  # 任務失敗後的重試次數
+    task_retry_backoff: int = 10  # 秒，每次重試加倍
+    finalize_workers: int = 1  # 合併分段的並發數
+    finalize_queue_size: int = 4  # 等待合併的影片數上限
+    upload_queue_size: int = 32  # 等待上傳的影片數上限
     segment_download_mode: bool = True
     multi_downloading_segment: int = 2
     segment_max_retry: int = 8
+    stream_decrypt: bool = False
+    segment_buffer_mb: int = 64
+    segment_manifest_expire_hours: int = 72
+    adaptive_segment_concurrency: bool = False
+    segment_concurrency_min: int = 1
+    segment_concurrency_max: int = 8
 
     # 文件名配置
     add_bangumi_name_to_video_filename: bool = True
@@ -96,6 +132,9 @@ class Config:
     upload_to_server: bool = False
     ftp: FTPConfig = field(default_factory=FTPConfig)
 
+    # 頻寬限制配置
+    bandwidth: BandwidthConfig = field(default_factory=BandwidthConfig)
+
     # 用戶命令
     user_command: str = "shutdown -s -t 60"
 
@@ -140,6 +179,7 @@ class Config:
     # 日誌配置
     save_logs: bool = True
     quantity_of_logs: int = 7
+    save_event_log: bool = False  # 另以 JSON Lines 記錄結構化事件，供離線分析
 
     # SN 列表配置 (文本格式，保留原有的注釋和標籤)
     sn_list: str = ""
@@ -0,0 +1,119 @@
+"""分段下載線程池模組。
+
+提供進程內共用的固定大小分段下載線程池，取代每個分段一個線程的做法。
+"""
+
+from __future__ import annotations
+
+import queue
+import threading
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TypeVar
+
+from . import config
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class SegmentWorkerPool:
+    """分段下載線程池。
+
+    所有影片共用同一組工作線程，每個影片透過 ``run`` 提交自己的分段，
+    並以完成佇列接收結果，最後一個分段完成即可立刻返回。
+    """
+
+    def __init__(self, max_workers: int) -> None:
+        """初始化線程池。
+
+        Args:
+            max_workers: 工作線程數量
+        """
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="segment-worker",
+        )
+
+    def run(
+        self,
+        func: Callable[[T], R],
+        items: Iterable[T],
+        max_in_flight: int | Callable[[], int],
+    ) -> Iterator[tuple[T, R | None, BaseException | None]]:
+        """提交一批任務並按完成順序產出結果。
+
+        同一批任務同時進行中的數量不超過 ``max_in_flight``。若呼叫端提前停止迭代
+        （例如某個分段失敗），尚未提交的任務將不再執行。
+
+        ``max_in_flight`` 可為函數，每次補充任務前重新取值，呼叫端可藉此施加背壓。
+        為避免共用線程池死鎖，沒有任務進行中時至少會提交一個。
+
+        Args:
+            func: 處理單個任務的函數
+            items: 任務列表
+            max_in_flight: 本批任務的最大並發數，或返回該值的函數
+
+        Yields:
+            (任務, 結果, 異常)，成功時異常為 None
+        """
+        pending = iter(items)
+        completed: queue.SimpleQueue[tuple[T, Future]] = queue.SimpleQueue()
+        in_flight = 0
+        exhausted = False
+
+        def submit_next() -> bool:
+            nonlocal in_flight, exhausted
+            try:
+                item = next(pending)
+            except StopIteration:
+                exhausted = True
+                return False
+            future = self._executor.submit(func, item)
+            future.add_done_callback(lambda f, i=item: completed.put((i, f)))
+            in_flight += 1
+            return True
+
+        def fill() -> None:
+            while not exhausted:
+                limit = max_in_flight() if callable(max_in_flight) else max_in_flight
+                if in_flight >= max(1, limit):
+                    return
+                submit_next()
+
+        fill()
+        while in_flight > 0:
+            item, future = completed.get()
+            in_flight -= 1
+            exc = future.exception()
+            yield item, (None if exc else future.result()), exc
+            fill()
+
+    def shutdown(self) -> None:
+        """關閉線程池。"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool: SegmentWorkerPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_segment_pool() -> SegmentWorkerPool:
+    """獲取全域分段下載線程池。
+
+    線程數為每個影片的分段並發上限 × ``multi_thread``，首次呼叫時建立。
+
+    Returns:
+        SegmentWorkerPool: 共用線程池
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            settings = config.get_settings()
+            per_video = settings.multi_downloading_segment
+            if settings.adaptive_segment_concurrency:
+                per_video = max(per_video, settings.segment_concurrency_max)
+            _pool = SegmentWorkerPool(per_video * settings.multi_thread)
+        return _pool
+
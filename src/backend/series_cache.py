@@ -0,0 +1,138 @@
+"""番劇資訊快取模組。
+
+在記憶體中保存最近解析過的番劇資訊（番劇名、劇集列表），同一番劇的其他劇集
+可直接由快取建立，無需再次請求及解析頁面。快取項目逾時後失效。
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+
+from . import config
+
+
+@dataclass(frozen=True)
+class SeriesInfo:
+    """一部番劇的解析結果。"""
+
+    bangumi_name: str
+    episode_list: dict[str, int]  # {集數: sn}，與 Anime 的劇集列表相同
+    episode_labels: dict[int, str]  # {sn: 頁面上顯示的集數}
+    titles: dict[int, str]  # {sn: 標題}，僅包含實際解析過的劇集
+    expires: float
+
+    def title_of(self, sn: int) -> str | None:
+        """獲取劇集標題。
+
+        頁面只提供被解析劇集的標題，其他劇集只有集數；特別篇、中文配音等的標題未必是
+        「番劇名 [集數]」，故不自行組成。
+
+        Args:
+            sn: 影片序號
+
+        Returns:
+            標題，未解析過的劇集為 None
+        """
+        return self.titles.get(sn)
+
+
+class SeriesCache:
+    """線程安全的番劇資訊快取，以劇集 sn 為鍵。"""
+
+    def __init__(self, ttl: float = 0) -> None:
+        """初始化快取。
+
+        Args:
+            ttl: 快取有效秒數，小於等於 0 為停用
+        """
+        self._lock = threading.Lock()
+        self._ttl = 0.0
+        self._entries: dict[int, SeriesInfo] = {}
+        self.set_ttl(ttl)
+
+    def set_ttl(self, ttl: float) -> None:
+        """修改快取有效秒數，停用時清空快取。
+
+        Args:
+            ttl: 快取有效秒數，小於等於 0 為停用
+        """
+        with self._lock:
+            self._ttl = max(0.0, float(ttl))
+            if self._ttl <= 0:
+                self._entries.clear()
+
+    def put(
+        self,
+        sn: int,
+        title: str,
+        bangumi_name: str,
+        episode_list: dict[str, int],
+        episode_labels: dict[int, str],
+    ) -> None:
+        """保存一次解析結果，同一番劇的所有劇集共用。
+
+        Args:
+            sn: 被解析的影片序號
+            title: 被解析劇集的標題
+            bangumi_name: 番劇名
+            episode_list: {集數: sn}
+            episode_labels: {sn: 頁面上顯示的集數}
+        """
+        with self._lock:
+            if self._ttl <= 0:
+                return
+
+            now = time.monotonic()
+            previous = self._entries.get(sn)
+            titles = {sn: title}
+            if previous is not None and previous.expires > now:
+                titles = {**previous.titles, sn: title}
+
+            info = SeriesInfo(
+                bangumi_name=bangumi_name,
+                episode_list=dict(episode_list),
+                episode_labels=dict(episode_labels),
+                titles=titles,
+                expires=now + self._ttl,
+            )
+            # 順便清除逾時項目，避免長期運行時快取無限增長
+            self._entries = {
+                key: value for key, value in self._entries.items() if value.expires > now
+            }
+            for episode_sn in info.episode_labels:
+                self._entries[episode_sn] = info
+
+    def get(self, sn: int) -> SeriesInfo | None:
+        """讀取包含該劇集的番劇資訊。
+
+        Args:
+            sn: 影片序號
+
+        Returns:
+            番劇資訊，不存在或已逾時為 None
+        """
+        with self._lock:
+            info = self._entries.get(sn)
+            if info is None:
+                return None
+            if info.expires <= time.monotonic():
+                del self._entries[sn]
+                return None
+            return info
+
+
+_series_cache = SeriesCache()
+
+
+def get_series_cache() -> SeriesCache:
+    """獲取全域番劇資訊快取。
+
+    有效秒數取自配置 ``series_cache_ttl``，每次獲取時更新。
+
+    Returns:
+        SeriesCache: 所有 Anime 實例共用的快取
+    """
+    _series_cache.set_ttl(config.get_config().series_cache_ttl)
+    return _series_cache
@@ -0,0 +1,113 @@
+"""共用 HTTP 傳輸層模組。
+
+提供進程內共用的 httpx 連線池。所有 httpx client 經由 ``create_client`` 建立，
+同一主機（及代理設定）的 TCP/TLS 連線在各影片、各線程之間重用。
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import threading
+import urllib.request
+from typing import Any
+
+import httpx
+
+from .constants import ConnectionPool
+
+# 安裝 h2 時啟用 HTTP/2
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+_pools: dict[tuple[str, str | None], httpx.HTTPTransport] = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(host: str, proxy: str | None) -> httpx.HTTPTransport:
+    """獲取 (主機, 代理) 對應的連線池，不存在時建立。
+
+    Args:
+        host: 目標主機
+        proxy: 代理 URL，None 表示直連
+
+    Returns:
+        共用的 HTTPTransport
+    """
+    key = (host, proxy)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = httpx.HTTPTransport(
+                http2=HTTP2_AVAILABLE,
+                proxy=proxy,
+                limits=httpx.Limits(
+                    max_connections=ConnectionPool.MAX_CONNECTIONS_PER_HOST,
+                    max_keepalive_connections=ConnectionPool.MAX_KEEPALIVE_PER_HOST,
+                    keepalive_expiry=ConnectionPool.KEEPALIVE_EXPIRY,
+                ),
+            )
+            _pools[key] = pool
+        return pool
+
+
+def _resolve_proxy(url: httpx.URL, proxy: str | None) -> str | None:
+    """決定請求使用的代理。
+
+    ``NO_PROXY`` 環境變數中的主機一律直連；其餘主機使用指定代理，
+    未指定時沿用 ``HTTP_PROXY``/``HTTPS_PROXY`` 環境變數。
+
+    Args:
+        url: 請求 URL
+        proxy: 指定的代理 URL
+
+    Returns:
+        代理 URL，None 表示直連
+    """
+    if urllib.request.proxy_bypass_environment(url.host):
+        return None
+    if proxy:
+        return proxy
+    return urllib.request.getproxies_environment().get(url.scheme)
+
+
+class SharedTransport(httpx.BaseTransport):
+    """依主機分派到共用連線池的傳輸層。
+
+    本身不持有連線，關閉 client 時連線池保持開啟供其他 client 重用。
+    """
+
+    def __init__(self, proxy: str | None = None) -> None:
+        """初始化傳輸層。
+
+        Args:
+            proxy: 代理 URL，None 表示依環境變數決定
+        """
+        self._proxy = proxy
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        """轉發請求到對應的連線池。
+
+        Args:
+            request: HTTP 請求
+
+        Returns:
+            HTTP 回應
+        """
+        proxy = _resolve_proxy(request.url, self._proxy)
+        return _get_pool(request.url.host, proxy).handle_request(request)
+
+    def close(self) -> None:
+        """連線池為進程共用，不隨 client 關閉。"""
+
+
+def create_client(proxy: str | None = None, **kwargs: Any) -> httpx.Client:
+    """建立使用共用連線池的 httpx client。
+
+    Args:
+        proxy: 代理 URL，None 表示依環境變數決定
+        **kwargs: 傳給 ``httpx.Client`` 的其他參數
+
+    Returns:
+        httpx.Client
+    """
+    return httpx.Client(transport=SharedTransport(proxy), **kwargs)
+
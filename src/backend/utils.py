@@ -45,6 +45,7 @@ class RetryHandler:
         func: Callable[[], T],
         on_error: Callable[[Exception, int], None] | None = None,
         error_types: tuple[type[Exception], ...] = (Exception,),
+        retry_if: Callable[[Exception], bool] | None = None,
     ) -> T:
         """執行函數並在失敗時重試。
 
@@ -52,6 +53,7 @@ class RetryHandler:
             func: 要執行的函數
             on_error: 錯誤回調函數，接收異常和重試次數
             error_types: 要捕獲的異常類型
+            retry_if: 判斷異常是否值得重試，返回 False 時立即拋出；None 時一律重試
 
         Returns:
             函數執行結果
@@ -68,6 +70,8 @@ class RetryHandler:
                 last_exception = e
                 if attempt >= self.max_retries:
                     raise
+                if retry_if is not None and not retry_if(e):
+                    raise
 
                 if on_error:
                     on_error(e, attempt)
@@ -125,14 +129,22 @@ class ProgressTracker:
         """
         self.current = value
         # 更新全域進度追蹤
-        import config
+        from . import progress
 
-        if int(self.sn) in config.tasks_progress_rate:
-            config.tasks_progress_rate[int(self.sn)]["rate"] = (
-                self.current / self.total * 100
-            )
-            if status:
-                config.tasks_progress_rate[int(self.sn)]["status"] = status
+        fields: dict[str, Any] = {"rate": self.current / self.total * 100}
+        if status:
+            fields["status"] = status
+        progress.update_task(self.sn, **fields)
+
+    def set_info(self, **fields: Any) -> None:
+        """更新進度資訊中的其他欄位。
+
+        Args:
+            **fields: 欄位名稱與值
+        """
+        from . import progress
+
+        progress.update_task(self.sn, **fields)
 
     def increment(self, step: int = 1) -> None:
         """增加進度。
@@ -14,6 +14,8 @@ export class TaskMonitor {
     this.currentActiveTasks = new Set();
     this.currentPendingTasks = new Set();
     this.currentCompletedTasks = new Set();
+    // 伺服器連線時送出完整狀態，之後只送出變化，在此合併為完整狀態
+    this.state = { active: {}, pending: {}, completed: {}, stats: null };
   }
 
   async start() {
@@ -41,9 +43,41 @@ export class TaskMonitor {
     }
   }
 
+  /**
+   * 套用伺服器訊息（完整狀態或增量），返回合併後的完整狀態
+   */
+  applyMessage(message) {
+    if (message.type !== 'delta') {
+      this.state = {
+        active: message.active || {},
+        pending: message.pending || {},
+        completed: message.completed || {},
+        stats: message.stats || null
+      };
+      return this.state;
+    }
+
+    const state = this.state;
+    for (const sn of message.active_removed || []) {
+      delete state.active[sn];
+    }
+    for (const [sn, fields] of Object.entries(message.active || {})) {
+      state.active[sn] = { ...(state.active[sn] || {}), ...fields };
+    }
+    if (message.pending) {
+      state.pending = message.pending;
+    }
+    for (const sn of message.completed_removed || []) {
+      delete state.completed[sn];
+    }
+    Object.assign(state.completed, message.completed || {});
+    state.stats = message.stats || null;
+    return state;
+  }
+
   handleMessage(evt) {
     try {
-      const data = JSON.parse(evt.data);
+      const data = this.applyMessage(JSON.parse(evt.data));
       const noTaskEl = document.getElementById('no_task');
       const panel = document.getElementById('task_info_panel');
 
@@ -120,6 +154,7 @@ export class TaskMonitor {
         </div>
         <div class="flex-1" id="progress${sn}"></div>
       </div>
+      <div class="mt-2 text-xs text-gray-500 dark:text-gray-400 speed-text">${this.formatSpeed(taskData)}</div>
     `;
 
     // 插入到正確位置：執行中任務在前，等待中任務在後
@@ -256,6 +291,13 @@ export class TaskMonitor {
       statusEl.textContent = taskData.status;
     }
 
+    // 更新下載速度與分段並發數
+    const speedEl = taskCard.querySelector('.speed-text');
+    const speedText = this.formatSpeed(taskData);
+    if (speedEl && speedEl.textContent !== speedText) {
+      speedEl.textContent = speedText;
+    }
+
     // 更新進度條（只在進度變化時更新）
     const progressBar = this.progressBars.get(sn);
     if (progressBar) {
@@ -266,6 +308,17 @@ export class TaskMonitor {
     }
   }
 
+  /**
+   * 格式化下載速度與分段並發數（僅分段下載模式提供）
+   */
+  formatSpeed(taskData) {
+    if (taskData.speed === undefined) return '';
+    const speed = taskData.speed >= 1024
+      ? `${(taskData.speed / 1024).toFixed(1)} MB/s`
+      : `${taskData.speed} KB/s`;
+    return `${speed} · 並發分段 ${taskData.segment_window}`;
+  }
+
   /**
    * 更新等待中任務的內容（佇列位置）
    */
@@ -0,0 +1,87 @@
+"""番劇頁面片段解析與完整解析的一致性測試。
+
+``fixtures/series_pages`` 下為保存的 ``animeVideo.php`` 頁面，涵蓋多季、單集及
+標記屬性與預期不同的頁面。
+"""
+
+from pathlib import Path
+
+import pytest
+from bs4 import BeautifulSoup
+
+from src.backend.page_parser import extract_fragments, parse_series_page
+
+FIXTURES = sorted((Path(__file__).parent / "fixtures" / "series_pages").glob("*.html"))
+
+
+def extract(soup: BeautifulSoup) -> dict:
+    """提取 Anime 解析時使用的欄位。"""
+    anime_name = soup.find("div", "anime_name")
+    playing = soup.find("li", "playing")
+    return {
+        "title": anime_name.h1.string if anime_name and anime_name.h1 else None,
+        "playing": playing.a.string if playing and playing.a else None,
+        "episodes": [
+            (a.get("href"), a.string)
+            for season in soup.find_all("section", "season")
+            for a in season.find_all("a")
+        ],
+        "labels": [
+            p.contents[0] if p.contents else None
+            for season in soup.find_all("section", "season")
+            for p in season.find_all("p")
+        ],
+    }
+
+
+@pytest.mark.parametrize("page", FIXTURES, ids=lambda page: page.stem)
+def test_matches_full_parse(page: Path) -> None:
+    content = page.read_bytes()
+    expected = extract(BeautifulSoup(content, "html.parser"))
+    assert extract(parse_series_page(content)) == expected
+
+
+def test_fixtures_cover_expected_pages() -> None:
+    names = {page.stem for page in FIXTURES}
+    assert {"multi_season", "single_episode", "variant_markup"} <= names
+
+
+def test_multi_season_page() -> None:
+    content = (FIXTURES[0].parent / "multi_season.html").read_bytes()
+    result = extract(parse_series_page(content))
+    assert result["title"] == "測試番劇 [3]"
+    assert result["playing"] == "3"
+    assert len(result["episodes"]) == 7
+    assert result["labels"] == ["本篇", "特別篇", "中文配音"]
+
+
+def test_single_episode_page_has_no_season() -> None:
+    content = (FIXTURES[0].parent / "single_episode.html").read_bytes()
+    soup = parse_series_page(content)
+    assert soup.find("div", "anime_name").h1.string == "測試劇場版 [電影]"
+    assert soup.find("section", "season") is None
+
+
+@pytest.mark.parametrize(
+    "markup",
+    [
+        b'<section class="season" data-x="1"><a href="?sn=1">1</a></section>',
+        b'<section id="s" class="season"><a href="?sn=1">1</a></section>',
+        b'<section class="season is-open"><a href="?sn=1">1</a></section>',
+    ],
+)
+def test_season_fragment_allows_other_attributes(markup: bytes) -> None:
+    _, season = extract_fragments(b'<div class="anime_name"><h1>t</h1>' + markup)
+    assert season == markup
+
+
+def test_missing_season_fragment_falls_back_to_full_parse() -> None:
+    # 標題片段切出但劇集列表標記無法識別時，不應遺失劇集列表
+    content = (
+        b'<div class="anime_name"><h1>t</h1></div>'
+        b"<section\nclass='season'><ul><li class=\"playing\">"
+        b'<a href="?sn=2">2</a></li></ul></section>'
+    )
+    assert extract_fragments(content)[1] is None
+    soup = parse_series_page(content)
+    assert soup.find("li", "playing").a.string == "2"